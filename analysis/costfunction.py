@@ -49,6 +49,59 @@ class CostFunction:
         
         raise NotImplementedError
         
+    
+    ###########################################################################
+    # Vectorized version, overload with array operations for speed
+    ###########################################################################
+    
+    #############################
+    def g_batch(self, X , U , t = 0 ):
+        """ 
+        step cost function for N states and inputs
+        
+        X  : array of state vectors   N x n
+        U  : array of input vectors   N x m
+        
+        return dJ : N x 1 array
+        
+        Default implementation loops over g
+        
+        """
+        
+        dJ = np.zeros( X.shape[0] )
+        
+        for i in range( X.shape[0] ):
+            
+            ti = t[i] if np.ndim( t ) > 0 else t
+            
+            dJ[i] = self.g( X[i,:] , U[i,:] , ti )
+            
+        return dJ
+    
+    
+    #############################
+    def h_batch(self, X , t = 0 ):
+        """ 
+        final cost function for N states
+        
+        X  : array of state vectors   N x n
+        
+        return J : N x 1 array
+        
+        Default implementation loops over h
+        
+        """
+        
+        J = np.zeros( X.shape[0] )
+        
+        for i in range( X.shape[0] ):
+            
+            ti = t[i] if np.ndim( t ) > 0 else t
+            
+            J[i] = self.h( X[i,:] , ti )
+            
+        return J
+        
 
 #############################################################################
      
@@ -90,6 +143,13 @@ class QuadraticCostFunction( CostFunction ):
         return 0
     
     
+    #############################
+    def h_batch(self, X , t = 0 ):
+        """ Vectorized final cost function with zero value """
+        
+        return np.zeros( X.shape[0] )
+    
+    
     #############################
     def g(self, x , u , t = 0 ):
         """ Quadratic additive cost """
@@ -111,6 +171,27 @@ class QuadraticCostFunction( CostFunction ):
         
         return dJ
     
+    
+    #############################
+    def g_batch(self, X , U , t = 0 ):
+        """ Vectorized quadratic additive cost """
+        
+        Y = self.sys.h_batch( X , U , t )
+        
+        dX = X - self.xbar
+        dU = U - self.ubar
+        dY = Y - self.ybar
+        
+        dJ = ( np.einsum( 'ij,jk,ik->i' , dX , self.Q , dX ) +
+               np.einsum( 'ij,jk,ik->i' , dU , self.R , dU ) +
+               np.einsum( 'ij,jk,ik->i' , dY , self.V , dY ) )
+        
+        # set cost to zero if on target
+        if self.ontarget_check:
+            dJ[ np.linalg.norm( dX , axis = 1 ) < self.EPS ] = 0
+        
+        return dJ
+    
 
 ##############################################################################
 
@@ -145,6 +226,13 @@ class TimeCostFunction( CostFunction ):
         return 0
     
     
+    #############################
+    def h_batch(self, X , t = 0 ):
+        """ Vectorized final cost function with zero value """
+        
+        return np.zeros( X.shape[0] )
+    
+    
     #############################
     def g(self, x , u , t = 0 ):
         """ Unity """
@@ -157,6 +245,19 @@ class TimeCostFunction( CostFunction ):
                 dJ = 0
                 
         return dJ
+    
+    
+    #############################
+    def g_batch(self, X , U , t = 0 ):
+        """ Vectorized unity """
+        
+        dJ = np.ones( X.shape[0] )
+        
+        if self.ontarget_check:
+            dX = X - self.xbar
+            dJ[ np.linalg.norm( dX , axis = 1 ) < self.EPS ] = 0
+                
+        return dJ
 
 '''
 #################################################################
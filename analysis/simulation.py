@@ -10,6 +10,9 @@ import matplotlib
 import matplotlib.pyplot as plt
 
 from scipy.integrate import odeint
+from scipy.integrate import cumulative_trapezoid
+from scipy.integrate import OdeSolution
+from scipy.integrate import RK23, RK45, DOP853, Radau, BDF, LSODA
 
 # Embed font type in PDF
 matplotlib.rcParams['pdf.fonttype'] = 42
@@ -20,6 +23,329 @@ from pyro.analysis import costfunction
 from pyro.analysis import phaseanalysis
 
        
+###############################################################################
+# Solvers
+###############################################################################
+# solver( sim , t , x_sol ) integrates sim.cds from x_sol[0] at times t and
+# fills the preallocated rows x_sol[1:], return a dict of integration 
+# statistics
+###############################################################################
+
+def ode_solver( sim , t , x_sol ):
+    """ LSODA through scipy odeint """
+    
+    # Jacobian of the system instead of internal finite differences
+    Dfun = sim.cds.fbar_jacobian if sim.use_jacobian else None
+    
+    x_sol[:,:] , info = odeint( sim.cds.fbar , x_sol[0].copy() , t , 
+                                Dfun = Dfun , rtol = sim.rtol , 
+                                atol = sim.atol , full_output = True )
+    
+    stats = { 'nfev'     : int( info['nfe'][-1] ) ,
+              'njev'     : int( info['nje'][-1] ) ,
+              'steps'    : int( info['nst'][-1] ) ,
+              'rejected' : None }
+    
+    return stats
+
+
+###############################################################################
+def euler_solver( sim , t , x_sol ):
+    """ Explicit Euler, one step per time point """
+    
+    u  = sim.cds.ubar
+    dt = sim.dt
+    
+    for i in range( t.size - 1 ):
+        
+        # x[i+1] = x[i] + f * dt , written in place
+        np.multiply( sim.cds.f( x_sol[i] , u , t[i] ) , dt , out = x_sol[i+1] )
+        x_sol[i+1] += x_sol[i]
+        
+    stats = { 'nfev' : t.size - 1 , 'njev' : 0 , 'steps' : t.size - 1 , 
+              'rejected' : 0 }
+    
+    return stats
+
+
+###############################################################################
+def rk4_solver( sim , t , x_sol ):
+    """ Classical Runge-Kutta, one step per time point """
+    
+    f  = sim.cds.f
+    u  = sim.cds.ubar
+    dt = sim.dt
+    
+    # Stage state buffer
+    xs = np.zeros( sim.cds.n )
+    
+    for i in range( t.size - 1 ):
+        
+        x  = x_sol[i]
+        ti = t[i]
+        
+        k1 = f( x , u , ti )
+        
+        np.multiply( k1 , 0.5 * dt , out = xs ) ; xs += x
+        k2 = f( xs , u , ti + 0.5 * dt )
+        
+        np.multiply( k2 , 0.5 * dt , out = xs ) ; xs += x
+        k3 = f( xs , u , ti + 0.5 * dt )
+        
+        np.multiply( k3 , dt , out = xs ) ; xs += x
+        k4 = f( xs , u , ti + dt )
+        
+        # x[i+1] = x + ( k1 + 2 k2 + 2 k3 + k4 ) * dt / 6 , written in place
+        x_next = x_sol[i+1]
+        np.add( k2 , k3 , out = x_next )
+        x_next *= 2
+        x_next += k1
+        x_next += k4
+        x_next *= dt / 6
+        x_next += x
+        
+    stats = { 'nfev' : 4 * ( t.size - 1 ) , 'njev' : 0 , 'steps' : t.size - 1 , 
+              'rejected' : 0 }
+    
+    return stats
+
+
+###############################################################################
+def symplectic_solver( sim , t , x_sol ):
+    """ 
+    Semi-implicit ( symplectic ) Euler for mechanical systems x = [ q , dq ]
+    -------------------------------------------------------------------------
+    dq[i+1] = dq[i] + ddq( q[i] , dq[i] ) * dt
+    q[i+1]  = q[i]  + dq[i+1] * dt
+    
+    """
+    
+    # Mechanical system, or closed-loop system of a mechanical system
+    if hasattr( sim.cds , 'dof' ):
+        dof = sim.cds.dof
+    elif hasattr( sim.cds , 'sys' ) and hasattr( sim.cds.sys , 'dof' ):
+        dof = sim.cds.sys.dof
+    else:
+        raise ValueError('symplectic solver requires a MechanicalSystem')
+    
+    u  = sim.cds.ubar
+    dt = sim.dt
+    
+    for i in range( t.size - 1 ):
+        
+        x      = x_sol[i]
+        x_next = x_sol[i+1]
+        
+        ddq = sim.cds.f( x , u , t[i] )[ dof : ]
+        
+        np.multiply( ddq , dt , out = x_next[ dof : ] )
+        x_next[ dof : ] += x[ dof : ]
+        
+        np.multiply( x_next[ dof : ] , dt , out = x_next[ : dof ] )
+        x_next[ : dof ] += x[ : dof ]
+        
+    stats = { 'nfev' : t.size - 1 , 'njev' : 0 , 'steps' : t.size - 1 , 
+              'rejected' : 0 }
+    
+    return stats
+
+
+###############################################################################
+ivp_methods = { 'RK23'   : RK23   , 
+                'RK45'   : RK45   , 
+                'DOP853' : DOP853 , 
+                'Radau'  : Radau  , 
+                'BDF'    : BDF    , 
+                'LSODA'  : LSODA  }
+
+# Methods using a jacobian of the dynamics
+ivp_implicit_methods = ( 'Radau' , 'BDF' , 'LSODA' )
+
+
+###############################################################################
+def ivp_solver( method ):
+    """ 
+    Solver using a scipy.integrate.solve_ivp method ( 'RK45', 'DOP853', 
+    'RK23', 'Radau', 'BDF', 'LSODA' ) with dense output evaluated at t
+    
+    Implicit methods use the jacobian of the system, see use_jacobian
+    
+    """
+    
+    def solver( sim , t , x_sol ):
+        
+        nfev = [ 0 ]
+        
+        def fun( t , x ):
+            nfev[0] = nfev[0] + 1
+            return sim.cds.fbar( x , t )
+        
+        options = {}
+        
+        if sim.rtol is not None:
+            options['rtol'] = sim.rtol
+        if sim.atol is not None:
+            options['atol'] = sim.atol
+        if sim.use_jacobian and method in ivp_implicit_methods:
+            options['jac'] = lambda t , x : sim.cds.fbar_jacobian( x , t )
+        
+        ode = ivp_methods[ method ]( fun , t[0] , x_sol[0].copy() , t[-1] , **options )
+        
+        stages = getattr( ode , 'n_stages' , None )
+        
+        # Explicit Runge-Kutta: n_stages evaluations per attempted step
+        explicit = method in ( 'RK23' , 'RK45' , 'DOP853' )
+        
+        ts           = [ t[0] ]
+        interpolants = []
+        rejected     = 0
+        
+        while ode.status == 'running':
+            
+            before = nfev[0]
+            
+            message = ode.step()
+            
+            if ode.status == 'failed':
+                raise RuntimeError('Simulation solver failed: ' + str( message ) )
+            
+            if explicit:
+                rejected = rejected + ( nfev[0] - before ) // stages - 1
+            
+            ts.append( ode.t )
+            interpolants.append( ode.dense_output() )
+            
+        sim.dense_output = OdeSolution( ts , interpolants )
+        
+        x_sol[1:,:] = sim.dense_output( t[1:] ).T
+        
+        stats = { 'nfev'     : nfev[0] ,
+                  'njev'     : ode.njev ,
+                  'steps'    : len( ts ) - 1 ,
+                  'rejected' : rejected if explicit else None }
+        
+        return stats
+    
+    return solver
+
+
+###############################################################################
+solvers = { 'ode'        : ode_solver ,
+            'euler'      : euler_solver ,
+            'rk4'        : rk4_solver ,
+            'symplectic' : symplectic_solver }
+
+for method in ivp_methods:
+    solvers[ method ] = ivp_solver( method )
+
+
+###############################################################################
+def register_solver( name , solver ):
+    """ Add a solver( sim , t , x_sol ) usable as Simulation( solver = name ) """
+    
+    solvers[ name ] = solver
+    
+    
+###############################################################################
+# Events
+###############################################################################
+
+class Event:
+    """ 
+    Event of a simulation, occurs when g( t , x ) crosses zero
+    -----------------------------------------------------------
+    g         : event function g( t , x ) -> float
+    g_batch   : optional vectorized g( T , X ) -> N array
+    terminal  : stop the simulation at the event
+    direction : 0 = all crossings, 1 = from g < 0 to g > 0 , 
+               -1 = from g > 0 to g < 0
+    
+    """
+    ############################
+    def __init__(self, g , terminal = True , direction = 0 , name = 'event' ,
+                 g_batch = None ):
+        
+        self.g         = g
+        self.g_batch   = g_batch
+        self.terminal  = terminal
+        self.direction = direction
+        self.name      = name
+        
+        
+    ############################
+    def values(self, t , X ):
+        """ g at times t ( N ) and states X ( N x n ) """
+        
+        if self.g_batch is not None:
+            return np.asarray( self.g_batch( t , X ) , dtype = float )
+        
+        return np.array([ self.g( t[i] , X[i] ) for i in range( t.size ) ] , 
+                        dtype = float )
+    
+    
+    ############################
+    def crossings(self, g ):
+        """ Index i of crossings between g[i] and g[i+1] """
+        
+        up   = ( g[:-1] < 0 ) & ( g[1:] >= 0 )
+        down = ( g[:-1] > 0 ) & ( g[1:] <= 0 )
+        
+        if self.direction > 0:
+            crossing = up
+        elif self.direction < 0:
+            crossing = down
+        else:
+            crossing = up | down
+            
+        return np.nonzero( crossing )[0]
+    
+    
+###############################################################################
+def goal_event( xbar , radius = 0.1 , terminal = True ):
+    """ Distance to xbar gets below radius """
+    
+    xbar = np.asarray( xbar , dtype = float )
+    
+    g       = lambda t , x : np.linalg.norm( x - xbar ) - radius
+    g_batch = lambda t , X : np.linalg.norm( X - xbar , axis = 1 ) - radius
+    
+    return Event( g , terminal , -1 , 'goal reached' , g_batch )
+
+
+###############################################################################
+def domain_event( x_lb , x_ub , terminal = True ):
+    """ State gets outside [ x_lb , x_ub ] """
+    
+    g       = lambda t , x : np.min( np.minimum( x - x_lb , x_ub - x ) )
+    g_batch = lambda t , X : np.min( np.minimum( X - x_lb , x_ub - X ) , axis = 1 )
+    
+    return Event( g , terminal , -1 , 'domain exit' , g_batch )
+
+
+###############################################################################
+def predicate_event( predicate , predicate_batch = None , terminal = True , 
+                     name = 'predicate' ):
+    """ Boolean predicate( t , x ) becomes True """
+    
+    g = lambda t , x : 1. if predicate( t , x ) else -1.
+    
+    if predicate_batch is None:
+        g_batch = None
+    else:
+        g_batch = lambda t , X : np.where( predicate_batch( t , X ) , 1. , -1. )
+    
+    return Event( g , terminal , 1 , name , g_batch )
+
+
+###############################################################################
+def invalid_state_event( sys , terminal = True ):
+    """ sys.isavalidstate( x ) becomes False """
+    
+    return predicate_event( lambda t , x : not sys.isavalidstate( x ) ,
+                            lambda t , X : ~ sys.isavalidstate_batch( X ) ,
+                            terminal , 'invalid state' )
+    
+    
 ##################################################################### #####
 # Simulation Objects
 ##########################################################################
@@ -31,7 +357,15 @@ class Simulation:
     ContinuousDynamicSystem : Instance of ContinuousDynamicSystem
     tf : final time
     n  : number of points
-    solver : 'ode' or 'euler'
+    solver : 'ode' ( odeint ), 'euler', 'rk4', 'symplectic' ( mechanical
+             systems ), solve_ivp methods 'RK45', 'DOP853', 'RK23', 'Radau', 
+             'BDF', 'LSODA' or any registered solver, see register_solver
+    --------------------------------------------------------
+    solver_stats : integration statistics of the last compute()
+                   ( nfev , njev , steps , rejected )
+    events       : list of Event, terminal events stop the simulation and
+                   truncate the results at the event time, all detected 
+                   events are listed in event_log
     """
     ############################
     def __init__(self, ContinuousDynamicSystem, tf=10, n=10001, solver='ode'):
@@ -44,6 +378,19 @@ class Simulation:
         self.x0 = np.zeros( self.cds.n )
         self.solver = solver
         
+        # Solver tolerances ( None = solver default )
+        self.rtol = None
+        self.atol = None
+        
+        # Jacobian of the system ( cds.jacobian_x ) given to implicit 
+        # solvers 'ode', 'Radau', 'BDF' and 'LSODA'
+        self.use_jacobian = True
+        
+        # Events ( see Event ), checked every event_chunk time points
+        self.events      = []
+        self.event_chunk = 100
+        self.event_tol   = 1E-6  # time resolution of zero-crossings
+        
         # Ploting
         self.fontsize = 5
         self.figsize  = (4,3)
@@ -62,69 +409,181 @@ class Simulation:
         
         self.J  = 0
         
-        if self.solver == 'ode':
+        if not self.solver in solvers:
+            raise ValueError('Unknown solver: ' + str( self.solver ) +
+                             ', available solvers: ' + str( list( solvers ) ) )
         
-            self.x_sol = odeint( self.cds.fbar , self.x0 , self.t)   
-
-            # Compute inputs-output values
-            self.y_sol = np.zeros(( self.n , self.cds.p ))  
-            self.u_sol = np.zeros((self.n,self.cds.m))
+        # Preallocated solution, filled by the solver
+        self.x_sol = np.zeros(( self.n , self.cds.n ))
+        
+        self.x_sol[0,:] = self.x0
+        
+        self.event_log    = []  # ( name , time , state ) of detected events
+        self.solver_stats = None
+        
+        # Sampled-data closed-loop system: one segment per controller sample
+        period = getattr( self.cds , 'sampling_period' , None )
+        
+        if period is not None:
+            chunk = max( int( round( period / self.dt ) ) , 1 )
+            self.u_hold_sol = np.zeros(( self.n , self.cds.sys.m ))
+        elif self.events:
+            chunk = max( int( self.event_chunk ) , 1 )
+        else:
+            # Without events, a single segment
+            chunk = self.n - 1
+        
+        start = 0
+        
+        try:
+        
+            while start < self.n - 1:
+                
+                end = min( start + chunk , self.n - 1 )
+                
+                # Controller sample, held until the end of the segment
+                if period is not None:
+                    u = self.cds.sample( self.x_sol[ start ] , self.cds.ubar , 
+                                         self.t[ start ] )
+                    self.u_hold_sol[ start : ] = u
+                
+                stats = solvers[ self.solver ]( self , self.t[ start : end + 1 ] , 
+                                                self.x_sol[ start : end + 1 ] )
+                
+                self.add_solver_stats( stats )
+                
+                if self.detect_events( start , end ):
+                    break
+                
+                start = end
+                
+        finally:
             
-            for i in range(self.n):
-
-                x = self.x_sol[i,:]  
-                u = self.cds.ubar
-                t = self.t[i]
+            # Continuous controller outside of the simulation
+            if period is not None:
+                self.cds.u_hold = None
+                self.u_hold_sol = self.u_hold_sol[ : self.t.size ]
+        
+        # Compute inputs-output values of all time steps at once
+        self.u_sol = np.tile( self.cds.ubar , ( self.t.size , 1 ) ).astype( float )
+        self.y_sol = self.cds.h_batch( self.x_sol , self.u_sol , self.t )
                 
-                self.y_sol[i,:] = self.cds.h( x , u , t )
-                self.u_sol[i,:] = u
                 
-        elif self.solver == 'euler':
+    ##############################
+    def add_solver_stats(self, stats ):
+        """ Accumulate integration statistics of all segments """
+        
+        if self.solver_stats is None:
+            self.solver_stats = dict( stats )
+            return
+        
+        for key , value in stats.items():
             
-            self.x_sol = np.zeros((self.n,self.cds.n))
-            self.u_sol = np.zeros((self.n,self.cds.m))
-            self.y_sol = np.zeros((self.n,self.cds.p))
+            if value is None or self.solver_stats.get( key ) is None:
+                self.solver_stats[ key ] = None
+            else:
+                self.solver_stats[ key ] = self.solver_stats[ key ] + value
+                
+                
+    ##############################
+    def detect_events(self, start , end ):
+        """ 
+        Check events on time points start to end
+        ------------------------------------------
+        Crossings are localized by bisection and logged, at the first 
+        terminal event the solution is truncated at the event time.
+        
+        return True if the simulation must stop
+        
+        """
+        
+        t = self.t[ start : end + 1 ]
+        X = self.x_sol[ start : end + 1 ]
+        
+        found = []
+        
+        for event in self.events:
+            
+            g = event.values( t , X )
+            
+            for i in event.crossings( g ):
+                
+                t_e , x_e = self.localize_event( event , start + i )
+                
+                found.append( ( t_e , event , x_e , start + i ) )
+                
+        # Chronological order
+        found.sort( key = lambda e : e[0] )
+        
+        for t_e , event , x_e , i in found:
             
-            # Initial State    
-            self.x_sol[0,:] = self.x0
+            self.event_log.append( ( event.name , t_e , x_e ) )
             
-            for i in range(self.n):
+            if event.terminal:
                 
-                x = self.x_sol[i,:]
-                u = self.cds.ubar
-                t = self.t[i]
+                # Truncated results, last point is the event
+                self.x_sol = np.vstack( [ self.x_sol[ : i + 1 ] , x_e ] )
+                self.t     = np.append( self.t[ : i + 1 ] , t_e )
                 
-                if i+1<self.n:
-                    self.x_sol[i+1,:] = self.cds.f( x , u , t ) * self.dt + x
+                return True
+            
+        return False
+        
+        
+    ##############################
+    def localize_event(self, event , i ):
+        """ Time and state of a crossing between time points i and i+1 """
+        
+        x0 = self.x_sol[ i ]
+        t0 = self.t[ i ]
+        
+        g0 = event.g( t0 , x0 )
+        
+        lo , hi = 0. , self.t[ i + 1 ] - t0
+        x_hi    = self.x_sol[ i + 1 ]
+        
+        # Bisection, states in the interval from x0 with one RK4 step
+        while hi - lo > self.event_tol :
+            
+            mid   = 0.5 * ( lo + hi )
+            x_mid = self.rk4_step( x0 , t0 , mid )
+            
+            if np.sign( event.g( t0 + mid , x_mid ) ) == np.sign( g0 ):
+                lo = mid
+            else:
+                hi , x_hi = mid , x_mid
                 
-                self.y_sol[i,:] = self.cds.h( x , u , t )
-                self.u_sol[i,:] = u
+        return t0 + hi , x_hi
+    
+    
+    ##############################
+    def rk4_step(self, x , t , dt ):
+        """ One RK4 step of the default input dynamic """
+        
+        k1 = self.cds.fbar( x , t )
+        k2 = self.cds.fbar( x + 0.5 * dt * k1 , t + 0.5 * dt )
+        k3 = self.cds.fbar( x + 0.5 * dt * k2 , t + 0.5 * dt )
+        k4 = self.cds.fbar( x + dt * k3 , t + dt )
+        
+        return x + ( k1 + 2 * k2 + 2 * k3 + k4 ) * dt / 6
                 
                 
     ##############################
     def compute_cost(self):
         """ Integrate cost trought time """
         
-        self.J      = 0  # cost integral
-        self.dJ_sol = np.zeros((self.n,1))
-        self.J_sol  = np.zeros((self.n,1))
+        # Step cost of all time steps at once
+        dJ = self.cf.g_batch( self.x_sol , self.u_sol , self.t )
         
-        for i in range(self.n):
-
-            x = self.x_sol[i,:]  
-            u = self.u_sol[i,:] 
-            y = self.y_sol[i,:] 
-            t = self.t[i]
-            
-            dJ = self.cf.g(x, u, t)
-            self.J  = dJ * self.dt + self.J
-            
-            self.dJ_sol[i] = dJ
-            self.J_sol[i]  = self.J
+        # Cumulative trapezoidal integration
+        J = cumulative_trapezoid( dJ , self.t , initial = 0 )
         
         # Final cost
-        self.J = self.cf.h(x, t) + self.J
-        self.J_sol[-1] = self.J
+        J[-1] = J[-1] + self.cf.h( self.x_sol[-1,:] , self.t[-1] )
+        
+        self.J      = J[-1]
+        self.dJ_sol = dJ.reshape( -1 , 1 )
+        self.J_sol  = J.reshape( -1 , 1 )
        
         
     ###########################################################################
@@ -289,7 +748,7 @@ class CLosedLoopSimulation( Simulation ):
     CLSystem  : Instance of ClosedLoopSystem
     tf : final time
     n  : number if point
-    solver : 'ode' or 'euler'
+    solver : see Simulation
     --------------------------------------------------------
     Use this class instead of Simulation() in order to access
     internal control inputs
@@ -318,16 +777,16 @@ class CLosedLoopSimulation( Simulation ):
         """ Compute internal control signal of the closed-loop system """
         
         self.r_sol = self.u_sol.copy() # reference is input of combined sys
-        self.u_sol = np.zeros((self.n,self.sys.m))
         
-        # Compute internal input signal
-        for i in range(self.n):
+        if self.cds.sampling_period is not None:
+            
+            # Sampled-data controller: held outputs
+            self.u_sol = self.u_hold_sol.copy()
             
-            r = self.r_sol[i,:] 
-            y = self.y_sol[i,:] 
-            t = self.t[i]
+        else:
             
-            self.u_sol[i,:] = self.ctl.c( y , r , t )
+            # Compute internal input signal of all time steps at once
+            self.u_sol = self.ctl.c_batch( self.y_sol , self.r_sol , self.t )
             
             
     ###########################################################################
@@ -363,6 +822,212 @@ class CLosedLoopSimulation( Simulation ):
             
     
 
+###############################################################################
+# Ensemble Simulation
+###############################################################################
+    
+class EnsembleSimulation:
+    """ 
+    Simulation of K initial states of a ContinuousDynamicalSystem at once
+    ----------------------------------------------------------------------
+    ContinuousDynamicSystem : Instance of ContinuousDynamicSystem
+    x0 : initial states  K x n
+    tf : final time
+    n  : number of points
+    --------------------------------------------------------
+    All runs are integrated together with cds.x_next_batch, using the 
+    integration_method of the system ( 'euler', 'midpoint', 'rk4' fixed 
+    steps, or 'adaptive' with sub-steps shared by all runs ), with 
+    substeps integration steps between two points.
+    
+    params : optional per-run parameters { 'attribute name' : K array },
+             cds attributes are replaced by these arrays during the
+             integration, and by the same arrays repeated for each time
+             step when outputs and costs of all runs are evaluated at 
+             once ( f_batch and h_batch must use element-wise operations )
+    
+    Results x_sol , y_sol , u_sol are K x T x ( n , p or m ) arrays, with
+    T = n time points
+    
+    """
+    ############################
+    def __init__(self, ContinuousDynamicSystem , x0 , tf = 10 , n = 1001 , 
+                 params = None ):
+        
+        self.cds = ContinuousDynamicSystem
+        self.x0  = np.atleast_2d( np.asarray( x0 , dtype = float ) )
+        self.K   = self.x0.shape[0]
+        self.t0  = 0
+        self.tf  = tf
+        self.n   = int(n)
+        
+        self.substeps = 1
+        
+        # Per-run parameters
+        if params is None:
+            params = {}
+            
+        self.params = params
+        
+        # Ploting
+        self.fontsize = 5
+        self.figsize  = (4,3)
+        self.dpi      = 300
+        
+        # Cost computing
+        self.cf = costfunction.QuadraticCostFunction( ContinuousDynamicSystem )
+        
+        
+    ##############################
+    def set_params(self, params ):
+        """ Replace cds attributes, return the previous values """
+        
+        previous = {}
+        
+        for name , value in params.items():
+            
+            previous[ name ] = getattr( self.cds , name )
+            
+            setattr( self.cds , name , value )
+            
+        return previous
+    
+    
+    ##############################
+    def row_params(self, rows ):
+        """ Per-run parameters repeated for rows = T rows of each run """
+        
+        return { name : np.repeat( np.asarray( value ) , rows , axis = 0 )
+                 for name , value in self.params.items() }
+    
+    
+    ##############################
+    def all_rows(self):
+        """ States, inputs and times of all runs and time steps ( K*T rows ) """
+        
+        X_all = self.x_sol.reshape( -1 , self.cds.n )
+        U_all = self.u_sol.reshape( -1 , self.cds.m )
+        t_all = np.tile( self.t , self.K )
+        
+        return X_all , U_all , t_all
+    
+    
+    ##############################
+    def compute(self):
+        """ Integrate all runs trought time """
+        
+        self.t  = np.linspace( self.t0 , self.tf , self.n )
+        self.dt = ( self.tf + 0.0 - self.t0 ) / ( self.n - 1 )
+        
+        dt = self.dt / self.substeps
+        
+        self.x_sol = np.zeros(( self.K , self.n , self.cds.n ))
+        self.u_sol = np.zeros(( self.K , self.n , self.cds.m ))
+        
+        # Constant open-loop inputs
+        U = np.tile( self.cds.ubar , ( self.K , 1 ) )
+        
+        self.u_sol[:,:,:] = self.cds.ubar
+        
+        X = self.x0.copy()
+        
+        self.x_sol[:,0,:] = X
+        
+        previous = self.set_params( self.params )
+        
+        try:
+            
+            for i in range( self.n - 1 ):
+                
+                X = self.cds.x_next_batch( X , U , self.t[i] , dt , self.substeps )
+                
+                self.x_sol[:,i+1,:] = X
+                
+        finally:
+            
+            self.set_params( previous )
+            
+        # Outputs of all runs and time steps at once, parameters per row
+        X_all , U_all , t_all = self.all_rows()
+        
+        previous = self.set_params( self.row_params( self.n ) )
+        
+        try:
+            
+            self.y_sol = self.cds.h_batch( X_all , U_all , t_all ).reshape( self.K , self.n , -1 )
+            
+        finally:
+            
+            self.set_params( previous )
+            
+            
+    ##############################
+    def compute_cost(self):
+        """ 
+        Integrated cost of all runs, J is a K array and J_sol , dJ_sol 
+        are K x T arrays
+        
+        """
+        
+        X_all , U_all , t_all = self.all_rows()
+        
+        previous = self.set_params( self.row_params( self.n ) )
+        
+        try:
+            
+            # Step cost of all runs and time steps at once
+            self.dJ_sol = self.cf.g_batch( X_all , U_all , t_all ).reshape( self.K , self.n )
+            
+        finally:
+            
+            self.set_params( previous )
+            
+        # Cumulative trapezoidal integration along time
+        self.J_sol = cumulative_trapezoid( self.dJ_sol , self.t , axis = 1 , initial = 0 )
+        
+        # Final cost of all runs
+        previous = self.set_params( self.params )
+        
+        try:
+            
+            self.J_sol[:,-1] = self.J_sol[:,-1] + self.cf.h_batch( self.x_sol[:,-1,:] , self.t[-1] )
+            
+        finally:
+            
+            self.set_params( previous )
+            
+        self.J = self.J_sol[:,-1].copy()
+            
+        return self.J
+    
+    
+    ###########################################################################
+    def plot(self, i = 0 , show = True ):
+        """ Trajectories of state i for all runs """
+        
+        simfig = plt.figure( figsize = self.figsize , dpi = self.dpi , 
+                             frameon = True )
+        
+        ax = simfig.add_subplot(111)
+        
+        ax.plot( self.t , self.x_sol[:,:,i].T , 'b' , alpha = 0.3 , linewidth = 0.5 )
+        
+        ax.set_ylabel( self.cds.state_label[i] + '\n' + 
+                       self.cds.state_units[i] , fontsize = self.fontsize )
+        ax.set_xlabel('Time [sec]', fontsize = self.fontsize )
+        ax.grid(True)
+        ax.tick_params( labelsize = self.fontsize )
+        
+        simfig.tight_layout()
+        
+        if show:
+            simfig.show()
+        
+        self.fig = simfig
+        self.ax  = ax
+            
+            
+            
 '''
 #################################################################
 ##################          Main                         ########
@@ -84,6 +84,41 @@ class StaticController:
         return u
     
     
+    #########################################################################
+    # Vectorized version, overload with array operations for speed
+    #########################################################################
+    
+    #############################
+    def c_batch( self , Y , R , t = 0 ):
+        """ 
+        Batched feedback static computation U = c( Y , R , t )
+        
+        INPUTS
+        Y  : array of sensor signal vectors     N x p
+        R  : array of reference signal vectors  N x k
+        t  : time                               1 x 1 or N x 1
+        
+        OUPUTS
+        U  : array of control inputs vectors    N x m
+        
+        Default implementation loops over c
+        
+        """
+        
+        Y = np.atleast_2d( Y )
+        R = np.atleast_2d( R )
+        
+        U = np.zeros(( Y.shape[0] , self.m ))
+        
+        for i in range( Y.shape[0] ):
+            
+            ti = t[i] if np.ndim( t ) > 0 else t
+            
+            U[i,:] = self.c( Y[i,:] , R[i,:] , ti )
+            
+        return U
+    
+    
     #########################################################################
     # No need to overwrite the following functions for child classes
     #########################################################################
@@ -130,7 +165,12 @@ class ClosedLoopSystem( system.ContinuousDynamicSystem ):
     Ignore any feedthough to avoid creating algebraic loop
     This is only valid if the output function h is not a fonction of u
     New equations assume y = h(x,u,t) -- > y = h(x,t)
-
+    ---------------------------------------------
+    sampling_period = None : controller evaluated continuously in f
+    sampling_period = T    : sampled-data controller, sample() computes
+                             the controller output held ( zero-order 
+                             hold ) in f until the next sample
+                             
     """
     ############################
     def __init__(self, ContinuousDynamicSystem , StaticController):
@@ -149,10 +189,9 @@ class ClosedLoopSystem( system.ContinuousDynamicSystem ):
             ' dynamic system for the output signal y')
         ######################################################################
         
-        # Dimensions of global closed-loop dynamic system
-        self.n = self.sys.n
-        self.m = self.ctl.k 
-        self.p = self.sys.p
+        # Dimensions of global closed-loop dynamic system, default params
+        system.ContinuousDynamicSystem.__init__( self , self.sys.n , 
+                                                 self.ctl.k , self.sys.p )
         
         # Labels
         self.name = 'Closed-Loop ' + self.sys.name + ' with ' + self.ctl.name
@@ -175,6 +214,10 @@ class ClosedLoopSystem( system.ContinuousDynamicSystem ):
         self.xbar = self.sys.xbar
         self.ubar = self.ctl.rbar
         
+        # Sampled-data controller
+        self.sampling_period = None
+        self.u_hold          = None  # held controller output
+        
     
     ###########################################################################
     def f( self , x , u , t ):
@@ -193,14 +236,50 @@ class ClosedLoopSystem( system.ContinuousDynamicSystem ):
         
         dx = np.zeros(self.n) # State derivative vector
         
-        r = u # input of closed-loop global sys is ref of the controller
-        y = self.sys.h( x, self.sys.ubar, t)
-        u = self.ctl.c( y, r, t)
+        if self.isholding():
+            
+            # Sampled-data controller: output held between samples
+            u = self.u_hold
+            
+        else:
+        
+            r = u # input of closed-loop global sys is ref of the controller
+            y = self.sys.h( x, self.sys.ubar, t)
+            u = self.ctl.c( y, r, t)
         
         dx = self.sys.f( x, u, t)
         
         return dx
     
+    
+    ###########################################################################
+    def isholding( self ):
+        """ True if f uses the held output of a sampled-data controller """
+        
+        return ( self.sampling_period is not None ) and ( self.u_hold is not None )
+    
+    
+    ###########################################################################
+    def sample( self , x , r , t ):
+        """ 
+        Controller sample: compute and hold u = c( h( x ) , r , t )
+        
+        INPUTS
+        x  : state vector             n x 1
+        r  : reference signal vector  k x 1
+        t  : sampling time            1 x 1
+        
+        OUPUTS
+        u  : held control inputs      m x 1
+        
+        """
+        
+        y = self.sys.h( x , self.sys.ubar , t )
+        
+        self.u_hold = np.array( self.ctl.c( y , r , t ) , dtype = float )
+        
+        return self.u_hold
+    
 
     ###########################################################################
     def h( self , x , u , t ):
@@ -223,6 +302,64 @@ class ClosedLoopSystem( system.ContinuousDynamicSystem ):
         
         return y
     
+    
+    ###########################################################################
+    def f_batch( self , X , U , t = 0 ):
+        """ 
+        Vectorized foward dynamics, inputs U are references of the controller
+        
+        X  : array of state vectors      N x n
+        U  : array of reference vectors  N x k
+        
+        """
+        
+        X = np.atleast_2d( X )
+        R = np.atleast_2d( U ) # input of closed-loop global sys is ref of the controller
+        
+        if self.isholding():
+            
+            # Sampled-data controller: same held output for all states
+            U = np.tile( self.u_hold , ( X.shape[0] , 1 ) )
+            
+        else:
+            
+            Y = self.h_batch( X , R , t )
+            U = self.ctl.c_batch( Y , R , t )
+        
+        dX = self.sys.f_batch( X , U , t )
+        
+        return dX
+    
+    
+    ###########################################################################
+    def h_batch( self , X , U , t = 0 ):
+        """ Vectorized output fonction, no feedthrough """
+        
+        X    = np.atleast_2d( X )
+        Ubar = np.tile( self.sys.ubar , ( X.shape[0] , 1 ) )
+        
+        Y = self.sys.h_batch( X , Ubar , t )
+        
+        return Y
+    
+    
+    ###########################################################################
+    def jacobian_x( self , x , u , t = 0 ):
+        """ 
+        Jacobian of the closed-loop dynamics df/dx : n x n
+        
+        While a sampled-data controller output is held, this is the jacobian
+        of the open-loop system ( analytic when available ), otherwise
+        finite differences of the closed-loop f_batch
+        
+        """
+        
+        if self.isholding():
+            
+            return self.sys.jacobian_x( x , self.u_hold , t )
+        
+        return system.ContinuousDynamicSystem.jacobian_x( self , x , u , t )
+    
     ###########################################################################
     def plot_phase_plane_closed_loop(self , x_axis = 0 , y_axis = 1 ):
         """ 
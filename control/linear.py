@@ -70,6 +70,15 @@ class ProportionnalSingleVariableController( controller.StaticController ) :
         u = e * self.gain
         
         return u
+    
+    
+    #############################
+    def c_batch( self , Y , R , t = 0 ):
+        """ Vectorized feedback U = ( R - Y ) * gain """
+        
+        U = ( np.atleast_2d( R ) - np.atleast_2d( Y ) ) * self.gain
+        
+        return U
 
 
 
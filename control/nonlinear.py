@@ -58,11 +58,13 @@ class ComputedTorqueController( controller.StaticController ) :
         
         # Mode
         if traj == None:
-            self.c = self.c_fixed_goal
+            self.c       = self.c_fixed_goal
+            self.c_batch = self.c_fixed_goal_batch
         else:
             self.load_trajectory( traj )
             self.mode = 'interpol'
-            self.c = self.c_trajectory_following
+            self.c       = self.c_trajectory_following
+            self.c_batch = self.c_trajectory_following_batch
         
     
     #############################
@@ -212,6 +214,86 @@ class ComputedTorqueController( controller.StaticController ) :
     
 
 
+    ###########################################################################
+    # Vectorized versions: N states at once
+    ###########################################################################
+    
+    #############################
+    def c_fixed_goal_batch( self , Y , R , t = 0 ):
+        """ Vectorized feedback U = c( Y , R , t ) , Y is N x p , R is N x k """
+        
+        X   = np.atleast_2d( Y )
+        Q_d = np.atleast_2d( R )
+        
+        U = self.fixed_goal_ctl_batch( X , Q_d , t )
+        
+        return U
+    
+    
+    ############################
+    def fixed_goal_ctl_batch( self , X , Q_d , t = 0 ):
+        """ Vectorized fixed_goal_ctl """
+        
+        Q  = X[ : , 0              : self.model.dof ]
+        dQ = X[ : , self.model.dof : self.model.n   ]
+        
+        ddQ_r = self.compute_ddq_r( 0 , 0 , Q_d , dQ , Q )
+        
+        U = self.model.actuator_forces_batch( Q , dQ , ddQ_r )
+        
+        return U
+    
+    
+    ############################
+    def get_traj_batch( self , t ):
+        """ Vectorized get_traj, t is an array of N times """
+        
+        N = t.size
+        
+        Q   = np.tile( self.rbar , ( N , 1 ) ).astype( float )
+        dQ  = np.zeros(( N , self.model.dof ))
+        ddQ = np.zeros(( N , self.model.dof ))
+        
+        on_traj = t < self.trajectory.time_final
+        
+        if on_traj.any():
+            
+            Q[ on_traj ]   = self.q(   t[ on_traj ] ).T
+            dQ[ on_traj ]  = self.dq(  t[ on_traj ] ).T
+            ddQ[ on_traj ] = self.ddq( t[ on_traj ] ).T
+            
+        return ddQ , dQ , Q
+    
+    
+    ############################
+    def traj_following_ctl_batch( self , X , t ):
+        """ Vectorized traj_following_ctl """
+        
+        Q  = X[ : , 0              : self.model.dof ]
+        dQ = X[ : , self.model.dof : self.model.n   ]
+        
+        ddQ_d , dQ_d , Q_d = self.get_traj_batch( t )
+        
+        ddQ_r = self.compute_ddq_r( ddQ_d , dQ_d , Q_d , dQ , Q )
+        
+        U = self.model.actuator_forces_batch( Q , dQ , ddQ_r )
+        
+        return U
+    
+    
+    #############################
+    def c_trajectory_following_batch( self , Y , R , t = 0 ):
+        """ Vectorized feedback U = c( Y , R , t ) , t is 1 x 1 or N x 1 """
+        
+        X = np.atleast_2d( Y )
+        t = np.broadcast_to( np.asarray( t , dtype = float ) , X.shape[0] )
+        
+        U = self.traj_following_ctl_batch( X , t )
+        
+        return U
+    
+
+
 ##############################################################################
         
 class SlidingModeController( ComputedTorqueController ):
@@ -322,6 +404,62 @@ class SlidingModeController( ComputedTorqueController ):
         
         return u
 
+    ############################
+    def K_batch( self , Q , t ):
+        """ Vectorized discontinuous gain matrices N x dof x dof """
+        
+        dist_max = np.diag( np.ones( self.model.dof ) ) * self.gain
+        conv_min = np.diag( np.ones( self.model.dof ) ) * self.nab
+        
+        K = dist_max + np.einsum( 'ijk,kl->ijl' , self.model.H_batch( Q ) , conv_min )
+        
+        return K
+    
+    
+    ############################
+    def sliding_torque_batch( self , ddQ_r , S , dQ , Q , t ):
+        """ Vectorized sliding_torque """
+        
+        U_computed      = self.model.actuator_forces_batch( Q , dQ , ddQ_r )
+        
+        U_discontinuous = np.einsum( 'ijk,ik->ij' , self.K_batch( Q , t ) , np.sign( S ) )
+        
+        return U_computed - U_discontinuous
+    
+    
+    ############################
+    def traj_following_ctl_batch( self , X , t ):
+        """ Vectorized traj_following_ctl """
+        
+        Q  = X[ : , 0              : self.model.dof ]
+        dQ = X[ : , self.model.dof : self.model.n   ]
+        
+        ddQ_d , dQ_d , Q_d    = self.get_traj_batch( t )
+        
+        [ S , dQ_r , ddQ_r ]  = self.compute_sliding_variables( ddQ_d , dQ_d , 
+                                                                Q_d , dQ , Q )
+        
+        U = self.sliding_torque_batch( ddQ_r , S , dQ , Q , t )
+        
+        return U
+    
+    
+    ############################
+    def fixed_goal_ctl_batch( self , X , Q_d , t = 0 ):
+        """ Vectorized fixed_goal_ctl """
+        
+        Q  = X[ : , 0              : self.model.dof ]
+        dQ = X[ : , self.model.dof : self.model.n   ]
+        
+        [ S , dQ_r , ddQ_r ]  = self.compute_sliding_variables( 0 , 0 , 
+                                                                Q_d , dQ , Q )
+        
+        U = self.sliding_torque_batch( ddQ_r , S , dQ , Q , t )
+        
+        return U
+    
+    
+
 '''
 #################################################################
 ##################          Main                         ########
@@ -12,7 +12,7 @@ from pyro.dynamic import system
 
 ##############################################################################
         
-class SimpleIntegrator( system.ContinuousDynamicSystem ):
+class SimpleIntegrator( system.LinearDynamicSystem ):
     """ 
     SimpleIntegrator Example for a ContinuousDynamicSystem
     -------------------------------------------------------
@@ -30,7 +30,7 @@ class SimpleIntegrator( system.ContinuousDynamicSystem ):
         self.p = 1
         
         # initialize standard params
-        system.ContinuousDynamicSystem.__init__(self, self.n, self.m, self.p)
+        system.LinearDynamicSystem.__init__(self, self.n, self.m, self.p)
         
         # Labels
         self.name = 'Simple Integrator'
@@ -43,6 +43,12 @@ class SimpleIntegrator( system.ContinuousDynamicSystem ):
         self.input_units = ['[m/sec]']
         self.output_units = ['[m]']
         
+        # Matrices
+        self.A = np.array([[ 0 ]])
+        self.B = np.array([[ 1 ]])
+        self.C = np.array([[ 1 ]])
+        self.D = np.array([[ 0 ]])
+        
     
     #############################
     def f(self, x = np.zeros(2) , u = np.zeros(1) , t = 0 ):
@@ -71,9 +77,20 @@ class SimpleIntegrator( system.ContinuousDynamicSystem ):
         return dx
 
 
+    #############################
+    def f_batch(self, X , U , t = 0 ):
+        """ Vectorized foward dynamics: X is N x n, U is N x m """
+
+        dX = np.zeros(( X.shape[0] , self.n ))
+
+        dX[:,0] = U[:,0]
+
+        return dX
+
+
 #############################################################################
 
-class DoubleIntegrator( system.ContinuousDynamicSystem ):
+class DoubleIntegrator( system.LinearDynamicSystem ):
     """ 
     DoubleIntegrator Example for a ContinuousDynamicSystem
     
@@ -89,7 +106,7 @@ class DoubleIntegrator( system.ContinuousDynamicSystem ):
         self.p = 1
         
         # initialize standard params
-        system.ContinuousDynamicSystem.__init__(self, self.n, self.m, self.p)
+        system.LinearDynamicSystem.__init__(self, self.n, self.m, self.p)
     
         # Labels
         self.name = 'Double Integrator'
@@ -102,6 +119,14 @@ class DoubleIntegrator( system.ContinuousDynamicSystem ):
         self.input_units = ['[N]']
         self.output_units = ['[m]']
         
+        # Matrices
+        self.A = np.array([[ 0 , 1 ],
+                           [ 0 , 0 ]])
+        self.B = np.array([[ 0 ],
+                           [ 1 ]])
+        self.C = np.array([[ 1 , 0 ]])
+        self.D = np.array([[ 0 ]])
+        
     
     #############################
     def f(self, x = np.zeros(2) , u = np.zeros(1) , t = 0 ):
@@ -129,6 +154,18 @@ class DoubleIntegrator( system.ContinuousDynamicSystem ):
         dx[1] = u[0]  # 
         
         return dx
+
+
+    #############################
+    def f_batch(self, X , U , t = 0 ):
+        """ Vectorized foward dynamics: X is N x n, U is N x m """
+
+        dX = np.zeros(( X.shape[0] , self.n ))
+
+        dX[:,0] = X[:,1]
+        dX[:,1] = U[:,0]
+
+        return dX
     
     
     #############################
@@ -151,13 +188,20 @@ class DoubleIntegrator( system.ContinuousDynamicSystem ):
         y[0] = x[0] # output is first state = position
         
         return y
+
+
+    #############################
+    def h_batch(self, X , U , t = 0 ):
+        """ Vectorized output: first state = position """
+
+        return X[:,0:1].copy()
     
     
     
 ##############################################################################
         
     
-class TripleIntegrator( system.ContinuousDynamicSystem ):
+class TripleIntegrator( system.LinearDynamicSystem ):
     """ 
     DoubleIntegrator Example for a ContinuousDynamicSystem
     
@@ -172,7 +216,7 @@ class TripleIntegrator( system.ContinuousDynamicSystem ):
         self.p = 1
         
         # initialize standard params
-        system.ContinuousDynamicSystem.__init__(self, self.n, self.m, self.p)
+        system.LinearDynamicSystem.__init__(self, self.n, self.m, self.p)
         
         # Labels
         self.name = 'Triple Integrator'
@@ -185,6 +229,16 @@ class TripleIntegrator( system.ContinuousDynamicSystem ):
         self.input_units = ['[N/sec]']
         self.output_units = ['[m]']
         
+        # Matrices
+        self.A = np.array([[ 0 , 1 , 0 ],
+                           [ 0 , 0 , 1 ],
+                           [ 0 , 0 , 0 ]])
+        self.B = np.array([[ 0 ],
+                           [ 0 ],
+                           [ 1 ]])
+        self.C = np.array([[ 1 , 0 , 0 ]])
+        self.D = np.array([[ 0 ]])
+        
     
     #############################
     def f(self, x = np.zeros(2) , u = np.zeros(1) , t = 0 ):
@@ -214,6 +268,19 @@ class TripleIntegrator( system.ContinuousDynamicSystem ):
         dx[2] = u[0]  # 
         
         return dx
+
+
+    #############################
+    def f_batch(self, X , U , t = 0 ):
+        """ Vectorized foward dynamics: X is N x n, U is N x m """
+
+        dX = np.zeros(( X.shape[0] , self.n ))
+
+        dX[:,0] = X[:,1]
+        dX[:,1] = X[:,2]
+        dX[:,2] = U[:,0]
+
+        return dX
     
     
     #############################
@@ -236,6 +303,13 @@ class TripleIntegrator( system.ContinuousDynamicSystem ):
         y[0] = x[0] # output is first state = position
         
         return y
+
+
+    #############################
+    def h_batch(self, X , U , t = 0 ):
+        """ Vectorized output: first state = position """
+
+        return X[:,0:1].copy()
     
     
     
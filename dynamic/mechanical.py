@@ -136,6 +136,66 @@ class MechanicalSystem( system.ContinuousDynamicSystem ):
         return d
     
     
+    ###########################################################################
+    # Vectorized versions, overload with array operations for speed
+    ###########################################################################
+    
+    ###########################################################################
+    def H_batch(self, Q ):
+        """ Inertia matrices for N configurations : N x dof x dof """
+        
+        H = np.zeros(( Q.shape[0] , self.dof , self.dof ))
+        
+        for i in range( Q.shape[0] ):
+            H[i] = self.H( Q[i] )
+        
+        return H
+    
+    ###########################################################################
+    def C_batch(self, Q , dQ ):
+        """ Corriolis matrices for N configurations : N x dof x dof """
+        
+        C = np.zeros(( Q.shape[0] , self.dof , self.dof ))
+        
+        for i in range( Q.shape[0] ):
+            C[i] = self.C( Q[i] , dQ[i] )
+        
+        return C
+    
+    ###########################################################################
+    def B_batch(self, Q ):
+        """ Actuator matrices for N configurations : N x dof x m """
+        
+        B = np.zeros(( Q.shape[0] , self.dof , self.m ))
+        
+        for i in range( Q.shape[0] ):
+            B[i] = self.B( Q[i] )
+        
+        return B
+    
+    ###########################################################################
+    def g_batch(self, Q ):
+        """ Gravitationnal forces for N configurations : N x dof """
+        
+        g = np.zeros(( Q.shape[0] , self.dof ))
+        
+        for i in range( Q.shape[0] ):
+            g[i] = self.g( Q[i] )
+        
+        return g
+    
+    ###########################################################################
+    def d_batch(self, Q , dQ ):
+        """ Dissipative forces for N configurations : N x dof """
+        
+        d = np.zeros(( Q.shape[0] , self.dof ))
+        
+        for i in range( Q.shape[0] ):
+            d[i] = self.d( Q[i] , dQ[i] )
+        
+        return d
+    
+    
     ###########################################################################
     # No need to overwrite the following functions for custom system
     ###########################################################################
@@ -242,6 +302,91 @@ class MechanicalSystem( system.ContinuousDynamicSystem ):
         return dx
     
     
+    ##############################
+    def generalized_forces_batch(self, Q , dQ , ddQ , t = 0 ):
+        """ Vectorized generalized forces: Q, dQ, ddQ are N x dof """
+        
+        H = self.H_batch( Q )
+        C = self.C_batch( Q , dQ )
+        g = self.g_batch( Q )
+        d = self.d_batch( Q , dQ )
+        
+        forces = ( np.einsum( 'ijk,ik->ij' , H , ddQ ) 
+                 + np.einsum( 'ijk,ik->ij' , C , dQ  ) + g + d )
+        
+        return forces
+    
+    
+    ##############################
+    def actuator_forces_batch(self, Q , dQ , ddQ , t = 0 ):
+        """ Vectorized inverse dynamic: Q, dQ, ddQ are N x dof, U is N x m """
+        
+        B = self.B_batch( Q )
+        
+        forces = self.generalized_forces_batch( Q , dQ , ddQ , t )
+        
+        U = np.linalg.solve( B , forces[:,:,np.newaxis] )[:,:,0]
+        
+        return U
+    
+    
+    ##############################
+    def ddq_batch(self, Q , dQ , U , t = 0 ):
+        """ Vectorized foward dynamic: Q, dQ are N x dof, U is N x m """
+        
+        H = self.H_batch( Q )
+        C = self.C_batch( Q , dQ )
+        g = self.g_batch( Q )
+        d = self.d_batch( Q , dQ )
+        B = self.B_batch( Q )
+        
+        forces = ( np.einsum( 'ijk,ik->ij' , B , U  ) 
+                 - np.einsum( 'ijk,ik->ij' , C , dQ ) - g - d )
+        
+        ddQ = np.linalg.solve( H , forces[:,:,np.newaxis] )[:,:,0]
+        
+        return ddQ
+    
+    
+    ###########################################################################
+    def f_batch(self, X , U , t = 0 ):
+        """ 
+        Vectorized foward dynamics dX = f( X , U , t )
+        
+        X  : array of state vectors   N x n
+        U  : array of input vectors   N x m
+        
+        """
+        
+        Q  = X[ : , 0        : self.dof ]
+        dQ = X[ : , self.dof : self.n   ]
+        
+        dX = np.zeros(( X.shape[0] , self.n ))
+        
+        dX[ : , 0        : self.dof ] = dQ
+        dX[ : , self.dof : self.n   ] = self.ddq_batch( Q , dQ , U , t )
+        
+        return dX
+    
+    
+    ###########################################################################
+    def jacobian_u(self, x , u , t = 0 ):
+        """ 
+        Analytic df/du : n x m
+        
+        d ddq / du = H(q)^-1 B(q) 
+        
+        """
+        
+        [ q , dq ] = self.x2q( x )
+        
+        B = np.zeros(( self.n , self.m ))
+        
+        B[ self.dof : , : ] = np.linalg.solve( self.H( q ) , self.B( q ) )
+        
+        return B
+    
+    
     ###########################################################################
     def kinetic_energy(self, q  , dq ):
         """ Compute kinetic energy of manipulator """  
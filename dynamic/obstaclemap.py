@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""
+Rasterized 2D obstacle map with signed distance field
+"""
+
+import numpy as np
+from matplotlib.path import Path
+from scipy.ndimage import distance_transform_edt
+
+
+'''
+################################################################################
+'''
+
+
+class ObstacleMap:
+    """
+    Rasterized 2D obstacle map
+    ------------------------------------------------------------
+    Obstacles are rasterized once on a regular grid covering [ x_lb , x_ub ]
+    ( first two state coordinates ). Validity and clearance queries of a
+    batch of states are then a single array lookup, whatever the number
+    of obstacles.
+
+    occupancy : True if the cell overlaps an obstacle            nx x ny
+    distance  : signed distance to the obstacle boundaries [m]   nx x ny
+                ( positive in free space , negative inside obstacles )
+
+    Rasterization is conservative: every cell touched by an obstacle is 
+    occupied, even if the obstacle is narrower than one cell, so obstacles
+    are inflated by up to one cell
+
+    """
+
+    ############################
+    def __init__(self, x_lb , x_ub , resolution = 0.05 ):
+
+        self.x_lb = np.array( x_lb[:2] , dtype = float )
+        self.x_ub = np.array( x_ub[:2] , dtype = float )
+
+        # Grid size
+        self.dims = np.maximum( np.ceil( ( self.x_ub - self.x_lb ) / resolution ) , 1 ).astype( int )
+        self.step = ( self.x_ub - self.x_lb ) / self.dims
+
+        # Cell centers
+        self.xc = self.x_lb[0] + ( np.arange( self.dims[0] ) + 0.5 ) * self.step[0]
+        self.yc = self.x_lb[1] + ( np.arange( self.dims[1] ) + 0.5 ) * self.step[1]
+
+        self.occupancy = np.zeros( self.dims , dtype = bool )
+        self.distance  = np.full( self.dims , np.inf )
+
+
+    ############################
+    def cell_range(self, lower , upper ):
+        """ Slices of the cells whose extent overlaps the box ( lower , upper ) """
+
+        lo = np.floor( ( np.asarray( lower[:2] , dtype = float ) - self.x_lb ) / self.step ).astype( int )
+        hi = np.ceil(  ( np.asarray( upper[:2] , dtype = float ) - self.x_lb ) / self.step ).astype( int )
+
+        lo = np.clip( lo , 0 , self.dims )
+        hi = np.clip( hi , 0 , self.dims )
+
+        return slice( lo[0] , hi[0] ) , slice( lo[1] , hi[1] )
+
+
+    ############################
+    def add_rectangle(self, lower , upper ):
+        """ Rectangle obstacle from lower and upper corners """
+
+        self.occupancy[ self.cell_range( lower , upper ) ] = True
+
+
+    ############################
+    def add_polygon(self, vertices ):
+        """ Polygon obstacle from a list of vertices ( k x 2 ) """
+
+        vertices = np.asarray( vertices , dtype = float )
+
+        # Only cells within the bounding box of the polygon are tested
+        cells = self.cell_range( vertices.min( axis = 0 ) , vertices.max( axis = 0 ) )
+
+        xc , yc = np.meshgrid( self.xc[ cells[0] ] , self.yc[ cells[1] ] , indexing = 'ij' )
+
+        # Cells whose center is inside the polygon
+        pts      = np.column_stack( [ xc.ravel() , yc.ravel() ] )
+        occupied = Path( vertices ).contains_points( pts ).reshape( xc.shape )
+
+        # Cells crossed by an edge ( boundaries shrunk so that an edge on a
+        # grid line does not occupy the neighbor cells )
+        eps  = 1e-9 * self.step
+        x_lo = xc - 0.5 * self.step[0] + eps[0]
+        x_hi = xc + 0.5 * self.step[0] - eps[0]
+        y_lo = yc - 0.5 * self.step[1] + eps[1]
+        y_hi = yc + 0.5 * self.step[1] - eps[1]
+
+        for a , b in zip( vertices , np.roll( vertices , -1 , axis = 0 ) ):
+
+            d = b - a
+
+            # Liang-Barsky clipping of the edge a + s * d , s in [0,1]
+            s_in  = np.zeros( xc.shape )
+            s_out = np.ones(  xc.shape )
+            cross = np.ones(  xc.shape , dtype = bool )
+
+            for p , q in ( ( -d[0] , a[0] - x_lo ) , ( d[0] , x_hi - a[0] ) ,
+                           ( -d[1] , a[1] - y_lo ) , ( d[1] , y_hi - a[1] ) ):
+
+                if p == 0:
+                    cross = cross & ( q >= 0 )
+                elif p < 0:
+                    s_in  = np.maximum( s_in , q / p )
+                else:
+                    s_out = np.minimum( s_out , q / p )
+
+            occupied = occupied | ( cross & ( s_in <= s_out ) )
+
+        self.occupancy[ cells ] |= occupied
+
+
+    ############################
+    def add_obstacle(self, obs ):
+        """ Two points: rectangle ( lower , upper ), more: polygon vertices """
+
+        if len( obs ) == 2:
+            self.add_rectangle( obs[0] , obs[1] )
+        else:
+            self.add_polygon( obs )
+
+
+    ############################
+    def compute_distance(self):
+        """ Signed distance field from the occupancy grid """
+
+        if not self.occupancy.any():
+            self.distance = np.full( self.dims , np.inf )
+            return
+
+        if self.occupancy.all():
+            self.distance = np.full( self.dims , -np.inf )
+            return
+
+        outside = distance_transform_edt( ~self.occupancy , sampling = self.step )
+        inside  = distance_transform_edt(  self.occupancy , sampling = self.step )
+
+        self.distance = outside - inside
+
+
+    ############################
+    def cell_index(self, X ):
+        """ Grid index of the cells of states X ( N x n ), clipped on the map """
+
+        X = np.atleast_2d( X )
+
+        i = np.floor( ( X[:,:2] - self.x_lb ) / self.step ).astype( int )
+
+        return np.clip( i , 0 , self.dims - 1 )
+
+
+    ############################
+    def isfree(self, x ):
+        """ True if state x is not on an obstacle """
+
+        i = min( max( int( ( x[0] - self.x_lb[0] ) // self.step[0] ) , 0 ) , self.dims[0] - 1 )
+        j = min( max( int( ( x[1] - self.x_lb[1] ) // self.step[1] ) , 0 ) , self.dims[1] - 1 )
+
+        return not self.occupancy[ i , j ]
+
+
+    ############################
+    def isfree_batch(self, X ):
+        """ True for each row of X ( N x n ) not on an obstacle """
+
+        i = self.cell_index( X )
+
+        return ~self.occupancy[ i[:,0] , i[:,1] ]
+
+
+    ############################
+    def clearance_batch(self, X ):
+        """ Signed distance to the nearest obstacle of each row of X [m] """
+
+        i = self.cell_index( X )
+
+        return self.distance[ i[:,0] , i[:,1] ]
+
+
+
+'''
+################################################################################
+'''
+
+
+###############################################################################
+def rasterize( obstacles , x_lb , x_ub , resolution = 0.05 ):
+    """ Obstacle map of a list of rectangles and polygons """
+
+    obstacle_map = ObstacleMap( x_lb , x_ub , resolution )
+
+    for obs in obstacles:
+        obstacle_map.add_obstacle( obs )
+
+    obstacle_map.compute_distance()
+
+    return obstacle_map
+
+
+
+'''
+#################################################################
+##################          Main                         ########
+#################################################################
+'''
+
+
+if __name__ == "__main__":
+    """ MAIN TEST """
+
+    import matplotlib.pyplot as plt
+
+    obstacles = [
+            [ (2,2),(4,10)],
+            [ (6,-8),(8,8)],
+            [ (-8,-8),(-1,8)],
+            [ (-4,-9),(0,-6),(2,-9)]
+            ]
+
+    obstacle_map = rasterize( obstacles , [-10,-10] , [10,10] )
+
+    plt.imshow( obstacle_map.distance.T , origin = 'lower' ,
+                extent = [ -10 , 10 , -10 , 10 ] )
+    plt.colorbar()
+    plt.show()
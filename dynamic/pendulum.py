@@ -124,6 +124,70 @@ class SinglePendulum( mechanical.MechanicalSystem ):
         d[0] = self.d1 * dq[0]
         
         return d
+    
+    ###########################################################################
+    # Vectorized dynamics
+    ###########################################################################
+    
+    ###########################################################################
+    def H_batch(self, Q ):
+        """ Inertia matrices for N configurations : N x dof x dof """
+        
+        H = np.zeros(( Q.shape[0] , self.dof , self.dof ))
+        
+        H[:,0,0] = self.m1 * self.lc1**2 + self.I1
+        
+        return H
+    
+    ###########################################################################
+    def C_batch(self, Q , dQ ):
+        """ Corriolis matrices for N configurations : N x dof x dof """
+        
+        return np.zeros(( Q.shape[0] , self.dof , self.dof ))
+    
+    ###########################################################################
+    def B_batch(self, Q ):
+        """ Actuator matrices for N configurations : N x dof x m """
+        
+        B = np.zeros(( Q.shape[0] , self.dof , self.m ))
+        
+        B[:,0,0] = 1
+        
+        return B
+    
+    ###########################################################################
+    def g_batch(self, Q ):
+        """ Gravitationnal forces for N configurations : N x dof """
+        
+        g = np.zeros(( Q.shape[0] , self.dof ))
+        
+        g[:,0] = self.m1 * self.gravity * self.lc1 * np.sin( Q[:,0] )
+        
+        return g
+    
+    ###########################################################################
+    def d_batch(self, Q , dQ ):
+        """ Dissipative forces for N configurations : N x dof """
+        
+        d = np.zeros(( Q.shape[0] , self.dof ))
+        
+        d[:,0] = self.d1 * dQ[:,0]
+        
+        return d
+    
+    ###########################################################################
+    def jacobian_x(self, x , u , t = 0 ):
+        """ Analytic df/dx : n x n """
+        
+        H = self.m1 * self.lc1**2 + self.I1
+        
+        A = np.zeros(( self.n , self.n ))
+        
+        A[0,1] = 1
+        A[1,0] = - self.m1 * self.gravity * self.lc1 * np.cos( x[0] ) / H
+        A[1,1] = - self.d1 / H
+        
+        return A
         
     ###########################################################################
     # Graphical output
@@ -325,6 +389,131 @@ class DoublePendulum( mechanical.MechanicalSystem ):
         d = np.dot( D , dq )
         
         return d
+    
+    ###########################################################################
+    # Vectorized dynamics
+    ###########################################################################
+    
+    ###########################################################################
+    def H_batch(self, Q ):
+        """ Inertia matrices for N configurations : N x dof x dof """
+        
+        c2 = np.cos( Q[:,1] )
+        
+        H = np.zeros(( Q.shape[0] , 2 , 2 ))
+        
+        H[:,0,0] = self.m1 * self.lc1**2 + self.I1 + self.m2 * ( self.l1**2 + self.lc2**2 + 2 * self.l1 * self.lc2 * c2 ) + self.I2
+        H[:,1,0] = self.m2 * self.lc2**2 + self.m2 * self.l1 * self.lc2 * c2 + self.I2
+        H[:,0,1] = H[:,1,0]
+        H[:,1,1] = self.m2 * self.lc2 ** 2 + self.I2
+        
+        return H
+    
+    ###########################################################################
+    def C_batch(self, Q , dQ ):
+        """ Corriolis matrices for N configurations : N x dof x dof """
+        
+        h = self.m2 * self.l1 * self.lc2 * np.sin( Q[:,1] )
+        
+        C = np.zeros(( Q.shape[0] , 2 , 2 ))
+        
+        C[:,0,0] = - h  * dQ[:,1]
+        C[:,1,0] =   h  * dQ[:,0]
+        C[:,0,1] = - h * ( dQ[:,0] + dQ[:,1] )
+        
+        return C
+    
+    ###########################################################################
+    def B_batch(self, Q ):
+        """ Actuator matrices for N configurations : N x dof x m """
+        
+        B = np.zeros(( Q.shape[0] , 2 , 2 ))
+        
+        B[:,0,0] = 1
+        B[:,1,1] = 1
+        
+        return B
+    
+    ###########################################################################
+    def g_batch(self, Q ):
+        """ Gravitationnal forces for N configurations : N x dof """
+        
+        s1  = np.sin( Q[:,0] )
+        s12 = np.sin( Q[:,0] + Q[:,1] )
+        
+        g1 = (self.m1 * self.lc1 + self.m2 * self.l1 ) * self.gravity
+        g2 = self.m2 * self.lc2 * self.gravity
+        
+        G = np.zeros(( Q.shape[0] , 2 ))
+        
+        G[:,0] = - g1 * s1 - g2 * s12
+        G[:,1] = - g2 * s12
+        
+        return G
+    
+    ###########################################################################
+    def d_batch(self, Q , dQ ):
+        """ Dissipative forces for N configurations : N x dof """
+        
+        d = np.zeros(( Q.shape[0] , 2 ))
+        
+        d[:,0] = self.d1 * dQ[:,0]
+        d[:,1] = self.d2 * dQ[:,1]
+        
+        return d
+    
+    ###########################################################################
+    def jacobian_x(self, x , u , t = 0 ):
+        """ 
+        Analytic df/dx : n x n
+        ---------------------------------------------------------
+        d ddq / dx = H^-1 ( d tau / dx - d H / dx ddq ) 
+        
+        with the generalized forces tau = B u - C dq - g - d
+        
+        """
+        
+        [ q , dq ] = self.x2q( x )
+        
+        [c1,s1,c2,s2,c12,s12] = self.trig( q )
+        
+        H   = self.H( q )
+        ddq = self.ddq( q , dq , u , t )
+        
+        h  = self.m2 * self.l1 * self.lc2 * s2
+        hc = self.m2 * self.l1 * self.lc2 * c2
+        
+        g1 = (self.m1 * self.lc1 + self.m2 * self.l1 ) * self.gravity
+        g2 = self.m2 * self.lc2 * self.gravity
+        
+        # d tau / dq
+        dtau_dq = np.zeros((2,2))
+        
+        dtau_dq[0,0] = g1 * c1 + g2 * c12
+        dtau_dq[1,0] = g2 * c12
+        dtau_dq[0,1] = g2 * c12 + hc * ( 2 * dq[0] * dq[1] + dq[1]**2 )
+        dtau_dq[1,1] = g2 * c12 - hc * dq[0]**2
+        
+        # H only depends on q[1]
+        dH = - h * np.array([ [ 2 , 1 ] , [ 1 , 0 ] ])
+        
+        dtau_dq[:,1] = dtau_dq[:,1] - np.dot( dH , ddq )
+        
+        # d tau / d dq
+        dtau_ddq = np.zeros((2,2))
+        
+        dtau_ddq[0,0] =   2 * h * dq[1] - self.d1
+        dtau_ddq[0,1] =   2 * h * ( dq[0] + dq[1] )
+        dtau_ddq[1,0] = - 2 * h * dq[0]
+        dtau_ddq[1,1] = - self.d2
+        
+        A = np.zeros(( self.n , self.n ))
+        
+        A[ 0:2 , 2:4 ] = np.eye( 2 )
+        A[ 2:4 , 0:2 ] = np.linalg.solve( H , dtau_dq )
+        A[ 2:4 , 2:4 ] = np.linalg.solve( H , dtau_ddq )
+        
+        return A
         
     ###########################################################################
     # Graphical output
@@ -6,6 +6,7 @@ Created on Fri Aug 07 11:51:55 2015
 """
 
 import numpy as np
+from scipy import linalg
 
 from pyro.analysis import simulation
 from pyro.analysis import phaseanalysis
@@ -76,6 +77,15 @@ class ContinuousDynamicSystem:
         self.xbar = np.zeros(self.n)
         self.ubar = np.zeros(self.m)
         
+        # Discrete time stepping ( x_next )
+        self.integration_method = 'euler' # 'euler', 'midpoint', 'rk4', 'adaptive'
+                                          # ( 'exact' for LinearDynamicSystem )
+        self.integration_tol    = 1E-6    # relative error of 'adaptive'
+        self.integration_min_dt = 1E-6    # min sub-step of 'adaptive'
+        
+        # Finite-difference Jacobians ( relative perturbation )
+        self.jacobian_eps = 1E-6
+        
     
     #############################
     def f( self , x , u , t ):
@@ -125,12 +135,147 @@ class ContinuousDynamicSystem:
         #y = np.zeros(self.p) # Output vector
         
         y = x      # default output is all states
-        
+
         return y
-    
-        
+
+
+    ###########################################################################
+    # Vectorized versions, overload with array operations for speed
+    ###########################################################################
+
+    #############################
+    def f_batch( self , X , U , t = 0 ):
+        """
+        Batched foward dynamics evaluation dX = f( X , U , t )
+
+        INPUTS
+        X  : array of state vectors   N x n
+        U  : array of input vectors   N x m
+        t  : time                     1 x 1 or N x 1
+
+        OUPUTS
+        dX : array of state derivative vectors N x n
+
+        Default implementation loops over f
+
+        """
+
+        X  = np.atleast_2d( X )
+        U  = np.atleast_2d( U )
+
+        dX = np.zeros(( X.shape[0] , self.n ))
+
+        for i in range( X.shape[0] ):
+
+            ti = t[i] if np.ndim( t ) > 0 else t
+
+            dX[i,:] = self.f( X[i,:] , U[i,:] , ti )
+
+        return dX
+
+
+    #############################
+    def h_batch( self , X , U , t = 0 ):
+        """
+        Batched output fonction Y = h( X , U , t )
+
+        INPUTS
+        X  : array of state vectors   N x n
+        U  : array of input vectors   N x m
+        t  : time                     1 x 1 or N x 1
+
+        OUPUTS
+        Y  : array of output vectors  N x p
+
+        Default implementation loops over h
+
+        """
+
+        X  = np.atleast_2d( X )
+        U  = np.atleast_2d( U )
+
+        Y = np.zeros(( X.shape[0] , self.p ))
+
+        for i in range( X.shape[0] ):
+
+            ti = t[i] if np.ndim( t ) > 0 else t
+
+            Y[i,:] = self.h( X[i,:] , U[i,:] , ti )
+
+        return Y
+
+
+    ###########################################################################
+    # Jacobians, overload with analytic derivatives when available
+    ###########################################################################
+
+    #############################
+    def jacobian_x( self , x , u , t = 0 ):
+        """
+        Jacobian of the dynamics with respect to the state A = df/dx
+
+        INPUTS
+        x  : state vector             n x 1
+        u  : control inputs vector    m x 1
+        t  : time                     1 x 1
+
+        OUPUTS
+        A  : jacobian matrix          n x n
+
+        Default implementation: central finite differences, the 2n
+        perturbed states are evaluated with a single call of f_batch
+
+        """
+
+        x   = np.asarray( x , dtype = float )
+        eps = self.jacobian_eps * ( 1 + np.abs( x ) )
+
+        E = np.diag( eps )
+        X = np.vstack( [ x + E , x - E ] )
+        U = np.tile( u , ( 2 * self.n , 1 ) )
+
+        dX = self.f_batch( X , U , t )
+
+        A = ( dX[ : self.n ] - dX[ self.n : ] ).T / ( 2 * eps )
+
+        return A
+
+
+    #############################
+    def jacobian_u( self , x , u , t = 0 ):
+        """
+        Jacobian of the dynamics with respect to the inputs B = df/du
+
+        INPUTS
+        x  : state vector             n x 1
+        u  : control inputs vector    m x 1
+        t  : time                     1 x 1
+
+        OUPUTS
+        B  : jacobian matrix          n x m
+
+        Default implementation: central finite differences, the 2m
+        perturbed inputs are evaluated with a single call of f_batch
+
+        """
+
+        u   = np.asarray( u , dtype = float )
+        eps = self.jacobian_eps * ( 1 + np.abs( u ) )
+
+        E = np.diag( eps )
+        U = np.vstack( [ u + E , u - E ] )
+        X = np.tile( x , ( 2 * self.m , 1 ) )
+
+        dX = self.f_batch( X , U , t )
+
+        B = ( dX[ : self.m ] - dX[ self.m : ] ).T / ( 2 * eps )
+
+        return B
+
+
     ###########################################################################
     # Basic domain checks, ovewload if something more complex is needed
+    # (overload the batch versions accordingly)
     ###########################################################################
         
     #############################
@@ -153,6 +298,22 @@ class ContinuousDynamicSystem:
             
         return not(ans)
     
+    #############################
+    def isavalidstate_batch(self , X ):
+        """ check if each row of X ( N x n ) is in the state domain """
+        
+        X = np.atleast_2d( X )
+        
+        return np.all( ( X >= self.x_lb ) & ( X <= self.x_ub ) , axis = 1 )
+    
+    #############################
+    def isavalidinput_batch(self , X , U ):
+        """ check if each row of U ( N x m ) is in the inputs domain """
+        
+        U = np.atleast_2d( U )
+        
+        return np.all( ( U >= self.u_lb ) & ( U <= self.u_ub ) , axis = 1 )
+    
     
     ###########################################################################
     # Place holder graphical output, ovewload with specific graph output
@@ -225,13 +386,128 @@ class ContinuousDynamicSystem:
         
         return dx
     
+    
+    #############################
+    def fbar_jacobian( self , x , t ):
+        """ 
+        Jacobian df/dx of fbar, for the default constant input ubar
+        
+        INPUTS
+        x  : state vector             n x 1
+        t  : time                     1 x 1
+        
+        OUPUTS
+        A  : jacobian matrix          n x n
+        
+        """
+        
+        A = self.jacobian_x( x , self.ubar , t )
+        
+        return A
+    
+        
+    #############################
+    def integration_step( self , f , x , u , t , dt ):
+        """ 
+        One step of the selected integration method
+        --------------------------------------------
+        f  : f( x , u , t ) or f_batch( X , U , t )
+        
+        integration_method:
+        'euler'    : explicit Euler                 ( 1 evaluation of f )
+        'midpoint' : explicit midpoint              ( 2 evaluations of f )
+        'rk4'      : classical Runge-Kutta          ( 4 evaluations of f )
+        'adaptive' : Bogacki-Shampine 3(2) sub-steps with error control,
+                     see integration_tol
+        
+        """
+        
+        method = self.integration_method
+        
+        if method == 'euler':
+            
+            return f( x , u , t ) * dt + x
+        
+        elif method == 'midpoint':
+            
+            k1 = f( x , u , t )
+            k2 = f( x + 0.5 * dt * k1 , u , t + 0.5 * dt )
+            
+            return k2 * dt + x
+        
+        elif method == 'rk4':
+            
+            k1 = f( x , u , t )
+            k2 = f( x + 0.5 * dt * k1 , u , t + 0.5 * dt )
+            k3 = f( x + 0.5 * dt * k2 , u , t + 0.5 * dt )
+            k4 = f( x + dt * k3 , u , t + dt )
+            
+            return ( k1 + 2 * k2 + 2 * k3 + k4 ) * dt / 6 + x
+        
+        elif method == 'adaptive':
+            
+            return self.adaptive_step( f , x , u , t , dt )
+        
+        else:
+            
+            raise ValueError('Unknown integration method: ' + str( method ) )
+            
+            
+    #############################
+    def adaptive_step( self , f , x , u , t , dt ):
+        """ 
+        Bogacki-Shampine 3(2) integration over dt with adaptive sub-steps
+        ------------------------------------------------------------------
+        With a batch of states, all rows share the same sub-steps and the
+        error is the largest error of all rows
+        
+        """
+        
+        elapsed = 0.
+        h       = dt
+        
+        while True:
+            
+            k1 = f( x , u , t + elapsed )
+            k2 = f( x + 0.50 * h * k1 , u , t + elapsed + 0.50 * h )
+            k3 = f( x + 0.75 * h * k2 , u , t + elapsed + 0.75 * h )
+            
+            x_new = x + h * ( 2 * k1 + 3 * k2 + 4 * k3 ) / 9
+            
+            k4 = f( x_new , u , t + elapsed + h )
+            
+            # Difference with the embedded 2nd order solution
+            error = h * ( -5 * k1 / 72 + k2 / 12 + k3 / 9 - k4 / 8 )
+            scale = self.integration_tol * ( 1 + np.abs( x_new ) )
+            ratio = np.max( np.abs( error ) / scale )
+            
+            if ratio <= 1 or abs( h ) <= self.integration_min_dt :
+                
+                # Accepted sub-step
+                x       = x_new
+                elapsed = elapsed + h
+                
+                remaining = dt - elapsed
+                
+                if abs( remaining ) <= 1E-12 * abs( dt ):
+                    return x
+                
+                # Larger next sub-step, without going past dt
+                h = h * min( 4. , 0.9 * max( ratio , 1E-6 ) ** ( -1. / 3 ) )
+                h = np.sign( dt ) * min( abs( h ) , abs( remaining ) )
+                
+            else:
+                
+                # Rejected sub-step
+                h = h * max( 0.2 , 0.9 * ratio ** ( -1. / 3 ) )
+        
         
     #############################
     def x_next( self , x , u , t , dt = 0.1 , steps = 1 ):
         """ 
         Discrete time foward dynamics evaluation 
         -------------------------------------
-        - using Euler integration
+        - using the integration_method of the system ( default: Euler )
         
         """
         
@@ -240,13 +516,39 @@ class ContinuousDynamicSystem:
         # Multiple integration steps
         for i in range(steps):
         
-            x_next = self.f(x,u,t) * dt + x
+            x_next = self.integration_step( self.f , x , u , t , dt )
             
             # Multiple steps
             x =  x_next
-        
+            t =  t + dt
+
         return x_next
-    
+
+
+    #############################
+    def x_next_batch( self , X , U , t = 0 , dt = 0.1 , steps = 1 ):
+        """
+        Batched discrete time foward dynamics evaluation
+        -------------------------------------
+        - using the integration_method of the system ( default: Euler )
+
+        X  : array of state vectors   N x n
+        U  : array of input vectors   N x m
+
+        """
+
+        X_next = np.atleast_2d( X )
+        U      = np.atleast_2d( U )
+
+        # Multiple integration steps
+        for i in range(steps):
+
+            X_next = self.integration_step( self.f_batch , X_next , U , t , dt )
+            
+            t = t + dt
+
+        return X_next
+
     
     ###########################################################################
     # Quick Analysis Shorcuts
@@ -375,6 +677,159 @@ class ContinuousDynamicSystem:
         self.ani.animate_simulation( time_factor_video , is_3d, save , file_name )
 
 
+'''
+###############################################################################
+'''
+
+
+class LinearDynamicSystem( ContinuousDynamicSystem ):
+    """ 
+    Linear time invariant continuous dynamical systems
+    ---------------------------------------------------
+    dx = A x + B u
+    y  = C x + D u
+    ---------------------------------------
+    With integration_method = 'exact' ( opt-in, default is Euler as for 
+    all systems ), x_next is exact for inputs constant over dt ( zero-order
+    hold ), using the matrix exponential. Discretized matrices are cached 
+    for each dt.
+    
+    """
+    
+    ############################
+    def __init__(self, n = 1, m = 1, p = 1):
+        """ """
+        
+        ContinuousDynamicSystem.__init__( self , n , m , p )
+        
+        # Default matrices
+        self.A = np.zeros(( n , n ))
+        self.B = np.zeros(( n , m ))
+        self.C = np.zeros(( p , n ))
+        self.D = np.zeros(( p , m ))
+        
+        # Exact discretization, used with integration_method = 'exact'
+        self.discrete_matrices = {}
+        
+        
+    #############################
+    def f( self , x , u , t = 0 ):
+        """ dx = A x + B u """
+        
+        dx = np.dot( self.A , x ) + np.dot( self.B , u )
+        
+        return dx
+    
+    
+    #############################
+    def h( self , x , u , t = 0 ):
+        """ y = C x + D u """
+        
+        y = np.dot( self.C , x ) + np.dot( self.D , u )
+        
+        return y
+    
+    
+    #############################
+    def f_batch( self , X , U , t = 0 ):
+        """ Vectorized foward dynamics: X is N x n, U is N x m """
+        
+        return np.dot( np.atleast_2d( X ) , self.A.T ) + np.dot( np.atleast_2d( U ) , self.B.T )
+    
+    
+    #############################
+    def h_batch( self , X , U , t = 0 ):
+        """ Vectorized output: X is N x n, U is N x m """
+        
+        return np.dot( np.atleast_2d( X ) , self.C.T ) + np.dot( np.atleast_2d( U ) , self.D.T )
+    
+    
+    #############################
+    def jacobian_x( self , x , u , t = 0 ):
+        """ df/dx = A """
+        
+        return self.A
+    
+    
+    #############################
+    def jacobian_u( self , x , u , t = 0 ):
+        """ df/du = B """
+        
+        return self.B
+    
+    
+    #############################
+    def discretize( self , dt ):
+        """ 
+        Discrete time matrices x[k+1] = Ad x[k] + Bd u[k] 
+        --------------------------------------------------
+        exp( [ A B ; 0 0 ] dt ) = [ Ad Bd ; 0 I ], cached for each dt and
+        computed again if A or B were modified
+        
+        """
+        
+        key = float( dt )
+        
+        if key in self.discrete_matrices:
+            
+            A , B , Ad , Bd = self.discrete_matrices[ key ]
+            
+            if np.array_equal( A , self.A ) and np.array_equal( B , self.B ):
+                return Ad , Bd
+            
+        M = np.zeros(( self.n + self.m , self.n + self.m ))
+        
+        M[ : self.n , : self.n ] = self.A
+        M[ : self.n , self.n : ] = self.B
+        
+        Md = linalg.expm( M * dt )
+        
+        Ad = Md[ : self.n , : self.n ]
+        Bd = Md[ : self.n , self.n : ]
+        
+        self.discrete_matrices[ key ] = ( self.A.copy() , self.B.copy() , Ad , Bd )
+        
+        return Ad , Bd
+    
+    
+    #############################
+    def x_next( self , x , u , t , dt = 0.1 , steps = 1 ):
+        """ 
+        Discrete time foward dynamics evaluation 
+        -------------------------------------
+        - exact with integration_method = 'exact' ( u constant during 
+          the steps ), otherwise same as ContinuousDynamicSystem
+        
+        """
+        
+        if not self.integration_method == 'exact':
+            return ContinuousDynamicSystem.x_next( self , x , u , t , dt , steps )
+        
+        # All steps at once
+        Ad , Bd = self.discretize( dt * steps )
+        
+        return np.dot( Ad , x ) + np.dot( Bd , u )
+    
+    
+    #############################
+    def x_next_batch( self , X , U , t = 0 , dt = 0.1 , steps = 1 ):
+        """
+        Batched discrete time foward dynamics evaluation
+        -------------------------------------
+        - exact with integration_method = 'exact' ( U constant during 
+          the steps ), otherwise same as ContinuousDynamicSystem
+
+        """
+        
+        if not self.integration_method == 'exact':
+            return ContinuousDynamicSystem.x_next_batch( self , X , U , t , dt , steps )
+        
+        Ad , Bd = self.discretize( dt * steps )
+        
+        return np.dot( np.atleast_2d( X ) , Ad.T ) + np.dot( np.atleast_2d( U ) , Bd.T )
+        
+        
+        
 '''
 #################################################################
 ##################          Main                         ########
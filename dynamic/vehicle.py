@@ -10,6 +10,7 @@ import matplotlib.pyplot as plt
 import matplotlib.animation as animation
 
 from pyro.dynamic import system
+from pyro.dynamic import obstaclemap
 from pyro.analysis import graphical
 
 
@@ -82,6 +83,45 @@ class KinematicBicyleModel( system.ContinuousDynamicSystem ):
         dx[2] = u[0] * np.tan( u[1] ) * ( 1. / self.lenght) 
         
         return dx
+
+
+    #############################
+    def f_batch(self, X , U , t = 0 ):
+        """ Vectorized foward dynamics: X is N x n, U is N x m """
+
+        dX = np.zeros(( X.shape[0] , self.n ))
+
+        dX[:,0] = U[:,0] * np.cos( X[:,2] )
+        dX[:,1] = U[:,0] * np.sin( X[:,2] )
+        dX[:,2] = U[:,0] * np.tan( U[:,1] ) * ( 1. / self.lenght)
+
+        return dX
+
+
+    #############################
+    def jacobian_x(self, x , u , t = 0 ):
+        """ Analytic df/dx : n x n """
+
+        A = np.zeros(( self.n , self.n ))
+
+        A[0,2] = - u[0] * np.sin( x[2] )
+        A[1,2] =   u[0] * np.cos( x[2] )
+
+        return A
+
+
+    #############################
+    def jacobian_u(self, x , u , t = 0 ):
+        """ Analytic df/du : n x m """
+
+        B = np.zeros(( self.n , self.m ))
+
+        B[0,0] = np.cos( x[2] )
+        B[1,0] = np.sin( x[2] )
+        B[2,0] = np.tan( u[1] ) * ( 1. / self.lenght)
+        B[2,1] = u[0] * ( 1. / np.cos( u[1] ) ** 2 ) * ( 1. / self.lenght)
+
+        return B
     
     
     ###########################################################################
@@ -242,6 +282,29 @@ class HolonomicMobileRobot( system.ContinuousDynamicSystem ):
         dx[1] = u[1] 
         
         return dx
+
+
+    #############################
+    def f_batch(self, X , U , t = 0 ):
+        """ Vectorized foward dynamics: X is N x n, U is N x m """
+
+        dX = np.array( U[:,0:2] , dtype = float )
+
+        return dX
+
+
+    #############################
+    def jacobian_x(self, x , u , t = 0 ):
+        """ Analytic df/dx : n x n """
+
+        return np.zeros(( self.n , self.n ))
+
+
+    #############################
+    def jacobian_u(self, x , u , t = 0 ):
+        """ Analytic df/du : n x m """
+
+        return np.eye( self.n , self.m )
     
     
     ###########################################################################
@@ -335,25 +398,69 @@ class HolonomicMobileRobotwithObstacles( HolonomicMobileRobot ):
                 [ (-8,-8),(-1,8)]
                 ]
         
+        # Rasterized obstacles: rectangles [ lower , upper ] or polygons
+        self.obstacle_map_resolution = 0.05
+        self.obstacle_map            = None
+        self.obstacle_map_obstacles  = None  # obstacles list of the map
+        self.obstacle_map_key        = None  # resolution and bounds of the map
+        
+    #############################
+    def get_obstacle_map(self):
+        """ 
+        Rasterized obstacles
+        ---------------------------------------------------------------
+        Computed again if the obstacles list is replaced or if the domain
+        bounds or the resolution are modified. Call invalidate_obstacle_map()
+        after modifying the obstacles list in place.
+        
+        """
+        
+        key = ( self.obstacle_map_resolution , 
+                tuple( self.x_lb[:2] ) , tuple( self.x_ub[:2] ) )
+        
+        if ( self.obstacle_map is None or 
+             self.obstacle_map_obstacles is not self.obstacles or
+             self.obstacle_map_key != key ):
+            
+            self.obstacle_map = obstaclemap.rasterize( self.obstacles , 
+                                                       self.x_lb , 
+                                                       self.x_ub ,
+                                                       self.obstacle_map_resolution )
+            
+            self.obstacle_map_obstacles = self.obstacles
+            self.obstacle_map_key       = key
+            
+        return self.obstacle_map
+    
+    #############################
+    def invalidate_obstacle_map(self):
+        """ Rasterize obstacles again at the next query """
+        
+        self.obstacle_map = None
+        
     #############################
     def isavalidstate(self , x ):
         """ check if x is in the state domain """
         
-        ans = False
+        ok = HolonomicMobileRobot.isavalidstate( self , x )
         
-        for i in range(self.n):
-            ans = ans or ( x[i] < self.x_lb[i] )
-            ans = ans or ( x[i] > self.x_ub[i] )
+        return ok and self.get_obstacle_map().isfree( x )
+    
+    #############################
+    def isavalidstate_batch(self , X ):
+        """ check if each row of X ( N x n ) is in the state domain """
         
-        for obs in self.obstacles:
-            on_obs = (( x[0] > obs[0][0]) and  
-                      ( x[1] > obs[0][1]) and 
-                      ( x[0] < obs[1][0]) and 
-                      ( x[1] < obs[1][1]) )
-                     
-            ans = ans or on_obs
-            
-        return not(ans)
+        X  = np.atleast_2d( X )
+        
+        ok = HolonomicMobileRobot.isavalidstate_batch( self , X )
+        
+        return ok & self.get_obstacle_map().isfree_batch( X )
+    
+    #############################
+    def clearance_batch(self , X ):
+        """ signed distance to the nearest obstacle of each row of X [m] """
+        
+        return self.get_obstacle_map().clearance_batch( X )
         
        
     ###########################################################################
@@ -395,6 +502,18 @@ class HolonomicMobileRobotwithObstacles( HolonomicMobileRobot ):
         
         for obs in self.obstacles:
             
+            # Polygon: closed line through all vertices
+            if len( obs ) > 2:
+                
+                pts = np.zeros(( len( obs ) + 1 , 3 ))
+                
+                pts[:-1,0:2] = obs
+                pts[-1,0:2]  = obs[0]
+                
+                lines_pts.append( pts )
+                
+                continue
+            
             pts = np.zeros((5,3))
             
             pts[0,0] = obs[0][0]
@@ -42,7 +42,6 @@ planner.goal_radius          = 0.8
 planner.dt                   = 0.1
 planner.max_nodes            = 12000
 planner.max_solution_time    = 8
-planner.max_distance_compute = 500
 
 planner.dyna_plot            = False
 
@@ -6,6 +6,7 @@ Created on Wed Jul 12 10:02:12 2017
 """
 
 import numpy as np
+from scipy import sparse
 
 '''
 ################################################################################
@@ -13,7 +14,7 @@ import numpy as np
 
 
 class GridDynamicSystem:
-    """ Create a discrete gird state-action space for a 2D continous dynamic system, one continuous input u """
+    """ Create a discrete gird state-action space for a n-D continous dynamic system, m continuous inputs u """
     
     ############################
     def __init__(self, sys , xgriddim = ( 101 , 101 ), ugriddim = ( 11 , 1 ) , dt = 0.05 ):
@@ -31,6 +32,8 @@ class GridDynamicSystem:
         
         # Options
         self.uselookuptable = True
+        self.usesparsematrices = True # interpolation weights transition matrices
+        self.chunksize      = None # max number of nodes per batch (None = all)
         
         self.compute()  
         
@@ -49,9 +52,14 @@ class GridDynamicSystem:
         self.generate_nodes()
         self.generate_actions()
         
+        self.transition_matrices = None
+        
         if self.uselookuptable:
             self.compute_lookuptable()
             
+            if self.usesparsematrices:
+                self.compute_transition_matrices()
+            
         
     #############################
     def discretizespace(self):
@@ -60,18 +68,31 @@ class GridDynamicSystem:
         self.xd       = []
         self.nodes_n  = 1
         
-        # n-D grid
-        self.x_grid2node    = np.zeros( self.xgriddim , dtype = int )     # grid of corresponding index
-        
         # linespace for each x-axis and total number of nodes
         for i in range(self.sys.n):
             self.xd.append(  np.linspace( self.sys.x_lb[i]  , self.sys.x_ub[i]  , self.xgriddim[i]  ) )
             self.nodes_n        = self.nodes_n * self.xgriddim[i]
         
+        # n-D grid of corresponding node index
+        self.x_grid2node    = np.arange( self.nodes_n ).reshape( self.xgriddim[:self.sys.n] )
+        
         # 1-D List of nodes
         self.nodes_state    = np.zeros(( self.nodes_n , self.sys.n ), dtype = float )  # Number of nodes x state dimensions
         self.nodes_index    = np.zeros(( self.nodes_n , self.sys.n ), dtype = int   )  # Number of nodes x state dimensions
         
+        # Interpolation data: grid origin, spacing and node number strides
+        dims = np.array( self.xgriddim[:self.sys.n] , dtype = int )
+        
+        self.x_origin  = np.array([ xd[0] for xd in self.xd ] , dtype = float )
+        self.x_step    = np.array([ ( xd[-1] - xd[0] ) / max( xd.size - 1 , 1 ) for xd in self.xd ] , dtype = float )
+        self.x_step[ dims == 1 ] = np.inf # single node axis: always weight 0 on the upper corner
+        self.x_imax    = np.maximum( dims - 2 , 0 ) # max index of lower cell corners
+        self.x_strides = np.append( np.cumprod( dims[::-1] )[::-1][1:] , 1 )
+        
+        # All 2^n corners of a cell and their node number offsets
+        self.corners        = np.indices( ( 2 , ) * self.sys.n ).reshape( self.sys.n , -1 ).T
+        self.corner_offsets = self.corners.dot( self.x_strides * ( dims > 1 ) )
+        
         
     #############################
     def discretizeactions(self):
@@ -94,91 +115,63 @@ class GridDynamicSystem:
     def generate_nodes(self):
         """ Compute 1-D list of nodes """
         
-        # For all state nodes
-        node = 0
+        # Grid index of all nodes, last dimension varies fastest
+        self.nodes_index[:,:] = np.indices( self.xgriddim[:self.sys.n] ).reshape( self.sys.n , -1 ).T
         
-        if self.sys.n == 2 :
-            
-            for i in range(self.xgriddim[0]):
-                for j in range(self.xgriddim[1]):
-                    
-                    # State
-                    x = np.array([ self.xd[0][i]  ,  self.xd[1][j] ])
-                    
-                    # State and grid index based on node #
-                    self.nodes_state[node,:] = x
-                    self.nodes_index[node,:] = np.array([i,j])
-                    
-                    # Node # based on index ij
-                    self.x_grid2node[i,j]    = node
-    
-                    # Increment node number
-                    node = node + 1
-                    
-                    
-        elif self.sys.n == 3:
-            
-            for i in range(self.xgriddim[0]):
-                for j in range(self.xgriddim[1]):
-                    for k in range(self.xgriddim[2]):
-                    
-                        # State
-                        x = np.array([ self.xd[0][i]  ,  self.xd[1][j]  , self.xd[2][k] ])
-                        
-                        # State and grid index based on node #
-                        self.nodes_state[node,:] = x
-                        self.nodes_index[node,:] = np.array([i,j,k])
-                        
-                        # Node # based on index ijk
-                        self.x_grid2node[i,j,k]    = node
-        
-                        # Increment node number
-                        node = node + 1
-                    
-        else:
-            
-            raise NotImplementedError
+        # State of all nodes
+        for i in range(self.sys.n):
+            self.nodes_state[:,i] = self.xd[i][ self.nodes_index[:,i] ]
             
                 
     ##############################
     def generate_actions(self):
         """ Compute 1-D list of actions """
         
-        # For all state nodes
-        action = 0
+        # Grid index of all actions, last dimension varies fastest
+        self.actions_index[:,:] = np.indices( self.ugriddim[:self.sys.m] ).reshape( self.sys.m , -1 ).T
         
-        # Single input
+        # Input of all actions
+        for i in range(self.sys.m):
+            self.actions_input[:,i] = self.ud[i][ self.actions_index[:,i] ]
+            
+            
+    ##############################
+    def index2node(self, index ):
+        """ Node number(s) from grid index array ( N x n ) """
         
-        if self.sys.m == 1 :
+        index = np.atleast_2d( index )
         
-            for k in range(self.ugriddim[0]):
-                    
-                u = np.array([ self.ud[0][k] ])
-                
-                # State and grid index based on node #
-                self.actions_input[action,:] = u
-                self.actions_index[action,:] = k
+        return np.ravel_multi_index( index.T , self.xgriddim[:self.sys.n] )
     
-                # Increment node number
-                action = action + 1
-                
-        elif self.sys.m == 2 :
-            
-            for k in range(self.ugriddim[0]):
-                for l in range(self.ugriddim[1]):
-                    
-                    u = np.array([ self.ud[0][k] , self.ud[1][l] ])
-                    
-                    # State and grid index based on node #
-                    self.actions_input[action,:] = u
-                    self.actions_index[action,:] = np.array([k,l])
-        
-                    # Increment node number
-                    action = action + 1
-        
-        else:
-            
-            raise NotImplementedError
+    
+    ##############################
+    def compute_interpolation_stencil(self, x ):
+        """ 
+        Multilinear interpolation stencil on the regular state grid
+        ------------------------------------------------------------
+        x : array of states   N x n
+        
+        return nodes ( N x 2^n ) , weights ( N x 2^n ) such that the
+        interpolated value of a grid function v is sum( v[nodes] * weights )
+        
+        States outside the grid are projected on the grid boundary
+        
+        """
+        
+        x = np.atleast_2d( x )
+        
+        # Lower corner index and weight of upper corner along each axis
+        pos = ( x - self.x_origin ) / self.x_step
+        
+        i0 = np.clip( np.floor( pos ) , 0 , self.x_imax ).astype( int )
+        w1 = np.clip( pos - i0 , 0 , 1 )
+        
+        # All 2^n corners of the cell
+        nodes   = i0.dot( self.x_strides )[:,None] + self.corner_offsets
+        
+        weights = np.prod( np.where( self.corners == 1 , w1[:,None,:] , 1 - w1[:,None,:] ) , axis = 2 )
+        
+        return nodes , weights
             
             
     ##############################
@@ -190,25 +183,85 @@ class GridDynamicSystem:
             self.action_isok   = np.zeros( ( self.nodes_n , self.actions_n ) , dtype = bool )
             self.x_next        = np.zeros( ( self.nodes_n , self.actions_n , self.sys.n ) , dtype = float ) # lookup table for dynamic
             
-            # For all state nodes        
-            for node in range( self.nodes_n ):  
+            # Bounded number of nodes evaluated at once
+            if self.chunksize is None:
+                chunksize = self.nodes_n
+            else:
+                chunksize = self.chunksize
+            
+            # For all chunk of state nodes
+            for first in range( 0 , self.nodes_n , chunksize ):
                 
-                    x = self.nodes_state[ node , : ]
+                nodes = slice( first , min( first + chunksize , self.nodes_n ) )
                 
-                    # For all control actions
-                    for action in range( self.actions_n ):
-                        
-                        u = self.actions_input[ action , : ]
-                        
-                        # Compute next state for all inputs
-                        x_next = self.sys.f( x , u ) * self.dt + x
-                        
-                        # validity of the options
-                        x_ok = self.sys.isavalidstate(x_next)
-                        u_ok = self.sys.isavalidinput(x,u)
-                        
-                        self.x_next[ node,  action, : ] = x_next
-                        self.action_isok[ node, action]        = ( u_ok & x_ok )
+                x_next , action_isok = self.compute_transitions( self.nodes_state[ nodes , : ] )
+                
+                self.x_next[ nodes , : , : ]   = x_next
+                self.action_isok[ nodes , : ]  = action_isok
+                
+                
+    ##############################
+    def compute_transition_matrices(self):
+        """ 
+        Precompute interpolation weights of next states for each action
+        ----------------------------------------------------------------
+        transition_matrices[action] is a sparse nodes_n x nodes_n matrix T
+        such that the interpolated value of a grid function v at the next
+        state of all nodes is T * v ( zero rows for non-valid actions )
+        
+        """
+        
+        # Stencil of all node-action pairs
+        stencil , weights = self.compute_interpolation_stencil( self.x_next.reshape( -1 , self.sys.n ) )
+        
+        self.x_next_stencil = stencil.reshape( self.nodes_n , self.actions_n , -1 )
+        self.x_next_weights = weights.reshape( self.nodes_n , self.actions_n , -1 )
+        
+        # Non-valid actions have no successor
+        self.x_next_weights[ ~self.action_isok ] = 0
+        
+        rows = np.repeat( np.arange( self.nodes_n ) , self.x_next_stencil.shape[2] )
+        
+        self.transition_matrices = []
+        
+        # For all control actions
+        for action in range( self.actions_n ):
+            
+            T = sparse.csr_matrix( ( self.x_next_weights[ : , action , : ].ravel() ,
+                                   ( rows , self.x_next_stencil[ : , action , : ].ravel() ) ) ,
+                                   shape = ( self.nodes_n , self.nodes_n ) )
+            
+            self.transition_matrices.append( T )
+                
+                
+    ##############################
+    def compute_transitions(self, x ):
+        """ 
+        Compute next states and validity of all actions for a set of nodes
+        ------------------------------------------------------------------
+        x : array of states   nodes x n
+        
+        return x_next ( nodes x actions x n ) , action_isok ( nodes x actions )
+        
+        """
+        
+        nodes_n = x.shape[0]
+        
+        # All node-action pairs
+        X = np.repeat( x , self.actions_n , axis = 0 )
+        U = np.tile( self.actions_input , ( nodes_n , 1 ) )
+        
+        # Compute next state for all inputs ( integration_method of sys )
+        X_next = self.sys.x_next_batch( X , U , 0 , self.dt )
+        
+        # validity of the options
+        x_ok = self.sys.isavalidstate_batch( X_next )
+        u_ok = self.sys.isavalidinput_batch( X , U )
+        
+        x_next      = X_next.reshape( nodes_n , self.actions_n , self.sys.n )
+        action_isok = ( u_ok & x_ok ).reshape( nodes_n , self.actions_n )
+        
+        return x_next , action_isok
                 
                 
                 
@@ -235,96 +288,19 @@ class GridDynamicSystem3D(GridDynamicSystem):
         self.u0_n  = u_n      # u0 discretization
         self.u1_n  = u_n
         
-        # Options
-        self.uselookuptable = False # Too Big
-        
-        self.compute()  
-            
-        
-    #############################
-    def discretizespace(self):
-        """ Grid the state space """
-        
-        # Grid
+        # Grid size
         self.xgriddim = ( self.x0_n , self.x1_n , self.x2_n )
-                
-        self.xd       = [ None , None , None ]
-        self.xd[0]    = np.linspace( self.sys.x_lb[0]  , self.sys.x_ub[0]  , self.x0_n  )
-        self.xd[1]    = np.linspace( self.sys.x_lb[1]  , self.sys.x_ub[1]  , self.x1_n  )
-        self.xd[2]    = np.linspace( self.sys.x_lb[2]  , self.sys.x_ub[2]  , self.x2_n  )
-        
-        self.x_grid2node    = np.zeros( ( self.x0_n , self.x1_n , self.x2_n ) , dtype = int )     # grid of corresponding index
-        
-        # 1-D List of nodes
-        self.nodes_n        = self.x0_n * self.x1_n * self.x2_n
-        self.nodes_state    = np.zeros(( self.nodes_n , self.sys.n ), dtype = float )  # Number of nodes x state dimensions
-        self.nodes_index    = np.zeros(( self.nodes_n , self.sys.n ), dtype = int   )  # Number of nodes x state dimensions
-        
-        
-    #############################
-    def discretizeactions(self):
-        """ Grid the action space """
-        
-        # Grid
         self.ugriddim = ( self.u0_n , self.u1_n )
         
-        self.ud       = [ None , None ]        
-        self.ud[0]    = np.linspace( self.sys.u_lb[0]  , self.sys.u_ub[0]  , self.u0_n  )
-        self.ud[1]    = np.linspace( self.sys.u_lb[1]  , self.sys.u_ub[1]  , self.u1_n  )
-        
-        # 1-D List of actions
-        self.actions_n         =   self.u0_n * self.u1_n
-        self.actions_input     =   np.zeros(( self.actions_n , self.sys.m ), dtype = float )  # Number of actions x inputs dimensions
-        self.actions_index     =   np.zeros(( self.actions_n , self.sys.m ), dtype = int   )  # Number of actions x inputs dimensions
-        
-        
-    ##############################
-    def generate_nodes(self):
-        """ Compute 1-D list of nodes """
-        
-        # For all state nodes
-        node = 0
-        
-        for i in range(self.x0_n):
-            for j in range(self.x1_n):
-                for k in range(self.x2_n):
-                
-                    # State
-                    x = np.array([ self.xd[0][i]  ,  self.xd[1][j]  , self.xd[2][k] ])
-                    
-                    # State and grid index based on node #
-                    self.nodes_state[node,:] = x
-                    self.nodes_index[node,:] = np.array([i,j,k])
-                    
-                    # Node # based on index ijk
-                    self.x_grid2node[i,j,k]    = node
-    
-                    # Increment node number
-                    node = node + 1
-                
-                
-    ##############################
-    def generate_actions(self):
-        """ Compute 1-D list of actions """
-        
-        # For all state nodes
-        action = 0
+        # Options
+        self.uselookuptable = False # Too Big
+        self.usesparsematrices = False
+        self.chunksize      = None  # max number of nodes per batch (None = all)
         
-        for l in range(self.u0_n):
-            for m in range(self.u1_n):
-                
-                u = np.array([ self.ud[0][l] , self.ud[1][m] ])
-                
-                # State and grid index based on node #
-                self.actions_input[action,:] = u
-                self.actions_index[action,:] = np.array([l,m])
-    
-                # Increment node number
-                action = action + 1
+        self.compute()  
                 
 
 
-
 '''
 #################################################################
 ##################          Main                         ########
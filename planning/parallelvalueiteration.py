@@ -0,0 +1,445 @@
+# -*- coding: utf-8 -*-
+"""
+Value iteration with Bellman sweeps distributed on worker processes
+"""
+
+import os
+import weakref
+import threading
+import multiprocessing
+from multiprocessing import connection
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from pyro.planning import valueiteration
+
+
+'''
+################################################################################
+'''
+
+
+def shared_array( shape , dtype ):
+    """ Numpy array in a new shared memory block, return block and array """
+
+    nbytes = max( int( np.prod( shape ) ) * np.dtype( dtype ).itemsize , 1 )
+
+    shm   = shared_memory.SharedMemory( create = True , size = nbytes )
+    array = np.ndarray( shape , dtype = dtype , buffer = shm.buf )
+
+    return shm , array
+
+
+###############################
+def sweep_worker( vi , nodes , names , barrier , stop , gamma , parity ):
+    """
+    Worker process: Bellman backup of a slice of nodes at each sweep
+    -----------------------------------------------------------------
+    vi     : value iteration object ( inherited by fork, never pickled )
+    nodes  : slice of nodes of this worker
+    names  : names of shared memory blocks of the two cost-to-go buffers
+             and of the policy
+    parity : index of the buffer holding J, Jnew is written in the other
+
+    Any exception aborts the barrier so that the parent process and the
+    other workers stop waiting for this worker
+
+    """
+
+    nodes_n = vi.grid_sys.nodes_n
+
+    blocks = [ shared_memory.SharedMemory( name = name ) for name in names ]
+
+    J_buffers = [ np.ndarray( nodes_n , dtype = float , buffer = blocks[0].buf ) ,
+                  np.ndarray( nodes_n , dtype = float , buffer = blocks[1].buf ) ]
+    policy_1D = np.ndarray( nodes_n , dtype = int   , buffer = blocks[2].buf )
+
+    # Bounded number of nodes evaluated at once
+    if vi.grid_sys.chunksize is not None:
+        chunksize = vi.grid_sys.chunksize
+    else:
+        chunksize = nodes.stop - nodes.start
+
+    try:
+
+        while True:
+
+            # Wait for the start of a sweep
+            barrier.wait()
+
+            if stop.value:
+                break
+
+            vi.gamma = gamma.value
+
+            J_1D    = J_buffers[ parity.value ]
+            Jnew_1D = J_buffers[ 1 - parity.value ]
+
+            for first in range( nodes.start , nodes.stop , chunksize ):
+
+                chunk = slice( first , min( first + chunksize , nodes.stop ) )
+
+                Jnew_1D[ chunk ] , policy_1D[ chunk ] = vi.compute_backup( chunk , J_1D )
+
+            # Sweep completed
+            barrier.wait()
+
+    except threading.BrokenBarrierError:
+
+        # Aborted by the parent process or by another worker
+        pass
+
+    except BaseException:
+
+        barrier.abort()
+
+        raise
+
+    finally:
+
+        J_1D = Jnew_1D = None
+
+        del J_buffers , policy_1D
+
+        for block in blocks:
+            block.close()
+
+
+###############################
+def watch_workers( processes , barrier , closing ):
+    """
+    Parent thread: abort the barrier if a worker process exits before
+    close(), e.g. killed, so that the parent never waits for it forever
+
+    """
+
+    sentinels = [ process.sentinel for process in processes ]
+
+    while not closing.is_set():
+
+        if connection.wait( sentinels , timeout = 0.1 ):
+
+            if not closing.is_set():
+                barrier.abort()
+
+            return
+
+
+###############################
+def release_workers( processes , barrier , stop , closing , blocks ):
+    """
+    Stop worker processes and unlink shared memory blocks
+    ------------------------------------------------------
+    Used as finalizer of ParallelValueIterationND: called by close(),
+    when the object is garbage collected or at interpreter exit
+
+    """
+
+    closing.set()
+
+    stop.value = 1
+
+    try:
+        barrier.wait( timeout = 10 )
+    except threading.BrokenBarrierError:
+        # Workers that are not waiting at the barrier are stopped
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    for process in processes:
+        process.join()
+
+    for shm in blocks:
+
+        shm.unlink()
+
+        try:
+            shm.close()
+        except BufferError:
+            # Arrays of the object still alive, unmapped when they are
+            pass
+
+
+'''
+################################################################################
+'''
+
+
+class ParallelValueIterationND( valueiteration.ValueIterationND ):
+    """
+    Value iteration with Bellman sweeps distributed on worker processes
+    --------------------------------------------------------------------
+    Nodes are partitioned in contiguous slices, one per worker. J, Jnew and
+    the policy live in shared memory and workers are synchronized with a
+    barrier at each sweep. Workers are forked once: lookup tables and stage
+    costs are shared read-only with the parent process without any copy.
+
+    J and Jnew are two shared buffers read and written in place by the
+    workers, their roles are swapped after each sweep without any copy.
+
+    Workers only pay off with one physical core per worker: on a single
+    core they add the synchronization overhead ( 201 x 201 robot grid, 
+    200 sweeps: 2.8 s serial, 4.9 s with 2 workers ).
+
+    Workers and shared memory are released by close(), which is called at
+    the end of solve() and compute_steps(), when the object is garbage
+    collected or at interpreter exit. A failed worker raises RuntimeError
+    in the parent process, as well as a sweep longer than timeout.
+
+    """
+
+    ############################
+    def __init__(self, grid_sys , cost_function , workers = None ):
+
+        valueiteration.ValueIterationND.__init__( self , grid_sys , cost_function )
+
+        # Number of worker processes
+        if workers is None:
+            workers = os.cpu_count()
+
+        self.workers = workers
+
+        # Max duration of a sweep [sec], None = no limit
+        self.timeout = None
+
+        self.processes = []
+
+
+    ##############################
+    def initialize(self):
+        """ initialize cost-to-go and policy """
+
+        self.close()
+
+        valueiteration.ValueIterationND.initialize( self )
+
+
+    ##############################
+    def parallel_available(self):
+        """ check if sweeps can be distributed on worker processes """
+
+        fork = 'fork' in multiprocessing.get_all_start_methods()
+
+        return fork and ( self.workers > 1 )
+
+
+    ##############################
+    def start_workers(self):
+        """ allocate shared memory and fork worker processes """
+
+        nodes_n = self.grid_sys.nodes_n
+
+        shm_0 , J_0 = shared_array( nodes_n , float )
+        shm_1 , J_1 = shared_array( nodes_n , float )
+
+        self.shm_policy , self.policy_shared = shared_array( nodes_n , int )
+
+        self.shm_J     = ( shm_0 , shm_1 )
+        self.J_buffers = ( J_0.reshape( self.griddim ) , J_1.reshape( self.griddim ) )
+
+        names = ( shm_0.name , shm_1.name , self.shm_policy.name )
+
+        context = multiprocessing.get_context('fork')
+
+        self.barrier = context.Barrier( self.workers + 1 )
+        self.stop    = context.Value( 'b' , 0 )
+        self.gamma_shared  = context.Value( 'd' , self.gamma )
+        self.parity_shared = context.Value( 'i' , 0 )
+
+        # Contiguous slices of nodes
+        bounds = np.linspace( 0 , nodes_n , self.workers + 1 ).astype( int )
+
+        self.processes = []
+
+        for i in range( self.workers ):
+
+            nodes = slice( bounds[i] , bounds[i+1] )
+
+            process = context.Process( target = sweep_worker ,
+                                       args = ( self , nodes , names ,
+                                                self.barrier , self.stop ,
+                                                self.gamma_shared ,
+                                                self.parity_shared ) )
+            process.daemon = True
+            process.start()
+
+            self.processes.append( process )
+
+        # Workers exiting unexpectedly abort the barrier
+        self.closing = threading.Event()
+
+        self.watchdog = threading.Thread( target = watch_workers ,
+                                          args = ( self.processes ,
+                                                   self.barrier ,
+                                                   self.closing ) )
+        self.watchdog.daemon = True
+        self.watchdog.start()
+
+        # Release of workers and shared memory, even without close()
+        self.finalizer = weakref.finalize( self , release_workers ,
+                                           self.processes , self.barrier ,
+                                           self.stop , self.closing ,
+                                           self.shm_J + ( self.shm_policy , ) )
+
+
+    ##############################
+    def close(self):
+        """ stop worker processes and release shared memory """
+
+        if not self.processes:
+            return
+
+        # Results copied out, arrays must be released before their shared
+        # memory blocks
+        self.J             = np.array( self.J )
+        self.Jnew          = np.array( self.Jnew )
+        self.action_policy = np.array( self.action_policy )
+
+        del self.J_buffers , self.policy_shared
+
+        self.finalizer()
+
+        self.watchdog.join()
+
+        self.processes = []
+
+
+    ###############################
+    def compute_sweep(self, gauss_seidel = False ):
+        """
+        Bellman backup of all nodes, result in Jnew and action_policy
+        --------------------------------------------------------------
+        Jacobi sweeps are done in parallel, gauss_seidel sweeps are serial
+
+        """
+
+        if gauss_seidel or not self.parallel_available():
+
+            valueiteration.ValueIterationND.compute_sweep( self , gauss_seidel )
+
+            return
+
+        if not self.processes:
+            self.start_workers()
+
+        # J is copied in a shared buffer only if it was replaced since the
+        # last sweep ( e.g. first sweep or loaded data )
+        if self.J is self.J_buffers[0]:
+            k = 0
+        elif self.J is self.J_buffers[1]:
+            k = 1
+        else:
+            k = 0
+            self.J_buffers[0][:] = self.J
+            self.J = self.J_buffers[0]
+
+        self.parity_shared.value = k
+        self.gamma_shared.value  = self.gamma
+
+        # Start and wait for the end of the sweep
+        try:
+
+            self.barrier.wait( self.timeout )
+            self.barrier.wait( self.timeout )
+
+        except threading.BrokenBarrierError:
+
+            self.close()
+
+            raise RuntimeError('Parallel value iteration sweep failed: a worker'
+                               ' process raised, died or timed out')
+
+        self.Jnew          = self.J_buffers[ 1 - k ]
+        self.action_policy = self.policy_shared.reshape( self.griddim ).copy()
+
+
+    ###############################
+    def compute_step(self, gauss_seidel = False ):
+        """
+        One step of value iteration
+        ----------------------------
+        Parallel sweeps: J and Jnew buffers are swapped instead of copied
+
+        """
+
+        if gauss_seidel or not self.parallel_available():
+
+            return valueiteration.ValueIterationND.compute_step( self , gauss_seidel )
+
+        self.compute_sweep()
+
+        # Jacobi sweep: J is still the cost-to-go before the sweep
+        residual = self.compute_residual( self.J , self.Jnew )
+
+        self.J , self.Jnew = self.Jnew , self.J
+
+        return residual
+
+
+    ################################
+    def solve(self, tol = 1E-3 , max_iter = 1000 , gauss_seidel = False ):
+        """
+        Value iteration until convergence, worker processes are stopped
+        at the end
+
+        """
+
+        try:
+
+            residual_history = valueiteration.ValueIterationND.solve( self , tol ,
+                                                                     max_iter ,
+                                                                     gauss_seidel )
+
+        finally:
+
+            self.close()
+
+        return residual_history
+
+
+    ################################
+    def compute_steps(self, l = 50, plot = False):
+        """ compute number of step """
+
+        try:
+
+            valueiteration.ValueIterationND.compute_steps( self , l , plot )
+
+        finally:
+
+            self.close()
+
+
+
+'''
+#################################################################
+##################          Main                         ########
+#################################################################
+'''
+
+
+if __name__ == "__main__":
+    """ MAIN TEST """
+
+    from pyro.dynamic  import vehicle
+    from pyro.planning import discretizer
+    from pyro.analysis import costfunction
+
+    sys  = vehicle.HolonomicMobileRobotwithObstacles()
+
+    grid_sys = discretizer.GridDynamicSystem( sys , ( 101 , 101 ) , ( 3 , 3 ) )
+
+    cf = costfunction.TimeCostFunction( sys )
+
+    cf.INF = 10000
+    cf.EPS = 0.5
+
+    vi = ParallelValueIterationND( grid_sys , cf )
+
+    vi.initialize()
+    vi.solve( 0.1 , 1000 )
+    vi.assign_interpol_controller()
+    vi.plot_policy(0)
+    vi.plot_cost2go()
@@ -41,6 +41,16 @@ class OpenLoopController( controller.StaticController ) :
         u = self.trajectory.t2u( t )
         
         return u
+    
+    #############################
+    def c_batch( self , Y , R , t = 0 ):
+        """  U depends only on time, t is an array of N times """
+        
+        t = np.broadcast_to( t , np.atleast_2d( Y ).shape[0] )
+        
+        U = self.trajectory.t2u_batch( t )
+        
+        return U
         
 
 ###############################################################################
@@ -132,6 +142,31 @@ class Trajectory() :
             
         return u
     
+    ############################
+    def t2u_batch(self, t ):
+        """ get u from an array of N times ( N x m ) """
+        
+        t = np.asarray( t , dtype = float )
+        
+        if self.t_sol.size == 1:
+            
+            # Single time point: nearest index is always 0, as t2u
+            i = np.zeros( t.shape , dtype = int )
+            
+        else:
+            
+            # Nearest time index, lower one on ties as t2u
+            i  = np.clip( np.searchsorted( self.t_sol , t ) , 1 , self.t_sol.size - 1 )
+            lower = np.abs( t - self.t_sol[ i - 1 ] ) <= np.abs( self.t_sol[ i ] - t )
+            i  = np.where( lower , i - 1 , i )
+        
+        U = self.u_sol[ i , : ].copy()
+        
+        # Constant input after the end of the trajectory
+        U[ t >= self.time_final ] = self.ubar
+        
+        return U
+    
     ############################
     def t2x(self, t ):
         """ get x from time """
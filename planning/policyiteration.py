@@ -0,0 +1,364 @@
+# -*- coding: utf-8 -*-
+"""
+Policy iteration and modified policy iteration on a discretized system
+"""
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse import csgraph
+from scipy.sparse.linalg import spsolve
+
+from pyro.planning import valueiteration
+
+
+'''
+################################################################################
+'''
+
+
+class PolicyIteration( valueiteration.ValueIterationND ):
+    """
+    Policy iteration on a discretized continous dynamic system
+    -----------------------------------------------------------
+    Alternate exact policy evaluation ( sparse linear solve ) and greedy
+    policy improvement using the grid_sys lookup tables.
+
+    """
+
+    ############################
+    def __init__(self, grid_sys , cost_function ):
+
+        valueiteration.ValueIterationND.__init__( self , grid_sys , cost_function )
+
+        # Policy evaluation: None = sparse linear solve, k = number of sweeps
+        self.evaluation_sweeps = None
+        
+        # Value iteration sweeps used to build the initial policy
+        self.initial_sweeps    = 1
+
+
+    ##############################
+    def initialize(self):
+        """ initialize cost-to-go and greedy policy """
+        
+        if not self.sparse_transitions_available():
+            raise ValueError('Policy iteration requires the grid_sys lookup' +
+                             ' table and transition matrices')
+        
+        valueiteration.ValueIterationND.initialize( self )
+        
+        J_1D = self.J.reshape( -1 )
+        
+        # A few value iteration sweeps so that the initial policy
+        # leads toward low cost regions
+        for i in range( self.initial_sweeps ):
+            J_1D , policy = self.compute_sparse_backup( J_1D )
+        
+        # Greedy policy with respect to the initial cost-to-go
+        J_min , policy = self.compute_sparse_backup( J_1D )
+        
+        # Nodes with infinite cost still get an allowable action if one exist
+        missing = ( policy < 0 ) & self.grid_sys.action_isok.any( axis = 1 )
+        policy[ missing ] = self.grid_sys.action_isok[ missing ].argmax( axis = 1 )
+        
+        self.action_policy = policy.reshape( self.griddim )
+        
+        self.policy_changes = self.grid_sys.nodes_n
+        
+        
+    ##############################
+    def policy_transition_matrix(self, policy ):
+        """ Sparse nodes_n x nodes_n transition matrix of a policy """
+
+        nodes_n  = self.grid_sys.nodes_n
+        feasible = policy >= 0
+
+        nodes   = np.arange( nodes_n )[ feasible ]
+        actions = policy[ feasible ]
+
+        stencil = self.grid_sys.x_next_stencil[ nodes , actions , : ]
+        weights = self.grid_sys.x_next_weights[ nodes , actions , : ]
+
+        rows = np.repeat( nodes , stencil.shape[1] )
+
+        P = sparse.csr_matrix( ( weights.ravel() , ( rows , stencil.ravel() ) ),
+                               shape = ( nodes_n , nodes_n ) )
+
+        return P
+
+
+    ##############################
+    def policy_costs(self, policy ):
+        """ One step cost of each node for a policy """
+
+        g = np.zeros( self.grid_sys.nodes_n )
+
+        feasible = policy >= 0
+
+        g[ feasible ] = self.G[ feasible , policy[ feasible ] ]
+
+        return g
+
+
+    ##############################
+    def evaluate_policy(self):
+        """
+        Exact cost-to-go of the current policy
+        ----------------------------------------
+        Solve ( I - gamma P ) J = g on transient nodes. Without discount,
+        zero cost nodes that the policy never leaves are terminal with J = 0
+        and nodes that never reach a terminal node have an infinite cost.
+
+        """
+
+        nodes_n  = self.grid_sys.nodes_n
+        policy   = self.action_policy.reshape( -1 )
+        feasible = policy >= 0
+
+        P = self.policy_transition_matrix( policy )
+        g = self.policy_costs( policy )
+
+        J = np.zeros( nodes_n )
+
+        # No allowable action
+        J[ ~feasible ] = self.cf.INF
+
+        if self.gamma < 1:
+
+            transient = feasible
+
+        else:
+
+            # Terminal nodes: largest set of zero cost nodes that the
+            # policy never leaves
+            terminal = feasible & ( g == 0 )
+            
+            while True:
+                leaving  = P.dot( ( ~terminal ).astype( float ) ) > 1E-9
+                new_terminal = terminal & ~leaving
+                if ( new_terminal == terminal ).all():
+                    break
+                terminal = new_terminal
+
+            # Nodes reaching a node of known cost: search on the reversed graph
+            # from a virtual node ( nodes_n ) linked to all these nodes
+            edges = P.tocoo()
+            edge  = edges.data > 0
+            ends  = np.nonzero( terminal | ~feasible )[0]
+
+            rows = np.concatenate( [ edges.col[ edge ] , np.full( ends.size , nodes_n ) ] )
+            cols = np.concatenate( [ edges.row[ edge ] , ends ] )
+
+            graph = sparse.csr_matrix( ( np.ones( rows.size ) , ( rows , cols ) ) ,
+                                       shape = ( nodes_n + 1 , nodes_n + 1 ) )
+
+            reached = csgraph.breadth_first_order( graph , nodes_n , directed = True ,
+                                                   return_predecessors = False )
+
+            reach = np.zeros( nodes_n + 1 , dtype = bool )
+            reach[ reached ] = True
+            reach = reach[ : nodes_n ]
+
+            # Never reaching a node of known cost: infinite cost
+            J[ ~reach ] = self.cf.INF
+
+            transient = reach & feasible & ~terminal
+
+        fixed = ~transient
+
+        # Linear system on transient nodes
+        P_tt = P[ transient ][ : , transient ]
+        P_tf = P[ transient ][ : , fixed ]
+
+        A = sparse.identity( transient.sum() , format = 'csc' ) - self.gamma * P_tt.tocsc()
+        b = g[ transient ] + self.gamma * P_tf.dot( J[ fixed ] )
+
+        if transient.any():
+            J[ transient ] = spsolve( A , b )
+
+        return J
+
+
+    ##############################
+    def evaluate_policy_sweeps(self, k ):
+        """ Approximate cost-to-go of the current policy with k sweeps """
+
+        policy   = self.action_policy.reshape( -1 )
+        feasible = policy >= 0
+
+        P = self.policy_transition_matrix( policy )
+        g = self.policy_costs( policy )
+
+        J = self.J.reshape( -1 ).copy()
+
+        J[ ~feasible ] = self.cf.INF
+
+        for i in range( k ):
+
+            J[ feasible ] = ( g + self.gamma * P.dot( J ) )[ feasible ]
+
+        return J
+
+
+    ##############################
+    def improve_policy(self, J_1D , tol = 1E-9 ):
+        """ Greedy policy, keep current action if it is still optimal """
+
+        policy = self.action_policy.reshape( -1 ).copy()
+
+        Q = self.compute_sparse_Q( J_1D )
+
+        Q_min      = Q.min( axis = 1 )
+        new_policy = Q.argmin( axis = 1 )
+
+        # Avoid switching between equivalent actions
+        feasible = policy >= 0
+        Q_policy = np.full( self.grid_sys.nodes_n , np.inf )
+        Q_policy[ feasible ] = Q[ feasible , policy[ feasible ] ]
+        keep     = Q_policy <= Q_min + tol
+        
+        # Nodes with infinite cost for all actions keep their current action,
+        # they could reach a terminal node after later improvements
+        keep     = keep | ( feasible & ( Q_min > (self.cf.INF-1) ) )
+        new_policy[ keep ] = policy[ keep ]
+        
+        # Impossible situation ( no allowable control actions )
+        new_policy[ ~ self.grid_sys.action_isok.any( axis = 1 ) ] = -1
+
+        changes = np.sum( new_policy != policy )
+
+        return new_policy , changes
+
+
+    ###############################
+    def compute_step(self, gauss_seidel = False ):
+        """
+        One step of policy iteration: evaluation and improvement
+
+        return residual : max change of J on nodes with finite cost
+
+        """
+
+        J_old = self.J.copy()
+
+        # Policy evaluation
+        if self.evaluation_sweeps is None:
+            J_1D = self.evaluate_policy()
+        else:
+            J_1D = self.evaluate_policy_sweeps( self.evaluation_sweeps )
+
+        self.J = J_1D.reshape( self.griddim )
+
+        # Policy improvement
+        policy , self.policy_changes = self.improve_policy( J_1D )
+
+        self.action_policy = policy.reshape( self.griddim )
+
+        # Convergence check
+        delta  = J_old - self.J
+        finite = ~( ( J_old > (self.cf.INF-1) ) & ( self.J > (self.cf.INF-1) ) )
+
+        if finite.any():
+            residual = np.abs( delta[ finite ] ).max()
+        else:
+            residual = 0.
+
+        self.residual_history = np.append( self.residual_history , residual )
+
+        if self.verbose:
+            print('Max:', self.J.max() ,'Residual:', residual ,
+                  'Policy changes:', self.policy_changes )
+
+        self.Jnew = self.J.copy()
+
+        return residual
+
+
+    ################################
+    def solve(self, tol = 1E-3 , max_iter = 100 , gauss_seidel = False ):
+        """
+        Policy iteration until the policy is stable
+        --------------------------------------------
+        tol      : with evaluation sweeps, also require a residual below tol
+        max_iter : maximum number of policy improvements
+
+        return residual history
+
+        """
+
+        self.converged = False
+
+        for i in range( max_iter ):
+
+            residual = self.compute_step()
+
+            stable = ( self.policy_changes == 0 )
+
+            if self.evaluation_sweeps is not None:
+                stable = stable and ( residual < tol )
+
+            if stable:
+                self.converged = True
+                break
+
+        print('\nPolicy iteration:\n---------------------------------')
+        print('Converged:', self.converged , ' Steps:', i + 1 , ' Residual:', residual )
+
+        return self.residual_history
+
+
+'''
+################################################################################
+'''
+
+
+class ModifiedPolicyIteration( PolicyIteration ):
+    """
+    Modified policy iteration on a discretized continous dynamic system
+    --------------------------------------------------------------------
+    Policy evaluation is approximated with k sweeps of the fixed policy
+
+    """
+
+    ############################
+    def __init__(self, grid_sys , cost_function , k = 10 ):
+
+        PolicyIteration.__init__( self , grid_sys , cost_function )
+
+        self.evaluation_sweeps = k
+
+
+
+
+'''
+#################################################################
+##################          Main                         ########
+#################################################################
+'''
+
+
+if __name__ == "__main__":
+    """ MAIN TEST """
+
+    from pyro.dynamic  import pendulum
+    from pyro.planning import discretizer
+    from pyro.analysis import costfunction
+
+    sys  = pendulum.SinglePendulum()
+
+    grid_sys = discretizer.GridDynamicSystem( sys )
+
+    cf = costfunction.QuadraticCostFunction( sys )
+
+    cf.xbar = np.array([ -3.14 , 0 ]) # target
+    cf.INF  = 1E9   # must stay above the max cost-to-go g_max / ( 1 - gamma )
+
+    pi = PolicyIteration( grid_sys , cf )
+    
+    pi.gamma = 0.99 # quadratic cost never vanish exactly on the grid
+
+    pi.initialize()
+    pi.solve()
+    pi.assign_interpol_controller()
+    pi.plot_policy(0)
+    pi.plot_cost2go()
@@ -5,10 +5,17 @@ Created on Sun Mar  6 15:09:12 2016
 @author: alex
 """
 ###############################################################################
+import os
+import time
+import warnings
+import queue as queue_module
+import multiprocessing
+
 import numpy as np
 import matplotlib
 import matplotlib.pyplot as plt
 import mpl_toolkits.mplot3d.axes3d as p3
+from scipy.spatial import cKDTree
 
 ###############################################################################
 from pyro.dynamic  import system
@@ -18,23 +25,401 @@ from pyro.planning import plan
 
 
 ###############################################################################
-class Node:
-    """ node of the random tree """
+class Tree:
+    """ 
+    Random tree stored as arrays
+    ------------------------------
+    x      : node states                           N x n
+    u      : control inputs used to get there      N x m
+    t      : time when arriving at x               N
+    parent : index of the previous node (-1: root) N
+    cost   : cost to reach x from the root         N
+    
+    Buffers are preallocated and their size is doubled when full
+    
+    """
+    
+    ############################
+    def __init__(self, n , m , capacity = 1024 ):
+        
+        self.n = n
+        self.m = m
+        
+        self.x      = np.zeros(( capacity , n ))
+        self.u      = np.zeros(( capacity , m ))
+        self.t      = np.zeros( capacity )
+        self.parent = np.zeros( capacity , dtype = int )
+        self.cost   = np.zeros( capacity )
+        
+        self.count = 0
+        
+    
+    ############################
+    def __len__(self):
+        
+        return self.count
+    
+    
+    ############################
+    def grow(self):
+        """ Double the size of all buffers """
+        
+        self.x      = np.concatenate( [ self.x      , np.zeros_like( self.x      ) ] )
+        self.u      = np.concatenate( [ self.u      , np.zeros_like( self.u      ) ] )
+        self.t      = np.concatenate( [ self.t      , np.zeros_like( self.t      ) ] )
+        self.parent = np.concatenate( [ self.parent , np.zeros_like( self.parent ) ] )
+        self.cost   = np.concatenate( [ self.cost   , np.zeros_like( self.cost   ) ] )
+        
+        
+    ############################
+    def add(self, x , u , t , parent , cost = 0 ):
+        """ Add a node, return its index """
+        
+        if self.count == self.t.size:
+            self.grow()
+            
+        i = self.count
+        
+        self.x[ i ]      = x
+        self.u[ i ]      = u
+        self.t[ i ]      = t
+        self.parent[ i ] = parent
+        self.cost[ i ]   = cost
+        
+        self.count = self.count + 1
+        
+        return i
+    
+    
+    ############################
+    def path(self, i ):
+        """ Indexes of the nodes from the root to node i """
+        
+        path = []
+        
+        while i >= 0:
+            path.append( i )
+            i = self.parent[ i ]
+            
+        return np.array( path[::-1] , dtype = int )
+    
+    
+    ############################
+    def edges(self):
+        """ Indexes of child and parent nodes of all edges """
+        
+        child = np.arange( self.count )
+        child = child[ self.parent[ : self.count ] >= 0 ]
+        
+        return child , self.parent[ child ]
+    
+    
+    ############################
+    def subtree(self, i ):
+        """ Indexes of node i and all its descendants """
+        
+        parent = self.parent[ : self.count ]
+        
+        inside      = np.zeros( self.count , dtype = bool )
+        inside[ i ] = True
+        frontier    = inside.copy()
+        
+        # Breadth first, one generation at a time
+        while frontier.any():
+            frontier = frontier[ parent ] & ( parent >= 0 ) & ~inside
+            inside   = inside | frontier
+            
+        return np.nonzero( inside )[0]
+
+
+    ############################
+    def children_count(self):
+        """ Number of children of each node """
+
+        child , parent = self.edges()
+
+        return np.bincount( parent , minlength = self.count )
+
+
+    ############################
+    def compact(self, keep ):
+        """
+        Remove nodes, keep[i] = False for removed nodes
+        ------------------------------------------------
+        Parents of kept nodes must be kept. Nodes are shifted to stay
+        contiguous, return the new index of all old nodes ( -1: removed )
+
+        """
+
+        keep = np.asarray( keep , dtype = bool )
+
+        new_index = np.cumsum( keep ) - 1
+        new_index[ ~keep ] = -1
+
+        N      = int( keep.sum() )
+        parent = self.parent[ : self.count ][ keep ]
+
+        self.x[ : N ]      = self.x[ : self.count ][ keep ]
+        self.u[ : N ]      = self.u[ : self.count ][ keep ]
+        self.t[ : N ]      = self.t[ : self.count ][ keep ]
+        self.cost[ : N ]   = self.cost[ : self.count ][ keep ]
+        self.parent[ : N ] = np.where( parent >= 0 , new_index[ parent ] , -1 )
+
+        self.count = N
+
+        return new_index
+
+
+    ############################
+    def save(self, name = 'RRT_Tree.npz' ):
+        
+        np.savez( name , 
+                  x      = self.x[ : self.count ] ,
+                  u      = self.u[ : self.count ] ,
+                  t      = self.t[ : self.count ] ,
+                  parent = self.parent[ : self.count ] ,
+                  cost   = self.cost[ : self.count ] )
+        
+        
+###############################################################################
+def load_tree( name = 'RRT_Tree.npz' ):
     
+        data = np.load( name )
+        
+        tree = Tree( data['x'].shape[1] , data['u'].shape[1] , max( data['t'].size , 1 ) )
+        
+        tree.count = data['t'].size
+        
+        tree.x[ : tree.count ]      = data['x']
+        tree.u[ : tree.count ]      = data['u']
+        tree.t[ : tree.count ]      = data['t']
+        tree.parent[ : tree.count ] = data['parent']
+        tree.cost[ : tree.count ]   = data['cost']
+        
+        return tree
+        
+        
+###############################################################################
+class NearestNeighborIndex:
+    """ 
+    Exact nearest neighbor search over a contiguous array of node states
+    ---------------------------------------------------------------------
+    Brute force vectorized search, distance is || weights * ( x - x_node ) ||
+    
+    """
+    
+    ############################
+    def __init__(self, n , weights = None ):
+        
+        self.n = n
+        
+        # Metric scaling of each state coordinate
+        if weights is None:
+            weights = np.ones( n )
+            
+        self.weights = np.asarray( weights , dtype = float )
+        
+        self.reset()
+        
+    
+    ############################
+    def reset(self, capacity = 1024 ):
+        """ Remove all nodes """
+        
+        self.x     = np.zeros(( capacity , self.n ))  # scaled node states
+        self.t     = np.zeros( capacity )             # node times
+        self.count = 0
+        
+        
+    ############################
+    def add(self, x , t = 0 ):
+        """ Add a node, return its index """
+        
+        # Grow buffers
+        if self.count == self.t.size:
+            self.x = np.concatenate( [ self.x , np.zeros_like( self.x ) ] )
+            self.t = np.concatenate( [ self.t , np.zeros_like( self.t ) ] )
+            
+        self.x[ self.count ] = self.weights * x
+        self.t[ self.count ] = t
+        
+        self.count = self.count + 1
+        
+        return self.count - 1
+    
+    
+    ############################
+    def brute_force_nearest(self, xs , first , t_max ):
+        """ Nearest node of index >= first with t < t_max ( scaled xs ) """
+        
+        d = np.linalg.norm( self.x[ first : self.count ] - xs , axis = 1 )
+        
+        d[ self.t[ first : self.count ] >= t_max ] = np.inf
+        
+        if d.size == 0:
+            return None , np.inf
+        
+        i = np.argmin( d )
+        
+        if d[i] == np.inf:
+            return None , np.inf
+        
+        return first + i , d[i]
+        
+        
+    ############################
+    def nearest(self, x , t_max = np.inf ):
+        """ Index of the nearest node with t < t_max, None if no node """
+        
+        i , d = self.brute_force_nearest( self.weights * x , 0 , t_max )
+        
+        return i
+    
+    
+    ############################
+    def brute_force_near(self, xs , r , first , t_max ):
+        """ Nodes of index >= first within r of xs with t < t_max """
+        
+        d = np.linalg.norm( self.x[ first : self.count ] - xs , axis = 1 )
+        
+        ok = ( d <= r ) & ( self.t[ first : self.count ] < t_max )
+        
+        return first + np.nonzero( ok )[0]
+    
+    
+    ############################
+    def near(self, x , r , t_max = np.inf ):
+        """ Indexes of all nodes within distance r with t < t_max """
+        
+        return self.brute_force_near( self.weights * x , r , 0 , t_max )
+    
+    
+    ############################
+    def set_time(self, i , t ):
+        """ Update the time of node(s) i """
+        
+        self.t[ i ] = t
+    
+    
+###############################################################################
+class KDTreeIndex( NearestNeighborIndex ):
+    """ 
+    Exact nearest neighbor search with an incrementally rebuilt KD-tree
+    --------------------------------------------------------------------
+    Nodes added since the last rebuild are searched by brute force, the 
+    KD-tree is rebuilt when they exceed a fraction of the tree size so that
+    queries are O( log N ) amortized.
+    
+    """
+    
+    ############################
+    def __init__(self, n , weights = None ):
+        
+        # Rebuild params
+        self.rebuild_ratio = 0.2
+        self.rebuild_min   = 64
+        
+        NearestNeighborIndex.__init__( self , n , weights )
+        
+    
+    ############################
+    def reset(self, capacity = 1024 ):
+        """ Remove all nodes """
+        
+        NearestNeighborIndex.reset( self , capacity )
+        
+        self.kdtree = None
+        self.tree_n = 0   # number of nodes in the KD-tree
+        
+        
+    ############################
+    def rebuild(self):
+        """ Build the KD-tree over all nodes """
+        
+        self.kdtree = cKDTree( self.x[ : self.count ] )
+        self.tree_n = self.count
+        
+        
+    ############################
+    def kdtree_nearest(self, xs , t_max ):
+        """ Nearest node of the KD-tree with t < t_max ( scaled xs ) """
+        
+        k = 1
+        
+        while True:
+            
+            k = min( k , self.tree_n )
+            
+            d , i = self.kdtree.query( xs , k )
+            
+            d = np.atleast_1d( d )
+            i = np.atleast_1d( i )
+            
+            # Neighbors ordered by distance
+            valid = self.t[ i ] < t_max
+            
+            if valid.any():
+                j = np.argmax( valid )
+                return i[j] , d[j]
+            
+            if k == self.tree_n:
+                return None , np.inf
+            
+            k = 4 * k
+            
+            
+    ############################
+    def update(self):
+        """ Rebuild the KD-tree if too many nodes were added since """
+        
+        recent = self.count - self.tree_n
+        
+        if recent > max( self.rebuild_min , self.rebuild_ratio * self.tree_n ):
+            self.rebuild()
+            
+            
     ############################
-    def __init__(self, x , u , t , parent ):
+    def nearest(self, x , t_max = np.inf ):
+        """ Index of the nearest node with t < t_max, None if no node """
+        
+        self.update()
         
-        self.x = x  # Node coordinates in the state space
-        self.u = u  # Control inputs used to get there
-        self.t = t  # Time when arriving at x
-        self.parent = parent # Previous node
+        xs = self.weights * x
         
+        # Nodes added since the last rebuild
+        i , d = self.brute_force_nearest( xs , self.tree_n , t_max )
+        
+        # Nodes in the KD-tree
+        if self.tree_n > 0:
+            
+            i_tree , d_tree = self.kdtree_nearest( xs , t_max )
+            
+            if d_tree <= d:
+                i = i_tree
+            
+        return i
+    
     
     ############################
-    def distanceTo(self, x_other ):
-        """ Compute distance to otherNode """
+    def near(self, x , r , t_max = np.inf ):
+        """ Indexes of all nodes within distance r with t < t_max """
+        
+        self.update()
         
-        return np.linalg.norm( self.x - x_other )
+        xs = self.weights * x
+        
+        # Nodes added since the last rebuild
+        i = self.brute_force_near( xs , r , self.tree_n , t_max )
+        
+        # Nodes in the KD-tree
+        if self.tree_n > 0:
+            
+            i_tree = np.array( self.kdtree.query_ball_point( xs , r ) , dtype = int )
+            i_tree = i_tree[ self.t[ i_tree ] < t_max ]
+            
+            i = np.concatenate( [ i_tree , i ] )
+            
+        return i
         
         
 ###############################################################################
@@ -46,11 +431,12 @@ class RRT:
         
         self.sys = sys          # Dynamic system class
         
+        # Spatial index for nearest neighbor queries
+        self.nn_index = KDTreeIndex( self.sys.n )
+        
         # Init tree
-        self.x_start = x_start  # origin of the graph
-        self.start_node = Node( self.x_start , None , 0  , None )
-        self.nodes = []
-        self.nodes.append( self.start_node )
+        self.x_start = x_start  # origin of the graph ( new tree if modified )
+        self.reset_tree()
         
         # Params
         self.dt                   = 0.1
@@ -61,9 +447,12 @@ class RRT:
         self.alpha                = 0.9    # prob of random exploration
         self.beta                 = 0.0    # prob of random u
         self.max_nodes            = 2000  # maximum number of nodes
-        self.max_distance_compute = 2000   # max  nodes to check distance
         self.max_solution_time    = 100    # won"t look for longuer solution 
         
+        # Tree pruning when the tree reaches max_nodes
+        self.prune_radius         = 0.0    # min distance between leaves
+        self.prune_min_ratio      = 0.1    # full reset if fewer nodes pruned
+        
         self.test_u_domain        = False  # run a check on u input 
                 
         # Ploting
@@ -128,141 +517,303 @@ class RRT:
         
         
     ############################
-    def nearest_neighbor(self, x_target ):    
-        """ Get the nearest node to a given state x """
-        
-        closest_node = None
-        min_distance = self.INF
-        
-        # Number of nodes is small
-        if len(self.nodes) < self.max_distance_compute + 1 :
-            # Brute force        
-            for node in self.nodes:
-                d = node.distanceTo( x_target )
-                if d < min_distance:
-                    if node.t < self.max_solution_time:
-                        min_distance = d
-                        closest_node = node
-        
-        # Else if there is too many nodes to check
-        else:
-            # Check only last X nodes
-            for i in range(self.max_distance_compute):
-                node = self.nodes[ len(self.nodes) - i - 1 ]
-                d = node.distanceTo( x_target )
-                if d < min_distance:
-                    if node.t < self.max_solution_time:
-                        min_distance = d
-                        closest_node = node
-            
-                
-        return closest_node
+    def reset_tree(self):
+        """ Tree with only the start node ( index 0 ) """
+        
+        self.tree = Tree( self.sys.n , self.sys.m )
+        self.nn_index.reset()
+        
+        self.add_node( self.x_start , np.zeros( self.sys.m ) , 0 , -1 )
         
         
     ############################
-    def select_control_input(self, x_target , closest_node ):    
-        """ pick control input """
+    def check_tree_root(self):
+        """ Start a new tree if x_start was modified since the tree was grown """
         
-        # Select a random control input
-        if self.randomized_input :
+        if not np.array_equal( self.tree.x[ 0 ] , np.asarray( self.x_start , dtype = float ) ):
             
-            u          = self.rand_input( closest_node.x )
-            x_next     = self.sys.x_next( closest_node.x , 
-                                          u , 
-                                          closest_node.t , 
-                                          self.dt ,
-                                          self.steps 
-                                          )
+            self.reset_tree()
+        
+        
+    ############################
+    def rebuild_index(self):
+        """ Spatial index of all nodes of the tree """
+        
+        self.nn_index.reset( max( self.tree.count , 1024 ) )
+        
+        for i in range( self.tree.count ):
+            self.nn_index.add( self.tree.x[ i ] , self.tree.t[ i ] )
             
-            t_next     = closest_node.t + self.dt * self.steps
-            new_node   = Node( x_next , u , t_next  , closest_node )
             
-            if not( self.sys.isavalidstate( x_next ) ):
-                new_node = None
+    ############################
+    def prune_tree(self, protected = None ):
+        """ 
+        Remove useless nodes instead of discarding the whole tree
+        ----------------------------------------------------------
+        - nodes with t >= max_solution_time and their descendants
+        - leaves closer than prune_radius to an older node ( over-sampled 
+          regions ), distance measured in the metric of nn_index
         
-        # Pick control input that bring the sys close to random point
-        else:
+        protected : index of a node never removed as a leaf ( solution )
+        
+        return the new index of all old nodes ( -1: removed )
+        
+        """
+        
+        N = len( self.tree )
+        
+        # Too late nodes, descendants are removed with their ancestors
+        parent = self.tree.parent[ : N ]
+        keep   = self.tree.t[ : N ] < self.max_solution_time
+        keep[ 0 ] = True
+        
+        while True:
+            new_keep = keep & ( ( parent < 0 ) | keep[ parent ] )
+            if ( new_keep == keep ).all():
+                break
+            keep = new_keep
+        
+        new_index = self.tree.compact( keep )
+        
+        # Leaves in over-sampled regions
+        if self.prune_radius > 0 and len( self.tree ) > 1 :
             
-            new_node     = None
-            min_distance = self.INF
+            xs     = self.nn_index.weights * self.tree.x[ : len( self.tree ) ]
+            leaves = np.nonzero( self.tree.children_count() == 0 )[0]
             
-            for u in self.u_options:
-                
-                # if u domain check is active
-                if self.test_u_domain:
-                    # if input is not valid
-                    if not( self.sys.isavalidinput( closest_node.x , u ) ):
-                        # Skip this u
-                        continue
-                
-                x_next     = self.sys.x_next( closest_node.x , 
-                                              u , 
-                                              closest_node.t , 
-                                              self.dt ,
-                                              self.steps 
-                                              )
-                
-                t_next     = closest_node.t + self.dt * self.steps
-                node       = Node( x_next , u , t_next  , closest_node )
-                
-                d = node.distanceTo( x_target )
-                
-                if ( d < min_distance ) and self.sys.isavalidstate( x_next ) :
-                    min_distance = d
-                    new_node     = node
-                    
-                
-        return new_node
+            d , i = cKDTree( xs ).query( xs[ leaves ] , 2 )
+            
+            # Nearest other node is older and too close
+            crowded = ( d[:,1] < self.prune_radius ) & ( i[:,1] < leaves )
+            
+            keep = np.ones( len( self.tree ) , dtype = bool )
+            keep[ leaves[ crowded ] ] = False
+            
+            if protected is not None and new_index[ protected ] >= 0:
+                keep[ new_index[ protected ] ] = True
+            
+            leaf_index = self.tree.compact( keep )
+            new_index  = np.where( new_index >= 0 , 
+                                   leaf_index[ np.maximum( new_index , 0 ) ] , -1 )
+        
+        self.rebuild_index()
+        
+        # Node indexes of the previous solution are no longer valid
+        self.solution_is_found = False
         
+        return new_index
+    
     
     ############################
-    def one_step(self):    
-        """ """
-        x_random  = self.rand_state()
+    def limit_tree_size(self, protected = None , max_nodes = None ):
+        """ 
+        Keep the tree below max_nodes
+        ------------------------------
+        The tree is pruned, if this does not bring it below 
+        ( 1 - prune_min_ratio ) * max_nodes, only the root and the path to
+        the protected node are kept ( full reset if protected is None ).
+        The tree never exceeds max_nodes and at least prune_min_ratio of 
+        max_nodes new nodes are added between two calls.
         
-        node_near = self.nearest_neighbor( x_random )
+        return the new index of the protected node
         
-        # if a valid neighbor was found
-        if not node_near == None:
-            new_node  = self.select_control_input( x_random , node_near )
+        """
+        
+        if max_nodes is None:
+            max_nodes = self.max_nodes
+        
+        new_index = self.prune_tree( protected )
+        
+        if protected is not None:
+            protected = new_index[ protected ]
             
-            # if there is a valid control input
-            if not new_node == None:
-                self.nodes.append( new_node )
+        pruned = new_index.size - len( self.tree )
         
+        if len( self.tree ) > ( 1 - self.prune_min_ratio ) * max_nodes :
+            
+            keep      = np.zeros( len( self.tree ) , dtype = bool )
+            keep[ 0 ] = True
+            
+            if protected is not None:
+                keep[ self.tree.path( protected ) ] = True
+                
+            new_index = self.tree.compact( keep )
+            
+            self.rebuild_index()
+            
+            if protected is None:
+                print('\n-----------------------------------------------',
+                      '\nRRT reseting tree',
+                      '\n-----------------------------------------------')
+            else:
+                protected = new_index[ protected ]
+                print('\n-----------------------------------------------',
+                      '\nRRT reseting tree, solution path kept',
+                      '\n-----------------------------------------------')
+                
+        else:
+            
+            print('\n-----------------------------------------------',
+                  '\nRRT pruned', pruned , 'nodes',
+                  '\n-----------------------------------------------')
         
-    ############################
-    def compute_steps(self , n , plot = False ):    
-        """ """
-        for i in range( n ):
-            self.one_step()
+        if self.dyna_plot :
+            self.dyna_plot_clear()
             
-        if plot:
-            self.plot_tree()
-    
-           
+        return protected
+        
         
     ############################
-    def find_path_to_goal(self, x_goal ):
-        """ """
+    def tree_goal_node(self, x_goal ):
+        """ Earliest node of the tree within goal_radius, None if no node """
         
-        self.x_goal  = x_goal
+        N = len( self.tree )
         
-        succes   = False
+        d = np.linalg.norm( self.tree.x[ : N ] - x_goal , axis = 1 )
         
-        no_nodes = 0
+        t = np.where( ( d < self.goal_radius ) & 
+                      ( self.tree.t[ : N ] < self.max_solution_time ) , 
+                      self.tree.t[ : N ] , np.inf )
         
-         # Plot
-        if self.dyna_plot:
-            self.dyna_plot_init()
+        i = np.argmin( t )
         
-        while not succes:
-            
-            # Exploration:
-            if np.random.rand() > self.alpha :
-                # Try to converge to goal
-                x_random = x_goal
-                self.randomized_input = False
+        if t[ i ] == np.inf:
+            return None
+        
+        return i
+        
+        
+    ############################
+    def add_node(self, x , u , t , parent , cost = 0 ):
+        """ Add a node to the tree and to the spatial index """
+        
+        self.nn_index.add( x , t )
+        
+        return self.tree.add( x , u , t , parent , cost )
+        
+        
+    ############################
+    def nearest_neighbor(self, x_target ):    
+        """ Get the index of the nearest node to a given state x """
+        
+        # Only nodes with t < max_solution_time are considered
+        return self.nn_index.nearest( x_target , self.max_solution_time )
+        
+        
+    ############################
+    def select_control_input(self, x_target , i_near ):    
+        """ 
+        pick control input 
+        -------------------
+        return x_next , u , t_next of the new node or None if no valid input
+        
+        """
+        
+        x_near = self.tree.x[ i_near ]
+        t_near = self.tree.t[ i_near ]
+        t_next = t_near + self.dt * self.steps
+        
+        # Select a random control input
+        if self.randomized_input :
+            
+            u          = self.rand_input( x_near )
+            x_next     = self.sys.x_next( x_near , 
+                                          u , 
+                                          t_near , 
+                                          self.dt ,
+                                          self.steps 
+                                          )
+            
+            if not( self.sys.isavalidstate( x_next ) ):
+                return None
+            
+            return x_next , u , t_next
+        
+        # Pick control input that bring the sys close to random point
+        else:
+            
+            U = np.array( self.u_options , dtype = float ).reshape( -1 , self.sys.m )
+            X = np.tile( x_near , ( U.shape[0] , 1 ) )
+            
+            # All candidate inputs propagated at once
+            X_next = self.sys.x_next_batch( X , U , t_near , self.dt , self.steps )
+            
+            valid  = self.sys.isavalidstate_batch( X_next )
+            
+            # if u domain check is active
+            if self.test_u_domain:
+                valid = valid & self.sys.isavalidinput_batch( X , U )
+            
+            d = np.linalg.norm( X_next - x_target , axis = 1 )
+            d[ ~valid ] = np.inf
+            
+            j = np.argmin( d )
+            
+            if not d[ j ] < self.INF:
+                return None
+            
+            return X_next[ j ] , U[ j ] , t_next
+        
+        
+    ############################
+    def one_step(self):    
+        """ """
+        x_random  = self.rand_state()
+        
+        i_near = self.nearest_neighbor( x_random )
+        
+        # if a valid neighbor was found
+        if not i_near is None:
+            new_node  = self.select_control_input( x_random , i_near )
+            
+            # if there is a valid control input
+            if not new_node is None:
+                x_next , u , t_next = new_node
+                self.add_node( x_next , u , t_next , i_near )
+        
+        
+    ############################
+    def compute_steps(self , n , plot = False ):    
+        """ """
+        for i in range( n ):
+            self.one_step()
+            
+        if plot:
+            self.plot_tree()
+    
+           
+        
+    ############################
+    def find_path_to_goal(self, x_goal ):
+        """ """
+        
+        self.x_goal  = x_goal
+        
+        succes   = False
+        
+        no_nodes = 0
+        
+        self.check_tree_root()
+        
+        # The tree is kept between calls: earlier exploration may already
+        # reach the goal
+        i_goal = self.tree_goal_node( x_goal )
+        
+        if i_goal is not None:
+            succes = True
+            self.goal_node = i_goal
+        
+         # Plot
+        if self.dyna_plot:
+            self.dyna_plot_init()
+        
+        while not succes:
+            
+            # Exploration:
+            if np.random.rand() > self.alpha :
+                # Try to converge to goal
+                x_random = x_goal
+                self.randomized_input = False
             else:
                 # Random exploration
                 x_random  = self.rand_state()
@@ -270,54 +821,49 @@ class RRT:
                 # self.beta = probability of random exploration
                 self.randomized_input = ( np.random.rand() < self.beta )
 
-            node_near = self.nearest_neighbor( x_random )
+            i_near = self.nearest_neighbor( x_random )
             
             # if a valid neighbor was found
-            if not node_near == None:
+            if not i_near is None:
                 new_node  = self.select_control_input( x_random , 
-                                                       node_near )
+                                                       i_near )
                 
                 # if there is a valid control input
-                if not new_node == None:
-                    self.nodes.append( new_node )
+                if not new_node is None:
+                    x_next , u , t_next = new_node
+                    i_new = self.add_node( x_next , u , t_next , i_near )
             
                     # Distance to goal
-                    d = new_node.distanceTo( x_goal )
+                    d = np.linalg.norm( x_next - x_goal )
                     
                     no_nodes = no_nodes + 1
                     
                     ##################################################
                     # Debug
                     if self.debug:
-                        print(x_random, node_near.x , new_node.x )
+                        print(x_random, self.tree.x[ i_near ] , x_next )
                         wait = input("PRESS ENTER TO CONTINUE.")
                     ###################################################
                     
                     # Plot
                     if self.dyna_plot:
-                        self.dyna_plot_add_node( new_node , no_nodes )
+                        self.dyna_plot_add_node( i_new , no_nodes )
                     
                     # Succes?
                     if d < self.goal_radius:
                         succes = True
-                        self.goal_node = new_node
+                        self.goal_node = i_new
                 else:
                     pass
                     #print('on obstacle')
                     
                 
-            # Tree reset
-            if no_nodes == self.max_nodes:
+            # Tree pruning
+            if len( self.tree ) >= self.max_nodes and not succes:
                 
-                print('\n-----------------------------------------------',
-                      '\nRRT reseting tree',
-                      '\n-----------------------------------------------')
                 no_nodes = 0
-                self.nodes = []
-                self.nodes.append( self.start_node )
                 
-                if self.dyna_plot :
-                    self.dyna_plot_clear()
+                self.limit_tree_size()
         
         print('\n-----------------------------------------------',
               '\nRRT found a path to the goal',
@@ -333,53 +879,25 @@ class RRT:
                 
     ############################
     def compute_path_to_goal(self):
-        """ """
+        """ Trajectory from the start node to the goal node """
         
-        node = self.goal_node
+        # Indexes of nodes from start to goal
+        path = self.tree.path( self.goal_node )
         
-        t      = 0
+        self.path_node_list = path[1:]
         
-        x_list  = []
-        u_list  = []
-        t_list  = []
-        dx_list = []
+        parents  = path[:-1]
+        children = path[1:]
         
-        self.path_node_list = []
+        # State and time of the parent, inputs used to reach the child
+        x  = self.tree.x[ parents ]
+        u  = self.tree.u[ children ]
+        t  = self.tree.t[ parents ]
         
-        # Until node = start_node
-        while node.distanceTo( self.x_start ) > self.eps:
-            
-            self.path_node_list.append( node )
-            
-            x_list.append( node.parent.x   )
-            u_list.append( node.u     )
-            t_list.append( node.parent.t   )
-            
-            dx_list.append( self.sys.f( node.parent.x , 
-                                        node.u , 
-                                        node.parent.t )  ) # state derivative
-            
-            # Previous Node
-            node  = node.parent 
-
-        # Arrange Time array
-        t = np.array( t_list )
-        t = np.flipud( t )
-        
-        # Arrange Input array
-        u = np.array( u_list ).T
-        u = np.fliplr( u )
-        
-        # Arrange State array
-        x = np.array( x_list ).T
-        x = np.fliplr( x )
-        
-        # Arrange State Derivative array
-        dx = np.array( dx_list ).T
-        dx = np.fliplr( dx )
+        dx = self.sys.f_batch( x , u , t ) # state derivative
             
         # Save plan
-        self.trajectory = plan.Trajectory( x.T , u.T , t.T , dx.T)
+        self.trajectory = plan.Trajectory( x , u , t , dx )
         
         # Create open-loop controller
         self.open_loop_controller = plan.OpenLoopController( self.trajectory )
@@ -394,10 +912,28 @@ class RRT:
         self.trajectory.lowpassfilter( fc )
     
     ############################
-    def save_solution(self, name = 'RRT_Solution.npy' ):
+    def save_solution(self, name = 'RRT_Solution.npy' , save_tree = False ):
         
         self.trajectory.save( name )
         
+        if save_tree:
+            self.save_tree( name.replace( '.npy' , '' ) + '_tree.npz' )
+            
+    ############################
+    def save_tree(self, name = 'RRT_Tree.npz' ):
+        
+        self.tree.save( name )
+        
+    ############################
+    def load_tree(self, name = 'RRT_Tree.npz' ):
+        
+        self.tree = load_tree( name )
+        
+        # The tree is reused for following queries
+        self.x_start = self.tree.x[ 0 ].copy()
+        
+        self.rebuild_index()
+        
     ############################
     def load_solution(self, name = 'RRT_Solution.npy' ):
         
@@ -428,20 +964,22 @@ class RRT:
         # Create axe
         ax       = self.fig_tree.add_subplot(111)
         
-        # Plot Tree
-        for node in self.nodes:
-            if not(node.parent==None):
-                ax.plot( 
-                [node.x[ self.x_axis ],node.parent.x[ self.x_axis ]] , 
-                [node.x[ self.y_axis ],node.parent.x[ self.y_axis ]] , 'o-')
+        x = self.tree.x
+        
+        # Plot Tree, one line per edge
+        child , parent = self.tree.edges()
+        
+        ax.plot( 
+        np.vstack([ x[ child , self.x_axis ] , x[ parent , self.x_axis ] ]) , 
+        np.vstack([ x[ child , self.y_axis ] , x[ parent , self.y_axis ] ]) , 'o-')
         
         # Plot Solution Path
         if self.solution_is_found:
-            for node in self.path_node_list:
-                if not( node.parent == None ):
-                    ax.plot( 
-                    [node.x[ self.x_axis ],node.parent.x[ self.x_axis ]] , 
-                    [node.x[ self.y_axis ],node.parent.x[ self.y_axis ]] , 'r')
+            child  = self.path_node_list
+            parent = self.tree.parent[ child ]
+            ax.plot( 
+            np.vstack([ x[ child , self.x_axis ] , x[ parent , self.x_axis ] ]) , 
+            np.vstack([ x[ child , self.y_axis ] , x[ parent , self.y_axis ] ]) , 'r')
         
         # Set axis labels
         ax.set_xlabel(
@@ -483,23 +1021,24 @@ class RRT:
         # Create Axe
         ax = self.fig_tree_3d.gca( projection='3d' )
         
+        x = self.tree.x
+        
         # Plot Tree
-        for node in self.nodes:
-            if not( node.parent == None ):
-                ax.plot( 
-                [ node.x[ self.x_axis ] , node.parent.x[ self.x_axis ]] ,
-                [ node.x[ self.y_axis ] , node.parent.x[ self.y_axis ]] ,
-                [ node.x[ self.z_axis ] , node.parent.x[ self.z_axis ]] , 'o-')
+        for i , j in zip( *self.tree.edges() ):
+            ax.plot( 
+            [ x[ i , self.x_axis ] , x[ j , self.x_axis ]] ,
+            [ x[ i , self.y_axis ] , x[ j , self.y_axis ]] ,
+            [ x[ i , self.z_axis ] , x[ j , self.z_axis ]] , 'o-')
         
         # Plot Solution Path
-        if not self.solution_is_found == None:
-            for node in self.path_node_list:
-                if not( node.parent == None ):
-                    ax.plot( 
-                    [ node.x[ self.x_axis ] , node.parent.x[ self.x_axis ]] ,
-                    [ node.x[ self.y_axis ] , node.parent.x[ self.y_axis ]] ,
-                    [ node.x[ self.z_axis ] , node.parent.x[ self.z_axis ]] , 
-                    'r')
+        if self.solution_is_found:
+            for i in self.path_node_list:
+                j = self.tree.parent[ i ]
+                ax.plot( 
+                [ x[ i , self.x_axis ] , x[ j , self.x_axis ]] ,
+                [ x[ i , self.y_axis ] , x[ j , self.y_axis ]] ,
+                [ x[ i , self.z_axis ] , x[ j , self.z_axis ]] , 
+                'r')
         
         # Set domain
         ax.set_xlim3d( [ self.sys.x_lb[ self.x_axis ] ,
@@ -580,12 +1119,15 @@ class RRT:
         
         
      ############################
-    def dyna_plot_add_node(self, node , no_nodes ):
+    def dyna_plot_add_node(self, i , no_nodes ):
         
-        if not(node.parent==None):
+        j = self.tree.parent[ i ]
+        x = self.tree.x
+        
+        if j >= 0:
                 self.ax_tree_dyna.plot( 
-                        [node.x[ self.x_axis ],node.parent.x[ self.x_axis ]] ,
-                        [node.x[ self.y_axis ],node.parent.x[ self.y_axis ]] ,
+                        [ x[ i , self.x_axis ] , x[ j , self.x_axis ] ] ,
+                        [ x[ i , self.y_axis ] , x[ j , self.y_axis ] ] ,
                         'o-')
                 self.time_text.set_text(self.time_template % ( no_nodes ))
                 self.node_wait_list = self.node_wait_list + 1
@@ -610,13 +1152,16 @@ class RRT:
     ############################
     def dyna_plot_solution(self ):
         
-        if not self.solution_is_found == None:
-            for node in self.path_node_list:
-                if not(node.parent==None):
-                    self.ax_tree_dyna.plot( 
-                        [node.x[ self.x_axis ],node.parent.x[ self.x_axis ]] ,
-                        [node.x[ self.y_axis ],node.parent.x[ self.y_axis ]] ,
-                        'r')
+        if self.solution_is_found:
+            
+            x      = self.tree.x
+            child  = self.path_node_list
+            parent = self.tree.parent[ child ]
+            
+            self.ax_tree_dyna.plot( 
+                np.vstack([ x[ child , self.x_axis ] , x[ parent , self.x_axis ] ]) ,
+                np.vstack([ x[ child , self.y_axis ] , x[ parent , self.y_axis ] ]) ,
+                'r')
                     
             #plt.ioff()
             self.fig_tree_dyna.show()
@@ -624,6 +1169,799 @@ class RRT:
         
 
 
+###############################################################################
+class RRTStar( RRT ):
+    """ 
+    Asymptotically optimal RRT* search for kinodynamic systems
+    ------------------------------------------------------------
+    New nodes are obtained by forward propagation as in RRT, then:
+    - choose parent: the near node with the lowest cost that reach the new
+      node ( within connect_radius ) with one of the u_options
+    - rewire: near nodes that are reached at a lower cost from the new 
+      node get the new node as parent
+    
+    Without an exact steering function, connections are approximate: the
+    planned trajectory may jump by at most connect_radius at rewired nodes.
+    
+    Edge cost is the duration dt * steps, or g( x , u ) * dt * steps if a
+    cost function is given. With the duration cost, the cost of a node is
+    its time t: once a solution is found, nodes that are not earlier than 
+    the solution can not improve it and are ignored ( branch and bound ).
+    
+    """
+    
+    ############################
+    def __init__(self, sys , x_start , cost_function = None ):
+        
+        RRT.__init__( self , sys , x_start )
+        
+        self.cf = cost_function
+        
+        # Params
+        self.connect_radius = 0.1   # max error for connecting two nodes
+        self.near_radius    = 1.0   # max radius of the near nodes search
+        self.gamma_rrt      = 10.0  # near radius = gamma ( log N / N )^(1/n)
+        
+        # Solution
+        self.solution_cost    = np.inf
+        self.solution_history = []   # ( search time , cost ) of solutions
+        
+        
+    ############################
+    def time_horizon(self):
+        """ Nodes with t >= time horizon are not extended or connected """
+        
+        if self.cf is None:
+            return min( self.max_solution_time , self.solution_cost )
+        
+        return self.max_solution_time
+    
+    
+    ############################
+    def nearest_neighbor(self, x_target ):    
+        """ Index of the nearest node with t < time horizon """
+        
+        return self.nn_index.nearest( x_target , self.time_horizon() )
+        
+        
+    ############################
+    def edge_cost(self, X , U ):
+        """ Cost of propagating states X ( N x n ) with inputs U ( N x m ) """
+        
+        duration = self.dt * self.steps
+        
+        if self.cf is None:
+            return np.full( X.shape[0] , duration )
+        
+        return self.cf.g_batch( X , U ) * duration
+    
+    
+    ############################
+    def near_nodes(self, x ):
+        """ Indexes of nodes in the shrinking radius ball around x """
+        
+        N = len( self.tree )
+        
+        r = self.gamma_rrt * ( np.log( N + 1 ) / ( N + 1 ) ) ** ( 1. / self.sys.n )
+        r = min( r , self.near_radius )
+        
+        return self.nn_index.near( x , r , self.time_horizon() )
+    
+    
+    ############################
+    def propagate(self, X , T ):
+        """ 
+        Propagate states X ( N x n ) with all u_options at once
+        
+        return X_next ( N x k x n ) , U ( N x k x m ) , valid ( N x k )
+        
+        """
+        
+        U  = np.array( self.u_options , dtype = float ).reshape( -1 , self.sys.m )
+        
+        N = X.shape[0]
+        k = U.shape[0]
+        
+        X_all = np.repeat( X , k , axis = 0 )
+        U_all = np.tile( U , ( N , 1 ) )
+        T_all = np.repeat( T , k )
+        
+        X_next = self.sys.x_next_batch( X_all , U_all , T_all , self.dt , self.steps )
+        
+        valid  = self.sys.isavalidstate_batch( X_next )
+        
+        if self.test_u_domain:
+            valid = valid & self.sys.isavalidinput_batch( X_all , U_all )
+        
+        cost = self.edge_cost( X_all , U_all )
+        
+        return ( X_next.reshape( N , k , -1 ) , U_all.reshape( N , k , -1 ) ,
+                 valid.reshape( N , k ) , cost.reshape( N , k ) )
+    
+    
+    ############################
+    def choose_parent(self, x_new , near ):
+        """ Best near node and input to reach x_new, return parent , u , cost """
+        
+        X_next , U , valid , edge = self.propagate( self.tree.x[ near ] , 
+                                                    self.tree.t[ near ] )
+        
+        d = np.linalg.norm( X_next - x_new , axis = 2 )
+        
+        cost = self.tree.cost[ near ][:,None] + edge
+        cost[ ~valid | ( d > self.connect_radius ) ] = np.inf
+        
+        i , j = np.unravel_index( np.argmin( cost ) , cost.shape )
+        
+        if cost[ i , j ] == np.inf:
+            return None
+        
+        return near[ i ] , U[ i , j ] , cost[ i , j ]
+    
+    
+    ############################
+    def rewire(self, i_new , near ):
+        """ Give the new node as parent to near nodes when cheaper """
+        
+        tree = self.tree
+        
+        near = near[ ( near != i_new ) & ( near != tree.parent[ i_new ] ) ]
+        
+        if near.size == 0:
+            return
+        
+        X_next , U , valid , edge = self.propagate( tree.x[ i_new ][None,:] , 
+                                                    tree.t[ i_new : i_new + 1 ] )
+        
+        # Distance between all propagated states and all near nodes
+        d = np.linalg.norm( X_next[0][:,None,:] - tree.x[ near ][None,:,:] , axis = 2 )
+        
+        cost = tree.cost[ i_new ] + edge[0][:,None] + np.zeros( d.shape )
+        cost[ ~valid[0][:,None] | ( d > self.connect_radius ) ] = np.inf
+        
+        j         = np.argmin( cost , axis = 0 )
+        edge_cost = cost[ j , np.arange( near.size ) ] - tree.cost[ i_new ]
+        
+        t_new = tree.t[ i_new ] + self.dt * self.steps
+        
+        for k in np.nonzero( np.isfinite( edge_cost ) )[0]:
+            
+            i = near[ k ]
+            
+            # Costs are checked again, previous rewires may have lowered 
+            # the cost of i or of i_new
+            cost_k = tree.cost[ i_new ] + edge_cost[ k ]
+            
+            if not cost_k < tree.cost[ i ] - 1E-9:
+                continue
+            
+            sub = tree.subtree( i )
+            
+            # i is an ancestor of i_new: rewiring would create a cycle
+            if np.any( sub == i_new ):
+                continue
+            
+            # Cost and time shifts of the whole sub-tree
+            delta_c = cost_k - tree.cost[ i ]
+            delta_t = t_new  - tree.t[ i ]
+            
+            tree.parent[ i ] = i_new
+            tree.u[ i ]      = U[ 0 , j[ k ] ]
+            
+            tree.cost[ sub ] = tree.cost[ sub ] + delta_c
+            tree.t[ sub ]    = tree.t[ sub ]    + delta_t
+            
+            self.nn_index.set_time( sub , tree.t[ sub ] )
+            
+            
+    ############################
+    def extend(self, x_random ):
+        """ RRT* growth step toward x_random, return index of new node """
+        
+        i_near = self.nearest_neighbor( x_random )
+        
+        if i_near is None:
+            return None
+        
+        new_node = self.select_control_input( x_random , i_near )
+        
+        if new_node is None:
+            return None
+        
+        x_new = new_node[0]
+        
+        near = self.near_nodes( x_new )
+        near = np.union1d( near , [ i_near ] )
+        
+        best = self.choose_parent( x_new , near )
+        
+        # Random input not in u_options: keep the expanded node parent
+        if best is None:
+            u     = new_node[1]
+            edge  = self.edge_cost( self.tree.x[ i_near ][None,:] , np.atleast_2d( u ) )[0]
+            best  = ( i_near , u , self.tree.cost[ i_near ] + edge )
+            
+        parent , u , cost = best
+        
+        t_new = self.tree.t[ parent ] + self.dt * self.steps
+        
+        i_new = self.add_node( x_new , u , t_new , parent , cost )
+        
+        self.rewire( i_new , near )
+        
+        return i_new
+    
+    
+    ############################
+    def best_goal_node(self):
+        """ Lowest cost node within goal_radius, None if no node """
+        
+        N = len( self.tree )
+        
+        d = np.linalg.norm( self.tree.x[ : N ] - self.x_goal , axis = 1 )
+        
+        goal = ( d < self.goal_radius ) & ( self.tree.t[ : N ] < self.max_solution_time )
+        
+        cost = np.where( goal , self.tree.cost[ : N ] , np.inf )
+        
+        i = np.argmin( cost )
+        
+        if cost[ i ] == np.inf:
+            return None
+        
+        return i
+    
+    
+    ############################
+    def find_path_to_goal(self, x_goal , time_budget = None ):
+        """ 
+        Search for a path to the goal
+        ------------------------------
+        time_budget = None : stop at the first solution
+        time_budget = T    : anytime mode, keep improving the solution
+                             until T seconds are elapsed
+        
+        The tree is pruned when it reaches max_nodes, the path of the best
+        solution is always kept. A RuntimeWarning is issued if no solution
+        is found within the time budget.
+        
+        """
+        
+        self.x_goal = x_goal
+        
+        self.check_tree_root()
+        
+        self.solution_is_found = False
+        self.solution_cost     = np.inf
+        self.solution_history  = []
+        
+        start    = time.time()
+        no_nodes = 0
+        
+        # Plot
+        if self.dyna_plot:
+            self.dyna_plot_init()
+        
+        while True:
+            
+            # Exploration:
+            if np.random.rand() > self.alpha :
+                # Try to converge to goal
+                x_random = x_goal
+                self.randomized_input = False
+            else:
+                # Random exploration
+                x_random  = self.rand_state()
+                self.randomized_input = ( np.random.rand() < self.beta )
+                
+            i_new = self.extend( x_random )
+            
+            if i_new is not None:
+                
+                no_nodes = no_nodes + 1
+                
+                # Plot
+                if self.dyna_plot:
+                    self.dyna_plot_add_node( i_new , no_nodes )
+                
+                # Best solution ( rewiring may improve previous ones )
+                i_goal = self.best_goal_node()
+                
+                if i_goal is not None:
+                    
+                    if self.tree.cost[ i_goal ] < self.solution_cost :
+                        
+                        self.goal_node     = i_goal
+                        self.solution_cost = self.tree.cost[ i_goal ]
+                        
+                        self.solution_history.append( ( time.time() - start , 
+                                                        self.solution_cost ) )
+                        
+                        if self.debug:
+                            print('RRT* solution cost:', self.solution_cost )
+                    
+                    if time_budget is None:
+                        break
+                
+            # Stop criteria
+            if time_budget is not None and time.time() - start > time_budget :
+                break
+            
+            # Tree pruning, the path of the best solution is kept
+            if len( self.tree ) >= self.max_nodes :
+                
+                no_nodes = 0
+                
+                if self.solution_cost < np.inf:
+                    self.goal_node     = self.limit_tree_size( self.goal_node )
+                    self.solution_cost = self.tree.cost[ self.goal_node ]
+                else:
+                    self.limit_tree_size()
+            
+        if self.solution_cost == np.inf:
+            
+            warnings.warn('RRT* did not find a path to the goal within the'
+                          ' time budget of ' + str( time_budget ) + ' s' , 
+                          RuntimeWarning )
+            return
+            
+        print('\n-----------------------------------------------',
+              '\nRRT* found a path to the goal, cost = ', self.solution_cost ,
+              '\n-----------------------------------------------')
+        
+        # Compute Path
+        self.compute_path_to_goal()
+        
+        # Plot
+        if self.dyna_plot:
+            self.dyna_plot_solution()
+
+
+
+###############################################################################
+class BidirectionalRRT( RRT ):
+    """ 
+    Bidirectional RRT search
+    ------------------------------------------------------------
+    A forward tree is grown from x_start and a backward tree from x_goal by
+    integrating the dynamic in reverse time ( negative dt ). After each 
+    extension, the other tree is greedily extended toward the new node, the
+    trees are connected when two nodes are closer than goal_radius. The 
+    trees swap roles at each iteration.
+    
+    """
+    
+    ############################
+    def __init__(self, sys , x_start ):
+        
+        RRT.__init__( self , sys , x_start )
+        
+        # Params
+        self.connect_steps = 10  # max greedy extensions for a connection
+        
+        
+    ############################
+    def swap_trees(self):
+        """ Exchange the active tree, the backward tree uses a negative dt """
+        
+        self.tree     , self.tree_b     = self.tree_b     , self.tree
+        self.nn_index , self.nn_index_b = self.nn_index_b , self.nn_index
+        
+        self.dt      = - self.dt
+        self.forward = not self.forward
+        
+        
+    ############################
+    def reset_backward_tree(self):
+        """ Backward tree with only the goal node """
+        
+        self.tree_b     = Tree( self.sys.n , self.sys.m )
+        self.nn_index_b = KDTreeIndex( self.sys.n , self.nn_index.weights )
+        
+        self.nn_index_b.add( self.x_goal , 0 )
+        self.tree_b.add( self.x_goal , np.zeros( self.sys.m ) , 0 , -1 )
+        
+        
+    ############################
+    def rebuild_backward_index(self):
+        """ Spatial index of all nodes of the backward tree """
+        
+        self.nn_index_b = KDTreeIndex( self.sys.n , self.nn_index.weights )
+        self.nn_index_b.reset( max( self.tree_b.count , 1024 ) )
+        
+        for i in range( self.tree_b.count ):
+            self.nn_index_b.add( self.tree_b.x[ i ] , self.tree_b.t[ i ] )
+        
+        
+    ############################
+    def extend(self, x_target ):
+        """ Extend the active tree toward x_target, return new node index """
+        
+        i_near = self.nearest_neighbor( x_target )
+        
+        if i_near is None:
+            return None
+        
+        new_node = self.select_control_input( x_target , i_near )
+        
+        if new_node is None:
+            return None
+        
+        x_next , u , t_next = new_node
+        
+        return self.add_node( x_next , u , t_next , i_near )
+    
+    
+    ############################
+    def connect(self, x_target ):
+        """ 
+        Greedy extension of the active tree toward x_target
+        
+        return index of the node closer than goal_radius, None if failed
+        
+        """
+        
+        self.randomized_input = False
+        
+        i = self.nearest_neighbor( x_target )
+        
+        if i is None:
+            return None
+        
+        d = np.linalg.norm( self.tree.x[ i ] - x_target )
+        
+        for k in range( self.connect_steps + 1 ):
+            
+            if d < self.goal_radius:
+                return i
+            
+            if k == self.connect_steps:
+                break
+            
+            i_new = self.extend( x_target )
+            
+            if i_new is None:
+                break
+            
+            d_new = np.linalg.norm( self.tree.x[ i_new ] - x_target )
+            
+            # No progress
+            if d_new >= d:
+                break
+            
+            i , d = i_new , d_new
+            
+        return None
+    
+    
+    ############################
+    def find_path_to_goal(self, x_goal ):
+        """ """
+        
+        self.x_goal  = x_goal
+        self.forward = True
+        
+        self.check_tree_root()
+        self.reset_backward_tree()
+        
+        succes   = False
+        no_nodes = 0
+        
+        # Plot
+        if self.dyna_plot:
+            self.dyna_plot_init()
+        
+        while not succes:
+            
+            # Exploration:
+            if np.random.rand() > self.alpha :
+                # Try to converge to the root of the other tree
+                x_random = self.tree_b.x[ 0 ]
+                self.randomized_input = False
+            else:
+                # Random exploration
+                x_random  = self.rand_state()
+                self.randomized_input = ( np.random.rand() < self.beta )
+                
+            i_new = self.extend( x_random )
+            
+            if i_new is not None:
+                
+                no_nodes = no_nodes + 1
+                
+                # Plot
+                if self.dyna_plot:
+                    self.dyna_plot_add_node( i_new , no_nodes )
+                
+                x_new = self.tree.x[ i_new ]
+                
+                # Try to connect the other tree to the new node
+                self.swap_trees()
+                
+                i_other = self.connect( x_new )
+                
+                if i_other is not None:
+                    
+                    succes = True
+                    
+                    # Connection nodes in the forward and backward trees
+                    if self.forward:
+                        self.goal_node , self.goal_node_b = i_other , i_new
+                    else:
+                        self.goal_node , self.goal_node_b = i_new , i_other
+                        
+                    if not self.forward:
+                        self.swap_trees()
+                        
+            # Tree pruning, each tree is kept below half of max_nodes
+            if len( self.tree ) + len( self.tree_b ) >= self.max_nodes and not succes:
+                
+                no_nodes = 0
+                
+                if not self.forward:
+                    self.swap_trees()
+                
+                self.limit_tree_size( max_nodes = self.max_nodes // 2 )
+                
+                self.swap_trees()
+                self.limit_tree_size( max_nodes = self.max_nodes // 2 )
+                self.swap_trees()
+        
+        print('\n-----------------------------------------------',
+              '\nRRT found a path to the goal',
+              '\n-----------------------------------------------')
+        
+        # Compute Path
+        self.compute_path_to_goal()
+        
+        # Plot
+        if self.dyna_plot:
+            self.dyna_plot_solution()
+            
+            
+    ############################
+    def compute_path_to_goal(self):
+        """ Trajectory from the start through both trees to the goal """
+        
+        duration = self.dt * self.steps
+        
+        # Forward tree: states of parents, inputs used to reach the child
+        path = self.tree.path( self.goal_node )
+        
+        self.path_node_list = path[1:]
+        
+        x_f = self.tree.x[ path[:-1] ]
+        u_f = self.tree.u[ path[1:]  ]
+        t_f = self.tree.t[ path[:-1] ]
+        
+        # Backward tree: from the connection node to the goal, each node 
+        # reach its parent in forward time with its input
+        path_b = self.tree_b.path( self.goal_node_b )[::-1]
+        
+        x_b = self.tree_b.x[ path_b[:-1] ]
+        u_b = self.tree_b.u[ path_b[:-1] ]
+        t_b = self.tree.t[ self.goal_node ] + duration * np.arange( path_b.size - 1 )
+        
+        x = np.concatenate( [ x_f , x_b ] )
+        u = np.concatenate( [ u_f , u_b ] )
+        t = np.concatenate( [ t_f , t_b ] )
+        
+        dx = self.sys.f_batch( x , u , t ) # state derivative
+        
+        # Save plan
+        self.trajectory = plan.Trajectory( x , u , t , dx )
+        
+        # Create open-loop controller
+        self.open_loop_controller = plan.OpenLoopController( self.trajectory )
+        
+        #
+        self.solution_is_found = True
+        
+        
+    ############################
+    def plot_tree(self):
+        """ Forward tree, solution and backward tree ( black ) """
+        
+        ax = RRT.plot_tree( self )
+        
+        x = self.tree_b.x
+        
+        child , parent = self.tree_b.edges()
+        
+        ax.plot( 
+        np.vstack([ x[ child , self.x_axis ] , x[ parent , self.x_axis ] ]) , 
+        np.vstack([ x[ child , self.y_axis ] , x[ parent , self.y_axis ] ]) , 'k.-')
+        
+        return ax
+
+
+
+###############################################################################
+def seed_search( planner , x_goal , seed , time_budget = None ):
+    """ Search with one random seed, return the solution data """
+    
+    np.random.seed( seed )
+    
+    # Anytime planners use the time budget
+    if isinstance( planner , RRTStar ):
+        planner.find_path_to_goal( x_goal , time_budget )
+    else:
+        planner.find_path_to_goal( x_goal )
+    
+    keys   = [ 'tree' , 'tree_b' , 'goal_node' , 'goal_node_b' , 
+               'path_node_list' , 'trajectory' , 'solution_cost' ]
+    result = { key : planner.__dict__[ key ] for key in keys if key in planner.__dict__ }
+    
+    return result
+    
+    
+###############################################################################
+def seed_worker( planner , x_goal , seed , index , queue , time_budget = None ):
+    """ Worker process: search with one random seed, put result in queue """
+    
+    planner.dyna_plot = False
+    
+    result = seed_search( planner , x_goal , seed , time_budget )
+    
+    # Solution data sent back to the parent process
+    queue.put( ( index , planner.solution_is_found , result ) )
+    
+    
+###############################################################################
+def solution_score( result ):
+    """ Cost of a solution: RRT* cost, else duration of the trajectory """
+    
+    if 'solution_cost' in result:
+        return result['solution_cost']
+    
+    return result['trajectory'].time_final
+    
+    
+###############################################################################
+def parallel_find_path_to_goal( planner , x_goal , workers = None , seed = 0 , 
+                                deadline = None ):
+    """ 
+    Independent searches with different random seeds in worker processes
+    ---------------------------------------------------------------------
+    planner  : configured RRT planner ( any variant )
+    workers  : number of processes ( default: number of cores )
+    seed     : master seed, the seed of each worker is derived from it
+    deadline : None = first solution found, others are cancelled, if 
+                      several workers have finished, the lowest worker 
+                      index wins
+               T    = best solution ( lowest RRT* cost, else shortest 
+                      duration ) found within T sec, ties go to the lowest
+                      worker index. RRT* workers search in anytime mode 
+                      with a time budget of deadline_ratio * T
+    
+    Without fork support or with a single worker, the search of worker 0 
+    is done in this process.
+    
+    The solution is loaded in planner, return index of the winning worker
+    ( None if no solution )
+    
+    """
+    
+    if workers is None:
+        workers = os.cpu_count()
+    
+    # Reproducible independent seeds
+    seeds = np.random.SeedSequence( seed ).generate_state( workers )
+    
+    # Part of the deadline left to send the trees back
+    deadline_ratio = 0.8
+    
+    if deadline is None:
+        time_budget = None
+    else:
+        time_budget = deadline_ratio * deadline
+    
+    # Serial fallback
+    if not ( 'fork' in multiprocessing.get_all_start_methods() and workers > 1 ):
+        
+        result = seed_search( planner , x_goal , int( seeds[0] ) , time_budget )
+        
+        if not planner.solution_is_found:
+            print('\nParallel RRT: no solution found')
+            return None
+        
+        print('\nParallel RRT: solution of worker 0 ( serial search )')
+        
+        return 0
+    
+    context = multiprocessing.get_context('fork')
+    queue   = context.Queue()
+    
+    processes = []
+    
+    for i in range( workers ):
+        
+        process = context.Process( target = seed_worker , 
+                                   args = ( planner , x_goal , int( seeds[i] ) , 
+                                            i , queue , time_budget ) )
+        process.daemon = True
+        process.start()
+        
+        processes.append( process )
+        
+    start     = time.time()
+    results   = []
+    remaining = workers
+    
+    try:
+        
+        while remaining > 0:
+            
+            if deadline is None:
+                timeout = None
+            else:
+                timeout = deadline - ( time.time() - start )
+                if timeout <= 0:
+                    break
+                
+            try:
+                index , found , result = queue.get( timeout = timeout )
+            except queue_module.Empty:
+                break
+            
+            remaining = remaining - 1
+            
+            if found:
+                results.append( ( solution_score( result ) , index , result ) )
+                
+                # First solution mode
+                if deadline is None:
+                    break
+        
+        # First solution mode: other workers that have already finished
+        while deadline is None and remaining > 0:
+            
+            try:
+                index , found , result = queue.get_nowait()
+            except queue_module.Empty:
+                break
+            
+            remaining = remaining - 1
+            
+            if found:
+                results.append( ( solution_score( result ) , index , result ) )
+                
+    finally:
+        
+        # Cancel all remaining searches
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+            
+    if not results:
+        print('\nParallel RRT: no solution found')
+        return None
+    
+    if deadline is None:
+        score , index , result = min( results , key = lambda r : r[1] )
+    else:
+        score , index , result = min( results , key = lambda r : ( r[0] , r[1] ) )
+    
+    # Load the solution in the planner
+    planner.x_goal = x_goal
+    planner.__dict__.update( result )
+    planner.open_loop_controller = plan.OpenLoopController( planner.trajectory )
+    planner.solution_is_found    = True
+    
+    # Rebuild the spatial indexes of the trees
+    planner.rebuild_index()
+    
+    if isinstance( planner , BidirectionalRRT ):
+        planner.rebuild_backward_index()
+    
+    print('\nParallel RRT: solution of worker', index ,
+          ' ( cost =', score , ')')
+    
+    return index
+
+
+
 '''
 #################################################################
 ##################          Main                         ########
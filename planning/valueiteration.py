@@ -7,9 +7,6 @@ Created on Wed Jul 12 12:09:37 2017
 
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy.interpolate import RectBivariateSpline as interpol2D
-from scipy.interpolate import griddata
-from scipy.interpolate import LinearNDInterpolator
 
 from pyro.control import controller
 
@@ -60,10 +57,19 @@ class ViController( controller.StaticController ) :
         
         return u
     
+    #############################
+    def c_batch( self , Y , R , t = 0 ):
+        """  Vectorized state feedback, vi_law of N states at once """
+        
+        X = np.atleast_2d( Y )
+        U = self.vi_law( X )
+        
+        return np.broadcast_to( U , ( X.shape[0] , self.m ) ).copy()
+    
     
 
-class ValueIteration_2D:
-    """ Dynamic programming for 2D continous dynamic system, one continuous input u """
+class ValueIterationND:
+    """ Dynamic programming for n-D continous dynamic system, m continuous inputs u """
     
     ############################
     def __init__(self, grid_sys , cost_function ):
@@ -78,24 +84,34 @@ class ValueIteration_2D:
         # Cost function
         self.cf  = cost_function
         
+        # Discount factor
+        self.gamma = 1.0
+        
         # Print params
         self.fontsize = 10
         
         
         # Options
         self.uselookuptable = True
+        self.usesparsematrices = True # if available in grid_sys
+        self.verbose        = True
+        
+        # Convergence
+        self.residual_history = np.zeros(0)
+        self.converged        = False
         
         
     ##############################
     def initialize(self):
         """ initialize cost-to-go and policy """
+        
+        self.griddim       = tuple( self.grid_sys.xgriddim[:self.sys.n] )
 
-        self.J             = np.zeros( self.grid_sys.xgriddim , dtype = float )
-        self.action_policy = np.zeros( self.grid_sys.xgriddim , dtype = int   )
-
-        self.Jnew          = self.J.copy()
-        self.Jplot         = self.J.copy()
-
+        self.J             = np.zeros( self.griddim , dtype = float )
+        self.action_policy = np.zeros( self.griddim , dtype = int   )
+        
+        J_1D = self.J.reshape( -1 ) # view on nodes
+        
         # Initial evaluation
         
         # For all state nodes        
@@ -103,142 +119,307 @@ class ValueIteration_2D:
             
                 x = self.grid_sys.nodes_state[ node , : ]
                 
-                i = self.grid_sys.nodes_index[ node , 0 ]
-                j = self.grid_sys.nodes_index[ node , 1 ]
-                
                 # Final Cost
-                self.J[i,j] = self.cf.h( x )
-                        
+                J_1D[node] = self.cf.h( x )
                 
+        self.Jnew          = self.J.copy()
+        self.Jplot         = self.J.copy()
+        
+        self.residual_history = np.zeros(0)
+        self.converged        = False
+        
+        if self.sparse_transitions_available():
+            self.compute_stage_costs()
+                
+                
+    ##############################
+    def sparse_transitions_available(self):
+        """ check if precomputed transition matrices can be used """
+        
+        return ( self.usesparsematrices and self.uselookuptable and
+                 self.grid_sys.transition_matrices is not None )
+    
+    
+    ##############################
+    def compute_stage_costs(self):
+        """ Lookup table of one step costs for all node-action pairs """
+        
+        X = np.repeat( self.grid_sys.nodes_state , self.grid_sys.actions_n , axis = 0 )
+        U = np.tile( self.grid_sys.actions_input , ( self.grid_sys.nodes_n , 1 ) )
+        
+        self.G = self.cf.g_batch( X , U ).reshape( self.grid_sys.nodes_n , self.grid_sys.actions_n )
+        
+        
     ###############################
-    def compute_step(self):
-        """ One step of value iteration """
+    def compute_sparse_Q(self, J_1D ):
+        """ Q values of all node-action pairs with precomputed transition matrices """
         
-        # Get interpolation of current cost space
-        J_interpol = interpol2D( self.grid_sys.xd[0] , self.grid_sys.xd[1] , self.J , bbox=[None, None, None, None], kx=1, ky=1,)
+        # Q values, not allowable states or inputs/states combinations are INF
+        Q = np.full( ( self.grid_sys.nodes_n , self.grid_sys.actions_n ) , self.cf.INF , dtype = float )
         
-        # For all state nodes        
-        for node in range( self.grid_sys.nodes_n ):  
+        # For all control actions
+        for action in range( self.grid_sys.actions_n ):
             
-                x = self.grid_sys.nodes_state[ node , : ]
+            isok   = self.grid_sys.action_isok[ : , action ]
+            J_next = self.grid_sys.transition_matrices[ action ].dot( J_1D )
+            
+            Q[ isok , action ] = self.G[ isok , action ] + self.gamma * J_next[ isok ]
+            
+        return Q
+        
+        
+    ###############################
+    def compute_sparse_backup(self, J_1D ):
+        """ Bellman backup of all nodes with precomputed transition matrices """
+        
+        Q = self.compute_sparse_Q( J_1D )
+        
+        # Best action for all state nodes
+        J_min  = Q.min( axis = 1 )
+        policy = Q.argmin( axis = 1 )
+        
+        # Impossible situation ( unaceptable situation for any control actions )
+        policy[ J_min > (self.cf.INF-1) ] = -1
+        
+        return J_min , policy
                 
-                i = self.grid_sys.nodes_index[ node , 0 ]
-                j = self.grid_sys.nodes_index[ node , 1 ]
-
-                # One steps costs - Q values
-                Q = np.zeros( self.grid_sys.actions_n  ) 
                 
-                # For all control actions
-                for action in range( self.grid_sys.actions_n ):
-                    
-                    u = self.grid_sys.actions_input[ action , : ]
-                    
-                    # Compute next state and validity of the action                    
+    ###############################
+    def compute_backup(self, nodes , J_1D ):
+        """ 
+        Bellman backup for a slice of nodes given the cost-to-go J_1D
+        --------------------------------------------------------------
+        return best cost-to-go and action for each node of the slice
+        
+        """
+        
+        x = self.grid_sys.nodes_state[ nodes , : ]
+        
+        nodes_n   = x.shape[0]
+        actions_n = self.grid_sys.actions_n
+        
+        # Precomputed stencils and costs
+        if self.sparse_transitions_available():
+            
+            action_isok = self.grid_sys.action_isok[ nodes ]
+            stencil     = self.grid_sys.x_next_stencil[ nodes ]
+            weights     = self.grid_sys.x_next_weights[ nodes ]
+            
+            Q = self.G[ nodes ] + self.gamma * np.sum( J_1D[ stencil ] * weights , axis = 2 )
+            
+            Q[ ~action_isok ] = self.cf.INF
+            
+            J_min  = Q.min( axis = 1 )
+            policy = Q.argmin( axis = 1 )
+            
+            policy[ J_min > (self.cf.INF-1) ] = -1
+            
+            return J_min , policy
+        
+        # Next states and validity of all node-action pairs
+        if self.uselookuptable and self.grid_sys.uselookuptable:
+            
+            x_next        = self.grid_sys.x_next[ nodes ]
+            action_isok   = self.grid_sys.action_isok[ nodes ]
+            
+        else:
+            
+            x_next , action_isok = self.grid_sys.compute_transitions( x )
+        
+        # One steps costs of all node-action pairs
+        X = np.repeat( x , actions_n , axis = 0 )
+        U = np.tile( self.grid_sys.actions_input , ( nodes_n , 1 ) )
+        G = self.cf.g_batch( X , U ).reshape( nodes_n , actions_n )
+        
+        # Q values, not allowable states or inputs/states combinations are INF
+        Q = np.full( ( nodes_n , actions_n ) , self.cf.INF , dtype = float )
+        
+        # Cost-to-go of allowable actions by multilinear interpolation
+        stencil , weights = self.grid_sys.compute_interpolation_stencil( x_next[ action_isok ] )
+        
+        J_next = np.sum( J_1D[ stencil ] * weights , axis = 1 )
+        
+        Q[ action_isok ] = G[ action_isok ] + self.gamma * J_next
+        
+        # Best action for all state nodes
+        J_min  = Q.min( axis = 1 )
+        policy = Q.argmin( axis = 1 )
+        
+        # Impossible situation ( unaceptable situation for any control actions )
+        policy[ J_min > (self.cf.INF-1) ] = -1
+        
+        return J_min , policy
+    
+    
+    ###############################
+    def compute_sweep(self, gauss_seidel = False ):
+        """ 
+        Bellman backup of all nodes, result in Jnew and action_policy
+        --------------------------------------------------------------
+        gauss_seidel : if True, block Gauss-Seidel variant: J is updated 
+                       in-place after each chunk of nodes ( one slice of 
+                       the first state dimension by default ), nodes 
+                       within a chunk are still backed up from the same J
+        
+        Note: the block variant does not converge in noticeably fewer 
+        sweeps than the Jacobi sweep on the grids tested and is slower 
+        per sweep ( no sparse transitions, smaller chunks ), use it 
+        mainly to limit memory or for comparison.
+        
+        """
+        
+        J_1D      = self.J.reshape( -1 )
+        Jnew_1D   = self.Jnew.reshape( -1 )
+        policy_1D = self.action_policy.reshape( -1 )
+        
+        if self.sparse_transitions_available() and not gauss_seidel:
+            
+            Jnew_1D[:] , policy_1D[:] = self.compute_sparse_backup( J_1D )
+            
+        else:
+        
+            # Bounded number of nodes evaluated at once
+            if self.grid_sys.chunksize is not None:
+                chunksize = self.grid_sys.chunksize
+            elif gauss_seidel:
+                chunksize = self.grid_sys.nodes_n // self.grid_sys.xgriddim[0]
+            else:
+                chunksize = self.grid_sys.nodes_n
+            
+            # For all chunk of state nodes
+            for first in range( 0 , self.grid_sys.nodes_n , chunksize ):
+                
+                nodes = slice( first , min( first + chunksize , self.grid_sys.nodes_n ) )
+                
+                Jnew_1D[ nodes ] , policy_1D[ nodes ] = self.compute_backup( nodes , J_1D )
+                
+                # In-place update
+                if gauss_seidel:
+                    J_1D[ nodes ] = Jnew_1D[ nodes ]
                     
-                    if self.uselookuptable:
-                        
-                        x_next        = self.grid_sys.x_next[node,action,:]
-                        action_isok   = self.grid_sys.action_isok[node,action]
-                        
-                    else:
-                        
-                        x_next        = self.sys.f( x , u ) * self.dt + x
-                        x_ok          = self.sys.isavalidstate(x_next)
-                        u_ok          = self.sys.isavalidinput(x,u)
-                        action_isok   = ( u_ok & x_ok )
                     
-                    # If the current option is allowable
-                    if action_isok:
-                        
-                        J_next = J_interpol( x_next[0] , x_next[1] )
-                        
-                        # Cost-to-go of a given action
-                        Q[action] = self.cf.g( x , u ) + J_next[0,0]
-                        
-                    else:
-                        # Not allowable states or inputs/states combinations
-                        Q[action] = self.cf.INF
-                        
-                        
-                self.Jnew[i,j]          = Q.min()
-                self.action_policy[i,j] = Q.argmin()
-                
-                # Impossible situation ( unaceptable situation for any control actions )
-                if self.Jnew[i,j] > (self.cf.INF-1) :
-                    self.action_policy[i,j]      = -1
+    ###############################
+    def compute_step(self, gauss_seidel = False ):
+        """ 
+        One step of value iteration
+        ----------------------------
+        gauss_seidel : if True, block Gauss-Seidel sweep, see compute_sweep
+        
+        return residual : max change of J on nodes with finite cost
+        
+        """
+        
+        J_old     = self.J.copy()
         
+        self.compute_sweep( gauss_seidel )
         
-        # Convergence check        
-        delta = self.J - self.Jnew
-        j_max     = self.Jnew.max()
-        delta_max = delta.max()
-        delta_min = delta.min()
-        print('Max:',j_max,'Delta max:',delta_max, 'Delta min:',delta_min)
+        residual = self.compute_residual( J_old , self.Jnew )
         
         self.J = self.Jnew.copy()
         
-
+        return residual
+    
+    
+    ###############################
+    def compute_residual(self, J_old , J_new ):
+        """ 
+        Convergence check: max change of J on nodes with finite cost,
+        appended to residual_history
+        
+        """
+        
+        delta = J_old - J_new
+        
+        # Nodes with infinite cost for both iterations are not considered
+        finite = ~( ( J_old > (self.cf.INF-1) ) & ( J_new > (self.cf.INF-1) ) )
+        
+        if finite.any():
+            residual = np.abs( delta[ finite ] ).max()
+        else:
+            residual = 0.
+            
+        self.residual_history = np.append( self.residual_history , residual )
+        
+        if self.verbose:
+            j_max     = J_new.max()
+            delta_max = delta.max()
+            delta_min = delta.min()
+            print('Max:',j_max,'Delta max:',delta_max, 'Delta min:',delta_min)
+        
+        return residual
+    
+    
     ################################
-    def assign_interpol_controller(self):
-        """ controller from optimal actions """
+    def solve(self, tol = 1E-3 , max_iter = 1000 , gauss_seidel = False ):
+        """ 
+        Value iteration until convergence
+        ----------------------------------
+        tol          : stop when the sup-norm residual is below tol
+        max_iter     : maximum number of steps
+        gauss_seidel : block Gauss-Seidel sweeps, see compute_sweep
         
-        # Compute grid of u
-        self.u_policy_grid    = []
+        return residual history
         
-        # for all inputs
-        for k in range(self.sys.m):
-            self.u_policy_grid.append( np.zeros( self.grid_sys.xgriddim , dtype = float ) )
+        """
         
-        # For all state nodes        
-        for node in range( self.grid_sys.nodes_n ):  
+        self.converged = False
+        
+        for i in range( max_iter ):
             
-                i = self.grid_sys.nodes_index[ node , 0 ]
-                j = self.grid_sys.nodes_index[ node , 1 ]
-                
-                # If no action is good
-                if ( self.action_policy[i,j] == -1 ):
-                    
-                    # for all inputs
-                    for k in range(self.sys.m):
-                        self.u_policy_grid[k][i,j] = 0 
-                    
-                else:
-                    # for all inputs
-                    for k in range(self.sys.m):
-                        self.u_policy_grid[k][i,j] = self.grid_sys.actions_input[ self.action_policy[i,j] , k ]
+            residual = self.compute_step( gauss_seidel )
+            
+            if residual < tol:
+                self.converged = True
+                break
+            
+        print('\nValue iteration:\n---------------------------------')
+        print('Converged:', self.converged , ' Steps:', i + 1 , ' Residual:', residual )
+        
+        return self.residual_history
         
 
-        # Compute Interpol function
-        self.x2u_interpol_functions = []
+    ################################
+    def assign_interpol_controller(self):
+        """ controller from optimal actions """
+        
+        policy_1D = self.action_policy.reshape( -1 )
+        
+        # Inputs of the optimal actions, zero if no action is good
+        self.u_policy_1D = self.grid_sys.actions_input[ policy_1D , : ]
+        self.u_policy_1D[ policy_1D == -1 , : ] = 0
+        
+        # Compute grid of u
+        self.u_policy_grid    = []
         
         # for all inputs
         for k in range(self.sys.m):
-            self.x2u_interpol_functions.append(
-                    interpol2D( self.grid_sys.xd[0] , 
-                                self.grid_sys.xd[1] , 
-                                self.u_policy_grid[k] , 
-                                bbox=[None, None, None, None], 
-                                kx=1, ky=1,) )
+            self.u_policy_grid.append( self.u_policy_1D[:,k].reshape( self.action_policy.shape ) )
         
         # Asign Controller
         self.ctl.vi_law = self.vi_law
         
         
-        
     ################################
     def vi_law(self, x , t = 0 ):
-        """ controller from optimal actions """
+        """ 
+        controller from optimal actions
+        --------------------------------
+        x : state vector n x 1 or array of states N x n
         
-        u = np.zeros( self.sys.m )
+        all m inputs are given by one multilinear interpolation
         
-        # for all inputs
-        for k in range(self.sys.m):
-            u[k] = self.x2u_interpol_functions[k]( x[0] , x[1] )
+        """
+        
+        stencil , weights = self.grid_sys.compute_interpolation_stencil( x )
+        
+        u = np.einsum( 'ij,ijk->ik' , weights , self.u_policy_1D[ stencil ] )
+        
+        if np.ndim( x ) == 1:
+            u = u[0]
         
         return u
     
     
-    
     ################################
     def compute_steps(self, l = 50, plot = False):
         """ compute number of step """
@@ -248,23 +429,35 @@ class ValueIteration_2D:
             self.compute_step()
             
             
+    ################################
+    def grid_slice(self, grid , i = 0 , j = 1 , index = None ):
+        """ 2D slice along state axes i and j, others axes at index """
+        
+        # Default is the middle of the grid
+        if index is None:
+            index = [ d // 2 for d in grid.shape ]
+        
+        sl = [ index[k] for k in range( grid.ndim ) ]
+        sl[i] = slice(None)
+        sl[j] = slice(None)
+        
+        grid_slice = grid[ tuple( sl ) ]
+        
+        if i > j:
+            grid_slice = grid_slice.T
+        
+        return grid_slice
+    
                 
     ################################
-    def plot_cost2go(self, maxJ = 1000 ):
+    def plot_cost2go(self, maxJ = 1000 , i = 0 , j = 1 , index = None ):
         """ print graphic """
         
-        xname = self.sys.state_label[0] + ' ' + self.sys.state_units[0]
-        yname = self.sys.state_label[1] + ' ' + self.sys.state_units[1]
-        
-        self.Jplot = self.J.copy()
+        xname = self.sys.state_label[i] + ' ' + self.sys.state_units[i]
+        yname = self.sys.state_label[j] + ' ' + self.sys.state_units[j]
         
         ## Saturation function for cost
-        for i in range(self.grid_sys.xgriddim[0]):
-            for j in range(self.grid_sys.xgriddim[1]):
-                if self.J[i,j] >= maxJ :
-                    self.Jplot[i,j] = maxJ
-                else:
-                    self.Jplot[i,j] = self.J[i,j]
+        self.Jplot = np.minimum( self.grid_slice( self.J , i , j , index ) , maxJ )
         
         self.fig1 = plt.figure(figsize=(4, 4),dpi=300, frameon=True)
         self.fig1.canvas.set_window_title('Cost-to-go')
@@ -272,15 +465,15 @@ class ValueIteration_2D:
         
         plt.ylabel(yname, fontsize = self.fontsize)
         plt.xlabel(xname, fontsize = self.fontsize)
-        self.im1 = plt.pcolormesh( self.grid_sys.xd[0] ,
-                                   self.grid_sys.xd[1] , 
+        self.im1 = plt.pcolormesh( self.grid_sys.xd[i] ,
+                                   self.grid_sys.xd[j] , 
                                    self.Jplot.T,
                                    shading='gouraud')
         
-        plt.axis([self.sys.x_lb[0],
-                  self.sys.x_ub[0],
-                  self.sys.x_lb[1], 
-                  self.sys.x_ub[1]])
+        plt.axis([self.sys.x_lb[i],
+                  self.sys.x_ub[i],
+                  self.sys.x_lb[j], 
+                  self.sys.x_ub[j]])
     
         plt.colorbar()
         plt.grid(True)
@@ -288,35 +481,82 @@ class ValueIteration_2D:
         
     
     ################################
-    def plot_policy(self, i = 0 ):
+    def plot_policy(self, k = 0 , i = 0 , j = 1 , index = None ):
         """ print graphic """
         
-        xname = self.sys.state_label[0] + ' ' + self.sys.state_units[0]
-        yname = self.sys.state_label[1] + ' ' + self.sys.state_units[1]
+        xname = self.sys.state_label[i] + ' ' + self.sys.state_units[i]
+        yname = self.sys.state_label[j] + ' ' + self.sys.state_units[j]
         
-        policy_plot = self.u_policy_grid[i].copy()
+        policy_plot = self.grid_slice( self.u_policy_grid[k] , i , j , index ).copy()
                 
         self.fig1 = plt.figure(figsize=(4, 4),dpi=300, frameon=True)
-        self.fig1.canvas.set_window_title('Policy for u[%i]'%i)
+        self.fig1.canvas.set_window_title('Policy for u[%i]'%k)
         self.ax1  = self.fig1.add_subplot(1,1,1)
         
         plt.ylabel(yname, fontsize = self.fontsize )
         plt.xlabel(xname, fontsize = self.fontsize )
-        self.im1 = plt.pcolormesh( self.grid_sys.xd[0] , 
-                                   self.grid_sys.xd[1] , 
+        self.im1 = plt.pcolormesh( self.grid_sys.xd[i] , 
+                                   self.grid_sys.xd[j] , 
                                    policy_plot.T,
                                    shading='gouraud')
         
-        plt.axis([self.sys.x_lb[0], 
-                  self.sys.x_ub[0], 
-                  self.sys.x_lb[1], 
-                  self.sys.x_ub[1]])
+        plt.axis([self.sys.x_lb[i], 
+                  self.sys.x_ub[i], 
+                  self.sys.x_lb[j], 
+                  self.sys.x_ub[j]])
     
         plt.colorbar()
         plt.grid(True)
         plt.tight_layout() 
         
         
+    ################################
+    def prolong_cost2go(self, vi_coarse ):
+        """ 
+        Initialize J by interpolation of the cost-to-go of another grid
+        ----------------------------------------------------------------
+        Only corners with finite cost are used, nodes surrounded by
+        infinite cost nodes are INF.
+        
+        Nodes with a zero cost action ( e.g. goal nodes of a time cost )
+        keep their final cost instead of the interpolated value: their 
+        backup is J = 0 + J( next ) with a next state near the node itself,
+        so an interpolated over-estimate would be a fixed point that never
+        decreases ( undiscounted problems converge to a wrong cost-to-go ).
+        
+        """
+        
+        J_coarse = vi_coarse.J.reshape( -1 )
+        
+        stencil , weights = vi_coarse.grid_sys.compute_interpolation_stencil( self.grid_sys.nodes_state )
+        
+        finite  = J_coarse[ stencil ] < (self.cf.INF-1)
+        weights = weights * finite
+        total   = weights.sum( axis = 1 )
+        
+        J_1D = np.full( self.grid_sys.nodes_n , self.cf.INF , dtype = float )
+        
+        ok = total > 0
+        
+        J_1D[ ok ] = np.sum( J_coarse[ stencil[ ok ] ] * weights[ ok ] , axis = 1 ) / total[ ok ]
+        
+        # Potential terminal nodes
+        if self.sparse_transitions_available():
+            G = self.G
+        else:
+            X = np.repeat( self.grid_sys.nodes_state , self.grid_sys.actions_n , axis = 0 )
+            U = np.tile( self.grid_sys.actions_input , ( self.grid_sys.nodes_n , 1 ) )
+            G = self.cf.g_batch( X , U ).reshape( self.grid_sys.nodes_n , self.grid_sys.actions_n )
+            
+        # Zero cost actions: final cost kept, see docstring
+        terminal = np.any( G == 0 , axis = 1 )
+        
+        J_1D[ terminal ] = self.J.reshape( -1 )[ terminal ]
+        
+        self.J    = J_1D.reshape( self.griddim )
+        self.Jnew = self.J.copy()
+        
+        
     ################################
     def load_data(self, name = 'DP_data'):
         """ Save optimal controller policy and cost to go """
@@ -326,6 +566,8 @@ class ValueIteration_2D:
             self.J              = np.load( name + '_J'  + '.npy' )
             self.action_policy  = np.load( name + '_a'  + '.npy' ).astype(int)
             
+            self.Jnew           = self.J.copy()
+            
         except:
             
             print('Failed to load DP data ' )
@@ -346,187 +588,86 @@ class ValueIteration_2D:
 '''
 
 
-class ValueIteration_3D( ValueIteration_2D ):
-    """ Dynamic programming for 3D continous dynamic system, 2 continuous input u """
+def coarse_to_fine_solve( grid_sys , cost_function , schedule = ( 4 , 2 ) ,
+                          tol = 1E-3 , max_iter = 1000 , gauss_seidel = False ,
+                          gamma = 1.0 ):
+    """ 
+    Value iteration warm started from coarser grids
+    ------------------------------------------------
+    grid_sys : fine grid where the solution is needed
+    schedule : coarsening factors of the grid_sys nodes spacing, from the
+               coarsest to the finest intermediate grid
     
-    ############################
-    def __init__(self, grid_sys , cost_function ):
+    Each level is solved with value iteration, its cost-to-go is then
+    interpolated on the next finer grid as initial guess. Coarse nodes 
+    coincide with fine nodes only if factor divides ( d - 1 ) for all grid
+    dimensions d, otherwise the initial guess is interpolated between 
+    coarse nodes.
+    
+    return the ValueIterationND object solved on grid_sys
+    
+    """
+    
+    from pyro.planning import discretizer
+    
+    sys = grid_sys.sys
+    
+    vi_coarse = None
+    
+    for factor in schedule:
         
-        # Dynamic system
-        self.grid_sys = grid_sys        # Discretized Dynamic system class
-        self.sys      = grid_sys.sys     # Base Dynamic system class
+        # Coarse grid, nodes on fine grid nodes when factor divides d - 1
+        xgriddim = tuple( max( ( d - 1 ) // factor + 1 , 2 ) for d in grid_sys.xgriddim[:sys.n] )
         
-        # Controller
-        self.ctl = ViController( self.sys.n , self.sys.m , self.sys.n)
+        coarse_sys = discretizer.GridDynamicSystem( sys , xgriddim , grid_sys.ugriddim , grid_sys.dt )
         
-        # Cost function
-        self.cf  = cost_function
+        vi = ValueIterationND( coarse_sys , cost_function )
+        vi.gamma   = gamma
+        vi.verbose = False
+        vi.initialize()
         
-        # Options
-        self.uselookuptable = False
+        if vi_coarse is not None:
+            vi.prolong_cost2go( vi_coarse )
         
+        vi.solve( tol , max_iter , gauss_seidel )
         
-    ##############################
-    def initialize(self):
-        """ initialize cost-to-go and policy """
-
-        self.J             = np.zeros( self.grid_sys.xgriddim , dtype = float )
-        self.J_1D          = np.zeros( self.grid_sys.nodes_n  , dtype = float )
-        self.action_policy = np.zeros( self.grid_sys.xgriddim , dtype = int   )
-
-        self.Jnew          = self.J.copy()
-        self.J_1D_new      = self.J_1D.copy()
-        self.Jplot         = self.J.copy()
-
-        # Initial evaluation
+        vi_coarse = vi
         
-        # For all state nodes        
-        for node in range( self.grid_sys.nodes_n ):  
-            
-                x = self.grid_sys.nodes_state[ node , : ]
-                
-                i = self.grid_sys.nodes_index[ node , 0 ]
-                j = self.grid_sys.nodes_index[ node , 1 ]
-                k = self.grid_sys.nodes_index[ node , 2 ]
-                
-                # Final Cost
-                j               = self.cf.h( x )
-                self.J[i,j,k]   = j
-                self.J_1D[node] = j
-                        
-                
-    ###############################
-    def compute_step(self):
-        """ One step of value iteration """
+    # Fine grid
+    vi = ValueIterationND( grid_sys , cost_function )
+    vi.gamma = gamma
+    vi.initialize()
+    
+    if vi_coarse is not None:
+        vi.prolong_cost2go( vi_coarse )
+    
+    vi.solve( tol , max_iter , gauss_seidel )
+    
+    return vi
         
-        # Get interpolation of current cost space
-        #J_interpol = interpol2D( self.grid_sys.xd[0] , self.grid_sys.xd[1] , self.J , bbox=[None, None, None, None], kx=1, ky=1,)
         
-        cartcoord   = self.grid_sys.nodes_state
-        values      = self.J_1D
-        J_interpol  = LinearNDInterpolator(cartcoord, values, fill_value=0)
         
         
-        # For all state nodes        
-        for node in range( self.grid_sys.nodes_n ):  
-            
-                x = self.grid_sys.nodes_state[ node , : ]
-                
-                i = self.grid_sys.nodes_index[ node , 0 ]
-                j = self.grid_sys.nodes_index[ node , 1 ]
-                k = self.grid_sys.nodes_index[ node , 2 ]
+'''
+################################################################################
+'''
 
-                # One steps costs - Q values
-                Q = np.zeros( self.grid_sys.actions_n  ) 
-                
-                # For all control actions
-                for action in range( self.grid_sys.actions_n ):
-                    
-                    u = self.grid_sys.actions_input[ action , : ]
-                    
-                    # Compute next state and validity of the action                    
-                    x_next        = self.sys.f( x , u ) * self.grid_sys.dt + x
-                    x_ok          = self.sys.isavalidstate(x_next)
-                    u_ok          = self.sys.isavalidinput(x,u)
-                    action_isok   = ( u_ok & x_ok )
-                    
-                    # If the current option is allowable
-                    if action_isok:
-                        
-                        J_next = J_interpol( x_next )
-                        
-                        # Cost-to-go of a given action
-                        Q[action] = self.cf.g( x , u ) + J_next
-                        
-                    else:
-                        # Not allowable states or inputs/states combinations
-                        Q[action] = self.cf.INF
-                        
-                        
-                self.Jnew[i,j,k]          = Q.min()
-                self.J_1D_new[node]       = self.Jnew[i,j,k]
-                self.action_policy[i,j,k] = Q.argmin()
-                
-                # Impossible situation ( unaceptable situation for any control actions )
-                if self.Jnew[i,j,k] > (self.cf.INF-1) :
-                    self.action_policy[i,j,k]     = -1
-        
-        
-        # Convergence check        
-        delta = self.J - self.Jnew
-        j_max     = self.Jnew.max()
-        delta_max = delta.max()
-        delta_min = delta.min()
-        print('Max:',j_max,'Delta max:',delta_max, 'Delta min:',delta_min)
-        
-        self.J    = self.Jnew.copy()
-        self.J_1D = self.J_1D_new.copy()
 
-        
-    ################################
-    def assign_interpol_controller(self):
-        """ controller from optimal actions """
-        
-        # Compute grid of u
-        self.u_policy_grid    = []
-        self.u_policy_1D      = []
-        
-        # for all inputs
-        for k in range(self.sys.m):
-            self.u_policy_grid.append( np.zeros( self.grid_sys.xgriddim , dtype = float ) )
-            self.u_policy_1D.append( np.zeros( self.grid_sys.nodes_n , dtype = float ) )
-        
-        # For all state nodes        
-        for node in range( self.grid_sys.nodes_n ):
-            
-            i = self.grid_sys.nodes_index[ node , 0 ]
-            j = self.grid_sys.nodes_index[ node , 1 ]
-            k = self.grid_sys.nodes_index[ node , 2 ]
-            
-            # If no action is good
-            if ( self.action_policy[i,j,k] == -1 ):
-                
-                # for all inputs
-                for k in range(self.sys.m):
-                    self.u_policy_grid[k][i,j,k] = 0 
-                    self.u_policy_1D[k][node]    = 0
-                
-            else:
-                # for all inputs
-                for k in range(self.sys.m):
-                    self.u_policy_grid[k][i,j,k] = self.grid_sys.actions_input[ self.action_policy[i,j,k] , k ]
-                    self.u_policy_1D[k][node]    = self.grid_sys.actions_input[ self.action_policy[i,j,k] , k ]
-        
-        
-        # Compute Interpol function
-        self.x2u_interpol_functions = []
-        
-        cartcoord = self.grid_sys.nodes_state
-        
-        # for all inputs
-        for k in range(self.sys.m):
-            values  = self.u_policy_1D[k]
-            self.x2u_interpol_functions.append(
-                    LinearNDInterpolator(cartcoord, values, fill_value=0)
-                    )
-        
-        # Asign Controller
-        self.ctl.vi_law = self.vi_law
-        
+class ValueIteration_2D( ValueIterationND ):
+    """ Dynamic programming for 2D continous dynamic system, one continuous input u """
     
-    ################################
-    def vi_law(self, x , t = 0 ):
-        """ controller from optimal actions """
+    pass
         
-        u = np.zeros( self.sys.m )
         
-        # for all inputs
-        for k in range(self.sys.m):
-            u[k] = self.x2u_interpol_functions[k]( x )
-        
-        return u
         
         
+'''
+################################################################################
+'''
+
+
+class ValueIteration_3D( ValueIterationND ):
+    """ Dynamic programming for 3D continous dynamic system, 2 continuous input u """
     
     ################################
     def plot_cost2go(self, k = 0 ):
@@ -585,38 +726,3 @@ class ValueIteration_3D( ValueIteration_2D ):
         plt.grid(True)
         plt.tight_layout()
         
-    
-    ################################
-    def load_data(self, name = 'DP_data'):
-        """ Save optimal controller policy and cost to go """
-        
-        try:
-
-            self.J              = np.load( name + '_J'  + '.npy' )
-            self.action_policy  = np.load( name + '_a'  + '.npy' ).astype(int)
-            
-            self.J_1D          = np.zeros( self.grid_sys.nodes_n  , dtype = float )
-
-            self.Jnew          = self.J.copy()
-            self.J_1D_new      = self.J_1D.copy()
-            self.Jplot         = self.J.copy()
-            
-            # Create 1D J       
-            for node in range( self.grid_sys.nodes_n ):  
-                
-                    x = self.grid_sys.nodes_state[ node , : ]
-                    
-                    i = self.grid_sys.nodes_index[ node , 0 ]
-                    j = self.grid_sys.nodes_index[ node , 1 ]
-                    k = self.grid_sys.nodes_index[ node , 2 ]
-                    
-                    self.J_1D[node] = self.J[i,j,k]
-            
-        except:
-            
-            print('Failed to load DP data ' )
-        
-
-        
-        
-        
\ No newline at end of file
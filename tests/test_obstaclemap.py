@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the rasterized obstacle map
+"""
+
+import numpy as np
+
+from pyro.dynamic.obstaclemap import ObstacleMap, rasterize
+
+
+###############################################################################
+def test_rectangle_smaller_than_one_cell():
+
+    obstacle_map = ObstacleMap( [-10,-10] , [10,10] , resolution = 1.0 )
+
+    # Does not contain any cell center
+    obstacle_map.add_rectangle( (0.1,0.1) , (0.2,0.2) )
+
+    assert obstacle_map.occupancy.sum() == 1
+    assert not obstacle_map.isfree( np.array([0.15,0.15]) )
+    assert not obstacle_map.isfree( np.array([0.9,0.9]) )
+
+
+###############################################################################
+def test_polygon_smaller_than_one_cell():
+
+    obstacle_map = rasterize( [ [ (0.1,0.1) , (0.3,0.1) , (0.2,0.25) ] ] ,
+                              [-10,-10] , [10,10] , resolution = 1.0 )
+
+    assert obstacle_map.occupancy.sum() == 1
+    assert not obstacle_map.isfree( np.array([0.2,0.15]) )
+    assert obstacle_map.clearance_batch( np.array([[0.2,0.15]]) )[0] < 0
+
+
+###############################################################################
+def test_thin_polygon_occupies_all_crossed_cells():
+
+    obstacle_map = ObstacleMap( [-10,-10] , [10,10] , resolution = 1.0 )
+
+    # Sliver between cell centers, crossing 10 cells along x
+    obstacle_map.add_polygon( [ (-5,0.55) , (5,0.6) , (5,0.7) ] )
+
+    X = np.column_stack( [ np.linspace( -4.9 , 4.9 , 50 ) , np.full( 50 , 0.6 ) ] )
+
+    assert not obstacle_map.isfree_batch( X ).any()
+    assert obstacle_map.occupancy.sum() == 10
+
+
+###############################################################################
+def test_obstacle_on_grid_lines_is_not_inflated():
+
+    rectangle = ObstacleMap( [-10,-10] , [10,10] , resolution = 1.0 )
+    polygon   = ObstacleMap( [-10,-10] , [10,10] , resolution = 1.0 )
+
+    rectangle.add_rectangle( (2,2) , (4,10) )
+    polygon.add_polygon( [ (2,2) , (4,2) , (4,10) , (2,10) ] )
+
+    assert rectangle.occupancy.sum() == 2 * 8
+    assert ( rectangle.occupancy == polygon.occupancy ).all()
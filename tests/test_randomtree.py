@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the random tree planners
+"""
+
+import numpy as np
+import pytest
+
+from pyro.dynamic  import pendulum
+from pyro.planning import randomtree
+from pyro.analysis import costfunction
+
+
+###############################################################################
+def pendulum_rrt_star():
+    """ Swing-up of the pendulum minimizing the control effort """
+
+    sys = pendulum.SinglePendulum()
+
+    cf = costfunction.QuadraticCostFunction( sys )
+    cf.Q[:] = 0
+    cf.R[:] = 1.0
+
+    planner = randomtree.RRTStar( sys , np.array([0.1,0]) , cf )
+
+    planner.u_options = [ np.array([-5]) , np.array([-2]) , np.array([0]) ,
+                          np.array([ 2]) , np.array([ 5]) ]
+    planner.dyna_plot = False
+
+    return planner
+
+
+###############################################################################
+def test_rrt_star_cost_decreases_within_time_budget():
+
+    np.random.seed( 1 )
+
+    planner = pendulum_rrt_star()
+    planner.max_nodes = 1000
+
+    planner.find_path_to_goal( np.array([-3.14,0]) , time_budget = 5.0 )
+
+    costs = np.array( planner.solution_history )[:,1]
+
+    assert planner.solution_is_found
+    assert np.all( np.diff( costs ) < 0 )
+    assert costs[-1] < 0.8 * costs[0]
+
+    # Pruned tree and solution path stay consistent
+    assert len( planner.tree ) <= planner.max_nodes
+    assert planner.tree.cost[ planner.goal_node ] == costs[-1]
+
+
+###############################################################################
+def test_rrt_star_warns_without_solution():
+
+    np.random.seed( 0 )
+
+    planner = pendulum_rrt_star()
+    planner.max_solution_time = 0.5
+
+    with pytest.warns( RuntimeWarning ):
+        planner.find_path_to_goal( np.array([-3.14,0]) , time_budget = 0.5 )
+
+    assert not planner.solution_is_found